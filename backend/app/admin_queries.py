@@ -0,0 +1,107 @@
+from __future__ import annotations
+
+from fastapi import HTTPException
+from sqlalchemy import false, func, or_, select
+
+from .models import User
+from .signup_requests import SignupRequestRow
+
+# Query builders shared by the sync (main.py) and async (async_routes.py) admin
+# listings. Pages are keyset-paginated on id; search uses ILIKE, which the
+# pg_trgm GIN indexes from migrations.py serve for both prefix and substring
+# patterns.
+
+ADMIN_PAGE_MAX = 200
+
+# column tuples for the fast_json list path
+USER_FIELDS = ("id", "username", "email", "is_admin", "locked", "failed_login_count")
+USER_COLUMNS = (
+    User.id,
+    User.username,
+    User.email,
+    func.coalesce(User.is_admin, false()),
+    func.coalesce(User.locked, false()),
+    func.coalesce(User.failed_login_count, 0),
+)
+SIGNUP_REQUEST_FIELDS = ("id", "username", "email", "status", "created_at")
+SIGNUP_REQUEST_COLUMNS = (
+    SignupRequestRow.id,
+    SignupRequestRow.username,
+    SignupRequestRow.email,
+    SignupRequestRow.status,
+    SignupRequestRow.created_at,
+)
+
+
+def _like_pattern(q: str, match: str) -> str:
+    esc = q.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+    if match == "prefix":
+        return f"{esc}%"
+    if match == "substring":
+        return f"%{esc}%"
+    raise HTTPException(status_code=400, detail="match must be prefix|substring")
+
+
+def users_query(
+    q: str | None = None,
+    match: str = "substring",
+    locked: bool | None = None,
+    is_admin: bool | None = None,
+):
+    """Filtered users select, without cursor/limit (also used for the count estimate)."""
+    stmt = select(*USER_COLUMNS)
+    if q is not None and q.strip():
+        pat = _like_pattern(q.strip(), match)
+        stmt = stmt.where(or_(User.username.ilike(pat, escape="\\"), User.email.ilike(pat, escape="\\")))
+    if locked is not None:
+        stmt = stmt.where(User.locked == locked)
+    if is_admin is not None:
+        stmt = stmt.where(User.is_admin == is_admin)
+    return stmt
+
+
+def users_page(stmt, cursor: int | None, limit: int | None):
+    # ascending ids, as the unpaginated listing always was
+    if cursor is not None:
+        stmt = stmt.where(User.id > cursor)
+    stmt = stmt.order_by(User.id.asc())
+    if limit is not None:
+        # one extra row tells whether another page exists
+        stmt = stmt.limit(limit + 1)
+    return stmt
+
+
+def signup_requests_query(status: str = "pending", q: str | None = None, match: str = "substring"):
+    status = status.strip().lower()
+    if status not in {"pending", "approved", "rejected", "all"}:
+        raise HTTPException(status_code=400, detail="invalid status")
+    stmt = select(*SIGNUP_REQUEST_COLUMNS)
+    if status != "all":
+        stmt = stmt.where(SignupRequestRow.status == status)
+    if q is not None and q.strip():
+        pat = _like_pattern(q.strip(), match)
+        stmt = stmt.where(
+            or_(SignupRequestRow.username.ilike(pat, escape="\\"), SignupRequestRow.email.ilike(pat, escape="\\"))
+        )
+    return stmt
+
+
+def signup_requests_page(stmt, cursor: int | None, limit: int | None):
+    # newest first
+    if cursor is not None:
+        stmt = stmt.where(SignupRequestRow.id < cursor)
+    stmt = stmt.order_by(SignupRequestRow.id.desc())
+    if limit is not None:
+        stmt = stmt.limit(limit + 1)
+    return stmt
+
+
+def estimate_sql(stmt, dialect) -> tuple[str, dict]:
+    """EXPLAIN statement giving the planner's row estimate for `stmt` (no COUNT(*) scan)."""
+    compiled = stmt.compile(dialect=dialect)
+    return "EXPLAIN (FORMAT JSON) " + str(compiled), dict(compiled.params)
+
+
+def plan_rows(explain_result) -> int:
+    plan = explain_result[0]
+    return max(int(plan["Plan"]["Plan Rows"]), 0)
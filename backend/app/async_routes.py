@@ -0,0 +1,515 @@
+from __future__ import annotations
+
+import os
+import secrets
+
+from fastapi import APIRouter, HTTPException, Query, Request, Response
+from sqlalchemy import delete, select, text
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from . import (
+    admin_queries,
+    fast_json,
+    login_throttle,
+    metrics,
+    session_cache,
+    sql_profile,
+    todo_events,
+    todo_queries,
+    todo_version,
+)
+from .admin_schemas import AdminUserOut, SignupRequestOut
+from .auth_sessions import SessionRow, new_sid, now_s
+from .db import get_async_engine
+from .hashing import ahash_password, averify_password
+from .models import Todo, User
+from .schemas import AuthIn, ChangePasswordIn, LoginOut, SignupIn, TodoCreate, TodoOut, TodoPriority, VerifyEmailCodeIn
+from .session_deps import aget_user_from_session_cookie
+from .signup_requests import SignupRequestRow
+
+# async def twins of the todo/auth/admin routes in main.py, mounted in place of
+# the sync ones when DB_MODE=async. Schema setup still runs through the sync
+# engine in main._startup; this module only serves requests.
+
+router = APIRouter(route_class=sql_profile.ProfiledRoute)
+
+aengine = None
+ar = None
+
+SESSION_COOKIE = os.environ.get("SESSION_COOKIE", "sid")
+SESSION_TTL_SECONDS = int(os.environ.get("SESSION_TTL_SECONDS", "604800"))  # 7 days
+
+
+@router.on_event("startup")
+async def _startup_async():
+    global aengine, ar
+    aengine = get_async_engine()
+    metrics.register_pool_gauges(lambda: {"async": aengine.sync_engine.pool if aengine is not None else None})
+    ar = metrics.TimedAsyncRedis.from_url(os.environ.get("REDIS_URL", "redis://localhost:6379/0"), decode_responses=True)
+
+
+@router.on_event("shutdown")
+async def _shutdown_async():
+    if aengine is not None:
+        await aengine.dispose()
+    if ar is not None:
+        await ar.aclose()
+
+
+def _session() -> AsyncSession:
+    if aengine is None:
+        raise HTTPException(status_code=503, detail="db not ready")
+    # handlers read attributes after commit; avoid implicit (sync) reloads
+    return AsyncSession(aengine, expire_on_commit=False)
+
+
+async def _current_user(request: Request) -> User:
+    if aengine is None:
+        raise HTTPException(status_code=503, detail="db not ready")
+    return await aget_user_from_session_cookie(aengine, request.cookies.get(SESSION_COOKIE), ar)
+
+
+async def _require_admin(request: Request) -> User:
+    u = await _current_user(request)
+    if not bool(getattr(u, "is_admin", False)):
+        raise HTTPException(status_code=403, detail="admin required")
+    return u
+
+
+@router.post("/api/login", response_model=LoginOut)
+async def login(body: AuthIn, request: Request, response: Response):
+    """Login only. If user does not exist, they must submit a signup request."""
+    username = body.username.strip()
+    password = body.password
+    if not username or not password:
+        raise HTTPException(status_code=400, detail="username/password required")
+    if len(password) < 6:
+        raise HTTPException(status_code=400, detail="password must be at least 6 characters")
+
+    ip = login_throttle.client_ip(request)
+    try:
+        await login_throttle.acheck_ip(ar, ip)
+    except HTTPException:
+        metrics.logins.inc(outcome="throttled")
+        raise
+
+    async with _session() as s:
+        u = (await s.execute(select(User).where(User.username == username))).scalars().first()
+        if u is None:
+            await login_throttle.arecord_failure(ar, None, ip)
+            metrics.logins.inc(outcome="unknown_user")
+            raise HTTPException(status_code=404, detail="user not found")
+
+        if bool(getattr(u, "locked", False)):
+            metrics.logins.inc(outcome="locked")
+            raise HTTPException(status_code=423, detail="account locked")
+
+        if not await averify_password(password, u.password_hash):
+            fail_count = await login_throttle.arecord_failure(ar, int(u.id), ip)
+            if fail_count is None:
+                # Redis unavailable: fall back to the counters on the users row
+                now = now_s()
+                win_start = int(getattr(u, "failed_login_window_start", 0) or 0)
+                fail_count = int(getattr(u, "failed_login_count", 0) or 0)
+                if win_start == 0 or (now - win_start) > login_throttle.LOCK_WINDOW_SECONDS:
+                    win_start = now
+                    fail_count = 0
+                fail_count += 1
+                u.failed_login_window_start = win_start
+                u.failed_login_count = fail_count
+            if fail_count >= login_throttle.LOCK_MAX_FAILS:
+                u.locked = True
+            if s.dirty:
+                await s.commit()
+            if fail_count >= login_throttle.LOCK_MAX_FAILS:
+                await session_cache.adrop_user(ar, int(u.id))
+                metrics.logins.inc(outcome="lock")
+                raise HTTPException(status_code=423, detail="account locked")
+            metrics.logins.inc(outcome="invalid_credentials")
+            raise HTTPException(status_code=401, detail="invalid credentials")
+
+        # success: reset counters (the row only carries them from the fallback path)
+        await login_throttle.areset(ar, int(u.id))
+        if getattr(u, "failed_login_count", 0) or getattr(u, "failed_login_window_start", None):
+            u.failed_login_window_start = None
+            u.failed_login_count = 0
+            s.add(u)
+
+        # create session row
+        sid = new_sid()
+        exp = now_s() + SESSION_TTL_SECONDS
+        s.add(SessionRow(sid=sid, user_id=int(u.id), expires_at=exp))
+        await s.commit()
+
+    metrics.logins.inc(outcome="success")
+
+    # httpOnly cookie, Lax for form posts
+    response.set_cookie(
+        key=SESSION_COOKIE,
+        value=sid,
+        httponly=True,
+        samesite="lax",
+        secure=False,
+        path="/",
+        max_age=SESSION_TTL_SECONDS,
+    )
+    return LoginOut(ok=True)
+
+
+@router.post("/api/signup")
+async def signup(body: SignupIn):
+    from .main import _validate_strong_password
+
+    username = body.username.strip()
+    email = body.email.strip()
+    password = body.password
+
+    if not username or not email or not password:
+        raise HTTPException(status_code=400, detail="username/email/password required")
+    _validate_strong_password(password)
+    if "@" not in email or "." not in email.split("@")[-1]:
+        raise HTTPException(status_code=400, detail="invalid email")
+
+    async with _session() as s:
+        # block if already exists
+        existing = (await s.execute(select(User.id).where(User.username == username))).first()
+        if existing is not None:
+            raise HTTPException(status_code=409, detail="username already exists")
+        existing_e = (await s.execute(select(User.id).where(User.email == email))).first()
+        if existing_e is not None:
+            raise HTTPException(status_code=409, detail="email already exists")
+
+        # avoid duplicate pending requests
+        dup = (
+            await s.execute(
+                select(SignupRequestRow.id).where(
+                    SignupRequestRow.username == username,
+                    SignupRequestRow.status == "pending",
+                )
+            )
+        ).first()
+        if dup is not None:
+            return {"ok": True, "status": "pending"}
+
+        created_at = int((await s.execute(text("SELECT EXTRACT(EPOCH FROM NOW())::BIGINT"))).scalar_one())
+        req = SignupRequestRow(
+            username=username,
+            email=email,
+            password_hash=await ahash_password(password),
+            status="pending",
+            created_at=created_at,
+        )
+        s.add(req)
+        await s.commit()
+
+    return {"ok": True, "status": "pending"}
+
+
+@router.post("/api/change_password")
+async def change_password(request: Request, body: ChangePasswordIn):
+    from .main import _validate_strong_password
+
+    u = await _current_user(request)
+
+    old_pw = body.old_password
+    new_pw = body.new_password
+
+    if not old_pw or not new_pw:
+        raise HTTPException(status_code=400, detail="old_password/new_password required")
+
+    async with _session() as s:
+        dbu = await s.get(User, int(u.id))
+        if dbu is None:
+            raise HTTPException(status_code=401, detail="user missing")
+        if not await averify_password(old_pw, dbu.password_hash):
+            raise HTTPException(status_code=401, detail="invalid credentials")
+
+        _validate_strong_password(new_pw)
+
+        dbu.password_hash = await ahash_password(new_pw)
+        dbu.must_change_password = False
+        dbu.failed_login_count = 0
+        dbu.failed_login_window_start = None
+        dbu.locked = False
+        s.add(dbu)
+
+        # Force logout (A): delete all sessions for this user.
+        await s.execute(delete(SessionRow).where(SessionRow.user_id == int(dbu.id)))
+        await s.commit()
+        await session_cache.adrop_user(ar, int(dbu.id))
+        await login_throttle.areset(ar, int(dbu.id))
+
+    return {"ok": True}
+
+
+@router.post("/api/verify_email_code")
+async def verify_email_code(request: Request, body: VerifyEmailCodeIn):
+    u = await _current_user(request)
+
+    code = (body.code or "").strip()
+    if not code:
+        raise HTTPException(status_code=400, detail="code required")
+
+    now = now_s()
+    async with _session() as s:
+        dbu = await s.get(User, int(u.id))
+        if dbu is None:
+            raise HTTPException(status_code=401, detail="user missing")
+
+        if bool(getattr(dbu, "email_verified", True)):
+            return {"ok": True}
+
+        exp = int(getattr(dbu, "email_verification_expires_at", 0) or 0)
+        if exp and now > exp:
+            raise HTTPException(status_code=400, detail="code expired")
+
+        h = getattr(dbu, "email_verification_code_hash", None)
+        if not h or not await averify_password(code, h):
+            raise HTTPException(status_code=400, detail="invalid code")
+
+        dbu.email_verified = True
+        dbu.email_verification_code_hash = None
+        dbu.email_verification_expires_at = None
+        s.add(dbu)
+        await s.commit()
+        await session_cache.adrop_user(ar, int(dbu.id))
+
+    return {"ok": True}
+
+
+@router.post("/api/logout")
+async def logout(request: Request, response: Response):
+    sid = request.cookies.get(SESSION_COOKIE)
+    if sid:
+        async with _session() as s:
+            await s.execute(delete(SessionRow).where(SessionRow.sid == sid))
+            await s.commit()
+        await session_cache.adrop_session(ar, sid)
+    response.delete_cookie(key=SESSION_COOKIE, path="/")
+    return {"ok": True}
+
+
+@router.get("/api/admin/signup_requests", response_model=list[SignupRequestOut])
+async def admin_list_signup_requests(
+    request: Request,
+    status: str = "pending",
+    q: str | None = None,
+    match: str = "substring",
+    limit: int | None = Query(default=None, ge=1, le=admin_queries.ADMIN_PAGE_MAX),
+    cursor: int | None = None,
+):
+    await _require_admin(request)
+
+    base = admin_queries.signup_requests_query(status, q, match)
+    headers: dict[str, str] = {}
+    async with _session() as s:
+        rows = (await s.execute(admin_queries.signup_requests_page(base, cursor, limit))).all()
+        if limit is not None:
+            if len(rows) > limit:
+                rows = rows[:limit]
+                headers["X-Next-Cursor"] = str(int(rows[-1][0]))
+            sql, params = admin_queries.estimate_sql(base, aengine.dialect)
+            plan = (await (await s.connection()).exec_driver_sql(sql, params)).scalar_one()
+            headers["X-Total-Estimate"] = str(admin_queries.plan_rows(plan))
+    return fast_json.JSONBytesResponse(
+        fast_json.rows_to_json(admin_queries.SIGNUP_REQUEST_FIELDS, rows), headers=headers
+    )
+
+
+@router.post("/api/admin/signup_requests/{req_id}/approve")
+async def admin_approve_signup_request(req_id: int, request: Request):
+    await _require_admin(request)
+
+    async with _session() as s:
+        req = await s.get(SignupRequestRow, req_id)
+        if req is None:
+            raise HTTPException(status_code=404, detail="request not found")
+        if req.status != "pending":
+            return {"ok": True}
+
+        # create user (and require verification)
+        code = f"{secrets.randbelow(1_000_000):06d}"
+        u = User(
+            username=req.username,
+            email=req.email,
+            password_hash=req.password_hash,
+            is_admin=False,
+            locked=False,
+            failed_login_count=0,
+            failed_login_window_start=None,
+            must_change_password=False,
+            email_verified=False,
+            email_verification_code_hash=await ahash_password(code),
+            email_verification_expires_at=now_s() + 15 * 60,
+        )
+        s.add(u)
+        req.status = "approved"
+        s.add(req)
+        await s.commit()
+    return {"ok": True, "verification_code": code}
+
+
+@router.post("/api/admin/signup_requests/{req_id}/reject")
+async def admin_reject_signup_request(req_id: int, request: Request):
+    await _require_admin(request)
+
+    async with _session() as s:
+        req = await s.get(SignupRequestRow, req_id)
+        if req is None:
+            raise HTTPException(status_code=404, detail="request not found")
+        if req.status == "pending":
+            req.status = "rejected"
+            s.add(req)
+            await s.commit()
+    return {"ok": True}
+
+
+@router.get("/api/admin/users", response_model=list[AdminUserOut])
+async def admin_list_users(
+    request: Request,
+    q: str | None = None,
+    match: str = "substring",
+    locked: bool | None = None,
+    is_admin: bool | None = None,
+    limit: int | None = Query(default=None, ge=1, le=admin_queries.ADMIN_PAGE_MAX),
+    cursor: int | None = None,
+):
+    await _require_admin(request)
+
+    base = admin_queries.users_query(q, match, locked, is_admin)
+    headers: dict[str, str] = {}
+    async with _session() as s:
+        rows = (await s.execute(admin_queries.users_page(base, cursor, limit))).all()
+        if limit is not None:
+            if len(rows) > limit:
+                rows = rows[:limit]
+                headers["X-Next-Cursor"] = str(int(rows[-1][0]))
+            sql, params = admin_queries.estimate_sql(base, aengine.dialect)
+            plan = (await (await s.connection()).exec_driver_sql(sql, params)).scalar_one()
+            headers["X-Total-Estimate"] = str(admin_queries.plan_rows(plan))
+    fails = await login_throttle.afailure_counts(ar, [int(row[0]) for row in rows])
+    if fails:
+        rows = [(*row[:5], fails.get(int(row[0]), row[5])) for row in rows]
+    return fast_json.JSONBytesResponse(fast_json.rows_to_json(admin_queries.USER_FIELDS, rows), headers=headers)
+
+
+@router.post("/api/admin/users/{user_id}/unlock")
+async def admin_unlock_user(user_id: int, request: Request):
+    await _require_admin(request)
+
+    async with _session() as s:
+        u = await s.get(User, user_id)
+        if u is None:
+            raise HTTPException(status_code=404, detail="user not found")
+        u.locked = False
+        u.failed_login_count = 0
+        u.failed_login_window_start = None
+        s.add(u)
+        await s.commit()
+    await session_cache.adrop_user(ar, user_id)
+    await login_throttle.areset(ar, user_id)
+    return {"ok": True}
+
+
+@router.get("/api/me")
+async def me(request: Request):
+    u = await _current_user(request)
+    return {
+        "id": int(u.id),
+        "username": u.username,
+        "is_admin": bool(getattr(u, "is_admin", False)),
+        "must_change_password": bool(getattr(u, "must_change_password", False)),
+        "email_verified": bool(getattr(u, "email_verified", True)),
+    }
+
+
+@router.get("/api/todos", response_model=list[TodoOut])
+async def list_todos(
+    request: Request,
+    limit: int | None = Query(default=None, ge=1, le=500),
+    cursor: str | None = None,
+    done: bool | None = None,
+    priority: str | None = None,
+    sort: str = "newest",
+):
+    u = await _current_user(request)
+
+    headers: dict[str, str] = {}
+    etag = await todo_version.aetag(ar, int(u.id), f"{limit}:{cursor}:{done}:{priority}:{sort}")
+    if etag is not None:
+        headers = {"ETag": etag, "Cache-Control": "private, no-cache"}
+        if todo_version.etag_matches(etag, request.headers.get("if-none-match")):
+            return Response(status_code=304, headers=headers)
+
+    q = todo_queries.list_query(int(u.id), limit, cursor, done, priority, sort)
+    async with _session() as s:
+        rows = (await s.execute(q)).all()
+    if limit is not None and len(rows) > limit:
+        rows = rows[:limit]
+        headers["X-Next-Cursor"] = todo_queries.list_cursor(rows[-1], sort)
+    return fast_json.JSONBytesResponse(fast_json.rows_to_json(todo_queries.TODO_FIELDS, rows), headers=headers)
+
+
+@router.post("/api/todos", response_model=TodoOut)
+async def create_todo(request: Request, body: TodoCreate):
+    u = await _current_user(request)
+
+    title = body.title.strip()
+    if not title:
+        raise HTTPException(status_code=400, detail="title is required")
+
+    pr = todo_queries.normalize_priority(body.priority or "Medium")
+
+    async with _session() as s:
+        # one INSERT ... RETURNING; created_at comes from the column default
+        row = (await s.execute(todo_queries.insert_todo(int(u.id), title, todo_queries.PRIORITY_CODES[pr]))).one()
+        await s.commit()
+        await todo_version.abump(ar, int(u.id))
+        out = TodoOut(id=int(row.id), title=title, done=False, priority=pr, created_at=int(row.created_at))
+        await todo_events.apublish(ar, int(u.id), {"type": "created", "todo": out.model_dump()})
+        return out
+
+
+@router.post("/api/todos/{todo_id}/priority")
+async def set_priority(todo_id: int, request: Request, body: TodoPriority):
+    u = await _current_user(request)
+
+    pr = todo_queries.normalize_priority(body.priority)
+
+    async with _session() as s:
+        found = (
+            await s.execute(todo_queries.update_todo(int(u.id), todo_id, priority_code=todo_queries.PRIORITY_CODES[pr]))
+        ).first()
+        if found is None:
+            raise HTTPException(status_code=404, detail="todo not found")
+        await s.commit()
+        await todo_version.abump(ar, int(u.id))
+        await todo_events.apublish(ar, int(u.id), {"type": "updated", "id": todo_id, "priority": pr})
+        return {"ok": True}
+
+
+@router.post("/api/todos/{todo_id}/toggle")
+async def toggle_todo(todo_id: int, request: Request):
+    u = await _current_user(request)
+
+    async with _session() as s:
+        new_done = (await s.execute(todo_queries.update_todo(int(u.id), todo_id, done=~Todo.done))).scalar()
+        if new_done is None:
+            raise HTTPException(status_code=404, detail="todo not found")
+        await s.commit()
+        await todo_version.abump(ar, int(u.id))
+        await todo_events.apublish(ar, int(u.id), {"type": "updated", "id": todo_id, "done": bool(new_done)})
+        return {"ok": True}
+
+
+@router.post("/api/todos/{todo_id}/delete")
+async def delete_todo(todo_id: int, request: Request):
+    u = await _current_user(request)
+
+    async with _session() as s:
+        if (await s.execute(todo_queries.delete_todo(int(u.id), todo_id))).first() is None:
+            raise HTTPException(status_code=404, detail="todo not found")
+        await s.commit()
+        await todo_version.abump(ar, int(u.id))
+        await todo_events.apublish(ar, int(u.id), {"type": "deleted", "id": todo_id})
+        return {"ok": True}
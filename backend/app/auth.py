@@ -47,16 +47,18 @@ def verify_password(pw: str, pw_hash: str) -> bool:
         return False
 
 
-def make_token(user_id: int, username: str) -> str:
+def make_token(user_id: int, username: str, ttl: int | None = None, **claims: Any) -> str:
     now = int(time.time())
     payload: dict[str, Any] = {
         "sub": str(user_id),
         "username": username,
         "iat": now,
-        "exp": now + JWT_TTL_SECONDS,
+        "exp": now + (JWT_TTL_SECONDS if ttl is None else int(ttl)),
+        **claims,
     }
     return jwt.encode(payload, JWT_SECRET, algorithm=JWT_ALG)
 
 
-def decode_token(token: str) -> dict[str, Any]:
-    return jwt.decode(token, JWT_SECRET, algorithms=[JWT_ALG])
+def decode_token(token: str, verify_exp: bool = True) -> dict[str, Any]:
+    # verify_exp=False still checks the signature (token refresh needs the claims)
+    return jwt.decode(token, JWT_SECRET, algorithms=[JWT_ALG], options={"verify_exp": verify_exp})
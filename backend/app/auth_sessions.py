@@ -13,7 +13,7 @@ class SessionRow(Base):
 
     sid = Column(String(64), primary_key=True)
     user_id = Column(Integer, ForeignKey("users.id", ondelete="CASCADE"), nullable=False, index=True)
-    expires_at = Column(Integer, nullable=False)  # unix seconds
+    expires_at = Column(Integer, nullable=False, index=True)  # unix seconds (swept by session_sweeper)
 
 
 def new_sid() -> str:
@@ -4,10 +4,49 @@ import os
 
 from sqlalchemy import create_engine
 
+from .metrics import TimedAsyncQueuePool, TimedQueuePool, TimedReplicaQueuePool
+
+# "sync" (default): plain def handlers on Starlette's threadpool.
+# "async": async def handlers on an AsyncEngine + redis.asyncio (see async_routes.py).
+DB_MODE = os.environ.get("DB_MODE", "sync").strip().lower()
+
 
 def get_engine():
     url = os.environ.get("DATABASE_URL")
     if not url:
         raise RuntimeError("DATABASE_URL is required")
     # Keep it simple: sync engine is fine for a starter template.
-    return create_engine(url, pool_pre_ping=True)
+    # TimedQueuePool feeds db_pool_checkout_wait_seconds (/metrics)
+    return create_engine(url, pool_pre_ping=True, poolclass=TimedQueuePool)
+
+
+def get_replica_engine():
+    """Engine for REPLICA_DATABASE_URL (a streaming standby), or None when unset."""
+    url = os.environ.get("REPLICA_DATABASE_URL")
+    if not url:
+        return None
+    # short connect timeout: an unreachable replica should fail over, not stall reads
+    return create_engine(
+        url,
+        pool_pre_ping=True,
+        poolclass=TimedReplicaQueuePool,
+        pool_size=int(os.environ.get("REPLICA_POOL_SIZE", "5")),
+        max_overflow=int(os.environ.get("REPLICA_MAX_OVERFLOW", "10")),
+        connect_args={"connect_timeout": 2},
+    )
+
+
+def get_async_engine():
+    from sqlalchemy.ext.asyncio import create_async_engine
+
+    url = os.environ.get("DATABASE_URL")
+    if not url:
+        raise RuntimeError("DATABASE_URL is required")
+    # psycopg 3 serves both modes under the same postgresql+psycopg dialect
+    return create_async_engine(
+        url,
+        pool_pre_ping=True,
+        poolclass=TimedAsyncQueuePool,
+        pool_size=int(os.environ.get("DB_POOL_SIZE", "20")),
+        max_overflow=int(os.environ.get("DB_MAX_OVERFLOW", "20")),
+    )
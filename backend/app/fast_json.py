@@ -0,0 +1,38 @@
+from __future__ import annotations
+
+import json
+from typing import Any, Iterable, Sequence
+
+from fastapi import Response
+
+# Fast path for large list responses: handlers select plain column tuples and
+# encode them straight to JSON bytes, skipping per-row ORM objects, Pydantic
+# models and FastAPI's response_model re-validation. orjson is used when
+# installed (optional dependency), the stdlib encoder otherwise.
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - optional
+    orjson = None
+
+
+def dumps(obj: Any) -> bytes:
+    if orjson is not None:
+        return orjson.dumps(obj)
+    return json.dumps(obj, separators=(",", ":"), ensure_ascii=False).encode("utf-8")
+
+
+def rows_to_json(fields: Sequence[str], rows: Iterable[Sequence[Any]]) -> bytes:
+    """Encode row tuples as a JSON array of objects keyed by `fields`."""
+    return dumps([dict(zip(fields, row)) for row in rows])
+
+
+class JSONBytesResponse(Response):
+    """Response for bodies already encoded by dumps()/rows_to_json()."""
+
+    media_type = "application/json"
+
+    def render(self, content: Any) -> bytes:
+        if isinstance(content, (bytes, bytearray)):
+            return bytes(content)
+        return dumps(content)
@@ -0,0 +1,155 @@
+from __future__ import annotations
+
+import asyncio
+import multiprocessing
+import os
+import threading
+import time
+from concurrent.futures import Future, ProcessPoolExecutor
+
+from fastapi import HTTPException
+
+from . import auth, metrics
+
+# Bounded process pool for the PBKDF2 work in auth.py, so login storms use all
+# cores and shed load with 503 instead of starving the request threadpool.
+#   HASH_WORKERS              processes in the pool (0 = hash inline on the caller thread)
+#   HASH_MAX_QUEUE            jobs allowed to wait behind busy workers before rejecting
+#   HASH_MAX_BLOCKED_THREADS  sync callers (def handlers) allowed to block a
+#                             threadpool thread on a hash at once; kept well
+#                             below anyio's 40 threads so a login storm gets
+#                             503s while other routes still have threads
+
+HASH_WORKERS = int(os.environ.get("HASH_WORKERS", str(os.cpu_count() or 2)))
+HASH_MAX_QUEUE = int(os.environ.get("HASH_MAX_QUEUE", "64"))
+HASH_MAX_BLOCKED_THREADS = int(os.environ.get("HASH_MAX_BLOCKED_THREADS", "16"))
+
+_pool: ProcessPoolExecutor | None = None
+_lock = threading.Lock()
+_pending = 0
+_blocked = 0
+_stats = {"submitted": 0, "completed": 0, "rejected": 0}
+
+
+def _get_pool() -> ProcessPoolExecutor:
+    global _pool
+    if _pool is None:
+        # spawn: forking a process that already runs threads (uvicorn) is unsafe
+        _pool = ProcessPoolExecutor(max_workers=HASH_WORKERS, mp_context=multiprocessing.get_context("spawn"))
+    return _pool
+
+
+def _done(_f: Future) -> None:
+    global _pending
+    with _lock:
+        _pending -= 1
+        _stats["completed"] += 1
+
+
+def _busy() -> HTTPException:
+    _stats["rejected"] += 1
+    return HTTPException(status_code=503, detail="server busy, retry later", headers={"Retry-After": "1"})
+
+
+def _submit(fn, *args) -> Future:
+    global _pending
+    with _lock:
+        if _pending >= HASH_WORKERS + HASH_MAX_QUEUE:
+            raise _busy()
+        _pending += 1
+        _stats["submitted"] += 1
+        pool = _get_pool()
+    try:
+        f = pool.submit(fn, *args)
+    except Exception:
+        with _lock:
+            _pending -= 1
+        raise
+    f.add_done_callback(_done)
+    return f
+
+
+def _timed(fn, *args):
+    # runs in the worker process; compute time travels back with the result
+    t0 = time.perf_counter()
+    return fn(*args), time.perf_counter() - t0
+
+
+def _observe(op: str, compute: float, wall: float | None = None) -> None:
+    metrics.pbkdf2_seconds.observe(compute, op=op)
+    if wall is not None:
+        metrics.pbkdf2_wait_seconds.observe(max(wall - compute, 0.0), op=op)
+
+
+def _run(op: str, fn, *args):
+    # sync callers hold their threadpool thread until the hash is done
+    global _blocked
+    with _lock:
+        if _blocked >= HASH_MAX_BLOCKED_THREADS:
+            raise _busy()
+        _blocked += 1
+    try:
+        t0 = time.perf_counter()
+        if HASH_WORKERS <= 0:
+            res, compute = _timed(fn, *args)
+            _observe(op, compute)
+            return res
+        res, compute = _submit(_timed, fn, *args).result()
+        _observe(op, compute, time.perf_counter() - t0)
+        return res
+    finally:
+        with _lock:
+            _blocked -= 1
+
+
+async def _arun(op: str, fn, *args):
+    t0 = time.perf_counter()
+    if HASH_WORKERS <= 0:
+        res, compute = _timed(fn, *args)
+        _observe(op, compute)
+        return res
+    res, compute = await asyncio.wrap_future(_submit(_timed, fn, *args))
+    _observe(op, compute, time.perf_counter() - t0)
+    return res
+
+
+def hash_password(pw: str) -> str:
+    return _run("hash", auth.hash_password, pw)
+
+
+def verify_password(pw: str, pw_hash: str) -> bool:
+    return _run("verify", auth.verify_password, pw, pw_hash)
+
+
+async def ahash_password(pw: str) -> str:
+    return await _arun("hash", auth.hash_password, pw)
+
+
+async def averify_password(pw: str, pw_hash: str) -> bool:
+    return await _arun("verify", auth.verify_password, pw, pw_hash)
+
+
+def stats() -> dict:
+    with _lock:
+        pending = _pending
+        blocked = _blocked
+        out = dict(_stats)
+    busy = min(pending, max(HASH_WORKERS, 0))
+    out.update(
+        {
+            "workers": HASH_WORKERS,
+            "max_queue": HASH_MAX_QUEUE,
+            "in_flight": busy,
+            "queued": pending - busy,
+            "blocked_threads": blocked,
+            "max_blocked_threads": HASH_MAX_BLOCKED_THREADS,
+        }
+    )
+    return out
+
+
+def shutdown() -> None:
+    global _pool
+    if _pool is not None:
+        _pool.shutdown(wait=False, cancel_futures=True)
+        _pool = None
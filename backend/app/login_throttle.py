@@ -0,0 +1,171 @@
+from __future__ import annotations
+
+import os
+import secrets
+import time
+
+from fastapi import HTTPException, Request
+
+# Failed-login throttling in Redis instead of the users row.
+#
+# Failures are kept in sliding windows (sorted sets scored by ms timestamp):
+#   lfail:user:<uid>  per account; reaching LOCK_MAX_FAILS within
+#                     LOCK_WINDOW_SECONDS persists users.locked = true
+#   lfail:ip:<ip>     per client IP; reaching LOGIN_IP_MAX_FAILS within
+#                     LOGIN_IP_WINDOW_SECONDS answers 429 before any hashing
+# Only the lock itself is written to Postgres. If Redis is unavailable the
+# record/count helpers return None and login falls back to the DB counters.
+
+LOCK_WINDOW_SECONDS = int(os.environ.get("LOCK_WINDOW_SECONDS", "3600"))
+LOCK_MAX_FAILS = int(os.environ.get("LOCK_MAX_FAILS", "5"))
+LOGIN_IP_WINDOW_SECONDS = int(os.environ.get("LOGIN_IP_WINDOW_SECONDS", "900"))
+LOGIN_IP_MAX_FAILS = int(os.environ.get("LOGIN_IP_MAX_FAILS", "50"))
+# X-Forwarded-For entries appended by proxies we run in front of the API; the
+# client address is the one that many hops from the right. 0 (default): use the
+# socket peer and ignore the header. docker-compose sets 1 (the Next.js servers
+# append the browser's address, see frontend/peer-address.cjs).
+TRUSTED_PROXY_HOPS = int(os.environ.get("TRUSTED_PROXY_HOPS", "0"))
+
+USER_KEY = "lfail:user:{uid}"
+IP_KEY = "lfail:ip:{ip}"
+
+# ZREMRANGEBYSCORE + ZADD + ZCARD + PEXPIRE as one atomic step
+_RECORD_LUA = """
+local now = tonumber(ARGV[1])
+local window = tonumber(ARGV[2])
+redis.call('ZREMRANGEBYSCORE', KEYS[1], '-inf', now - window)
+redis.call('ZADD', KEYS[1], now, ARGV[3])
+redis.call('PEXPIRE', KEYS[1], window)
+return redis.call('ZCARD', KEYS[1])
+"""
+
+
+def client_ip(request: Request) -> str:
+    if TRUSTED_PROXY_HOPS > 0:
+        hops = [h.strip() for h in request.headers.get("x-forwarded-for", "").split(",") if h.strip()]
+        # entries left of the trusted hops are whatever the client sent
+        if len(hops) >= TRUSTED_PROXY_HOPS:
+            return hops[-TRUSTED_PROXY_HOPS]
+    return request.client.host if request.client else "unknown"
+
+
+def _now_ms() -> int:
+    return int(time.time() * 1000)
+
+
+def _record(r, key: str, window_s: int) -> int | None:
+    if r is None:
+        return None
+    try:
+        return int(r.register_script(_RECORD_LUA)(keys=[key], args=[_now_ms(), window_s * 1000, secrets.token_hex(8)]))
+    except Exception:
+        return None
+
+
+def _count(r, key: str, window_s: int) -> int | None:
+    if r is None:
+        return None
+    try:
+        return int(r.zcount(key, _now_ms() - window_s * 1000, "+inf"))
+    except Exception:
+        return None
+
+
+def check_ip(r, ip: str) -> None:
+    """Raise 429 when the IP is over its failure budget (fails open without Redis)."""
+    n = _count(r, IP_KEY.format(ip=ip), LOGIN_IP_WINDOW_SECONDS)
+    if n is not None and n >= LOGIN_IP_MAX_FAILS:
+        raise HTTPException(
+            status_code=429,
+            detail="too many failed logins",
+            headers={"Retry-After": str(LOGIN_IP_WINDOW_SECONDS)},
+        )
+
+
+def record_failure(r, user_id: int | None, ip: str) -> int | None:
+    """Count a failed attempt; returns the account's failures in the window (None without Redis).
+
+    `user_id` is None for unknown usernames, which only count against the IP.
+    """
+    _record(r, IP_KEY.format(ip=ip), LOGIN_IP_WINDOW_SECONDS)
+    if user_id is None:
+        return None
+    return _record(r, USER_KEY.format(uid=int(user_id)), LOCK_WINDOW_SECONDS)
+
+
+def reset(r, user_id: int) -> None:
+    if r is None:
+        return
+    try:
+        r.delete(USER_KEY.format(uid=int(user_id)))
+    except Exception:
+        pass
+
+
+def failure_counts(r, user_ids: list[int]) -> dict[int, int] | None:
+    """Current failures per account, one pipelined round trip (admin listing)."""
+    if r is None or not user_ids:
+        return None
+    lo = _now_ms() - LOCK_WINDOW_SECONDS * 1000
+    try:
+        p = r.pipeline(transaction=False)
+        for uid in user_ids:
+            p.zcount(USER_KEY.format(uid=int(uid)), lo, "+inf")
+        return {int(uid): int(n) for uid, n in zip(user_ids, p.execute())}
+    except Exception:
+        return None
+
+
+async def acheck_ip(ar, ip: str) -> None:
+    if ar is None:
+        return
+    try:
+        n = int(await ar.zcount(IP_KEY.format(ip=ip), _now_ms() - LOGIN_IP_WINDOW_SECONDS * 1000, "+inf"))
+    except Exception:
+        return
+    if n >= LOGIN_IP_MAX_FAILS:
+        raise HTTPException(
+            status_code=429,
+            detail="too many failed logins",
+            headers={"Retry-After": str(LOGIN_IP_WINDOW_SECONDS)},
+        )
+
+
+async def arecord_failure(ar, user_id: int | None, ip: str) -> int | None:
+    if ar is None:
+        return None
+    try:
+        script = ar.register_script(_RECORD_LUA)
+        await script(keys=[IP_KEY.format(ip=ip)], args=[_now_ms(), LOGIN_IP_WINDOW_SECONDS * 1000, secrets.token_hex(8)])
+        if user_id is None:
+            return None
+        return int(
+            await script(
+                keys=[USER_KEY.format(uid=int(user_id))],
+                args=[_now_ms(), LOCK_WINDOW_SECONDS * 1000, secrets.token_hex(8)],
+            )
+        )
+    except Exception:
+        return None
+
+
+async def afailure_counts(ar, user_ids: list[int]) -> dict[int, int] | None:
+    if ar is None or not user_ids:
+        return None
+    lo = _now_ms() - LOCK_WINDOW_SECONDS * 1000
+    try:
+        p = ar.pipeline(transaction=False)
+        for uid in user_ids:
+            p.zcount(USER_KEY.format(uid=int(uid)), lo, "+inf")
+        return {int(uid): int(n) for uid, n in zip(user_ids, await p.execute())}
+    except Exception:
+        return None
+
+
+async def areset(ar, user_id: int) -> None:
+    if ar is None:
+        return
+    try:
+        await ar.delete(USER_KEY.format(uid=int(user_id)))
+    except Exception:
+        pass
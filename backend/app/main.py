@@ -2,21 +2,57 @@ from __future__ import annotations
 
 import os
 
-import redis
-from fastapi import Depends, FastAPI, HTTPException, Request, Response
+from fastapi import Depends, FastAPI, HTTPException, Query, Request, Response
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.routing import APIRoute
 from sqlalchemy import select
 from sqlalchemy.orm import Session
 
-from .auth import hash_password, verify_password
+from . import (
+    admin_queries,
+    fast_json,
+    hashing,
+    login_throttle,
+    metrics,
+    migrations,
+    replica,
+    session_cache,
+    session_sweeper,
+    sql_profile,
+    startup,
+    todo_events,
+    todo_queries,
+    todo_stats,
+    todo_transfer,
+    todo_version,
+    token_auth,
+)
 from .auth_sessions import SessionRow, new_sid, now_s
-from .db import get_engine
-from .models import Base, Todo, User
-from .schemas import AuthIn, ChangePasswordIn, LoginOut, SignupIn, TodoCreate, TodoOut, TodoPriority, TodoUpdate, VerifyEmailCodeIn
-from .signup_requests import BaseSignup, SignupRequestRow
+from .db import DB_MODE, get_engine
+from .hashing import hash_password, verify_password
+from .models import Todo, User
+from .schemas import (
+    AuthIn,
+    ChangePasswordIn,
+    LoginOut,
+    SignupIn,
+    TodoBatchIn,
+    TodoBatchOut,
+    TodoBatchResult,
+    TodoCreate,
+    TodoOut,
+    TodoPriority,
+    TodoStatsOut,
+    TodoUpdate,
+    VerifyEmailCodeIn,
+)
+from .session_deps import get_user_from_session_cookie
+from .signup_requests import SignupRequestRow
 from .admin_schemas import AdminUserOut, SignupRequestOut
 
 app = FastAPI(title="NextFast API")
+# lets an "X-Profile: 1" request be profiled inside threadpool handlers
+app.router.route_class = sql_profile.ProfiledRoute
 
 # CORS for dev
 app.add_middleware(
@@ -26,14 +62,54 @@ app.add_middleware(
     allow_methods=["*"],
     allow_headers=["*"],
 )
+# per-route request counts and latency for /metrics
+app.add_middleware(metrics.MetricsMiddleware)
+# per-request statement count / DB time, slow-request log
+app.add_middleware(sql_profile.SQLProfileMiddleware)
 
 engine = None
 
 SESSION_COOKIE = os.environ.get("SESSION_COOKIE", "sid")
 SESSION_TTL_SECONDS = int(os.environ.get("SESSION_TTL_SECONDS", "604800"))  # 7 days
 
+if token_auth.enabled():
+    # Set-Cookie for tokens renewed while resolving the current user
+    app.add_middleware(token_auth.TokenCookieMiddleware, cookie=SESSION_COOKIE)
+
 redis_url = os.environ.get("REDIS_URL", "redis://localhost:6379/0")
-r = redis.Redis.from_url(redis_url, decode_responses=True)
+r = metrics.TimedRedis.from_url(redis_url, decode_responses=True)
+
+
+def _bootstrap_admin(engine, app_env: str, admin_user: str, admin_pw: str, admin_email: str | None) -> None:
+    # bootstrap admin (option B)
+    if not (admin_user and admin_pw):
+        return
+    with Session(engine) as s:
+        u = s.execute(select(User).where(User.username == admin_user)).scalars().first()
+        if u is None:
+            u = User(
+                username=admin_user,
+                email=admin_email,
+                password_hash=hash_password(admin_pw),
+                is_admin=True,
+                locked=False,
+                failed_login_count=0,
+                failed_login_window_start=None,
+                must_change_password=True,
+            )
+            s.add(u)
+            s.commit()
+        else:
+            # ensure admin flag is set
+            if not bool(u.is_admin):
+                u.is_admin = True
+                if admin_email and not u.email:
+                    u.email = admin_email
+                u.must_change_password = True
+                s.add(u)
+                replica.mark_write(r, int(u.id))
+                s.commit()
+                session_cache.drop_user(r, int(u.id))
 
 
 @app.on_event("startup")
@@ -43,181 +119,46 @@ def _startup():
     import time
 
     global engine
+    token_auth.check_config()
+
+    # In dev, default to admin/admin but force password change.
+    app_env = os.environ.get("APP_ENV", "dev")
+    admin_user = os.environ.get("ADMIN_BOOTSTRAP_USERNAME", "").strip()
+    admin_pw = os.environ.get("ADMIN_BOOTSTRAP_PASSWORD", "").strip()
+    admin_email = os.environ.get("ADMIN_BOOTSTRAP_EMAIL", "").strip() or None
+    if app_env == "dev":
+        admin_user = admin_user or "admin"
+        # default dev password must satisfy policy; still force change
+        admin_pw = admin_pw or "Admin1234"
+    # what a process that finds this marker can skip: schema version + bootstrap settings
+    marker = f"{migrations.target_version()}|{app_env}|{admin_user}|{admin_email or ''}|{bool(admin_pw)}"
+
+    def schema_and_bootstrap():
+        # versioned schema migrations
+        with startup.phase("migrate"):
+            migrations.migrate(engine)
+        with startup.phase("bootstrap"):
+            _bootstrap_admin(engine, app_env, admin_user, admin_pw, admin_email)
+
     last_exc: Exception | None = None
     for _ in range(30):
         try:
             engine = get_engine()
-            Base.metadata.create_all(bind=engine)
-
-            # Ensure sessions table exists (cookie session mode)
-            SessionRow.metadata.create_all(bind=engine)
-
-            # lightweight migrations for template iterations
-            from sqlalchemy import text
-
-            with engine.begin() as conn:
-                conn.execute(
-                    text(
-                        """
-                        DO $$
-                        BEGIN
-                          -- todos
-                          IF NOT EXISTS (
-                            SELECT 1 FROM information_schema.columns
-                            WHERE table_name='todos' AND column_name='user_id'
-                          ) THEN
-                            ALTER TABLE todos ADD COLUMN user_id INTEGER;
-                          END IF;
-
-                          IF NOT EXISTS (
-                            SELECT 1 FROM information_schema.columns
-                            WHERE table_name='todos' AND column_name='priority'
-                          ) THEN
-                            ALTER TABLE todos ADD COLUMN priority VARCHAR(8);
-                          END IF;
-
-                          IF NOT EXISTS (
-                            SELECT 1 FROM information_schema.columns
-                            WHERE table_name='todos' AND column_name='created_at'
-                          ) THEN
-                            ALTER TABLE todos ADD COLUMN created_at BIGINT;
-                          END IF;
-
-                          -- users
-                          IF NOT EXISTS (
-                            SELECT 1 FROM information_schema.columns
-                            WHERE table_name='users' AND column_name='email'
-                          ) THEN
-                            ALTER TABLE users ADD COLUMN email VARCHAR(255);
-                          END IF;
-
-                          IF NOT EXISTS (
-                            SELECT 1 FROM information_schema.columns
-                            WHERE table_name='users' AND column_name='is_admin'
-                          ) THEN
-                            ALTER TABLE users ADD COLUMN is_admin BOOLEAN;
-                          END IF;
-
-                          IF NOT EXISTS (
-                            SELECT 1 FROM information_schema.columns
-                            WHERE table_name='users' AND column_name='locked'
-                          ) THEN
-                            ALTER TABLE users ADD COLUMN locked BOOLEAN;
-                          END IF;
-
-                          IF NOT EXISTS (
-                            SELECT 1 FROM information_schema.columns
-                            WHERE table_name='users' AND column_name='failed_login_count'
-                          ) THEN
-                            ALTER TABLE users ADD COLUMN failed_login_count INTEGER;
-                          END IF;
-
-                          IF NOT EXISTS (
-                            SELECT 1 FROM information_schema.columns
-                            WHERE table_name='users' AND column_name='failed_login_window_start'
-                          ) THEN
-                            ALTER TABLE users ADD COLUMN failed_login_window_start BIGINT;
-                          END IF;
-
-                          IF NOT EXISTS (
-                            SELECT 1 FROM information_schema.columns
-                            WHERE table_name='users' AND column_name='must_change_password'
-                          ) THEN
-                            ALTER TABLE users ADD COLUMN must_change_password BOOLEAN;
-                          END IF;
-
-                          IF NOT EXISTS (
-                            SELECT 1 FROM information_schema.columns
-                            WHERE table_name='users' AND column_name='email_verified'
-                          ) THEN
-                            ALTER TABLE users ADD COLUMN email_verified BOOLEAN;
-                          END IF;
-
-                          IF NOT EXISTS (
-                            SELECT 1 FROM information_schema.columns
-                            WHERE table_name='users' AND column_name='email_verification_code_hash'
-                          ) THEN
-                            ALTER TABLE users ADD COLUMN email_verification_code_hash VARCHAR(255);
-                          END IF;
-
-                          IF NOT EXISTS (
-                            SELECT 1 FROM information_schema.columns
-                            WHERE table_name='users' AND column_name='email_verification_expires_at'
-                          ) THEN
-                            ALTER TABLE users ADD COLUMN email_verification_expires_at BIGINT;
-                          END IF;
-                        END $$;
-                        """
-                    )
-                )
-
-                # backfill defaults
-                conn.execute(
-                    text(
-                        """
-                        UPDATE todos
-                        SET
-                          user_id = COALESCE(user_id, 1),
-                          priority = COALESCE(priority, 'Medium'),
-                          created_at = COALESCE(created_at, EXTRACT(EPOCH FROM NOW())::BIGINT)
-                        WHERE user_id IS NULL OR created_at IS NULL OR priority IS NULL;
-
-                        UPDATE users
-                        SET
-                          is_admin = COALESCE(is_admin, false),
-                          locked = COALESCE(locked, false),
-                          failed_login_count = COALESCE(failed_login_count, 0),
-                          must_change_password = COALESCE(must_change_password, false),
-                          email_verified = COALESCE(email_verified, true)
-                        WHERE is_admin IS NULL OR locked IS NULL OR failed_login_count IS NULL OR must_change_password IS NULL OR email_verified IS NULL;
-                        """
-                    )
-                )
-
-            # signup requests
-            BaseSignup.metadata.create_all(bind=engine)
-
-            # bootstrap admin (option B)
-            # In dev, default to admin/admin but force password change.
-            app_env = os.environ.get("APP_ENV", "dev")
-            admin_user = os.environ.get("ADMIN_BOOTSTRAP_USERNAME", "").strip()
-            admin_pw = os.environ.get("ADMIN_BOOTSTRAP_PASSWORD", "").strip()
-            admin_email = os.environ.get("ADMIN_BOOTSTRAP_EMAIL", "").strip() or None
-            if app_env == "dev":
-                admin_user = admin_user or "admin"
-                # default dev password must satisfy policy; still force change
-                admin_pw = admin_pw or "Admin1234"
-
-            if admin_user and admin_pw:
-                with Session(engine) as s:
-                    u = s.execute(select(User).where(User.username == admin_user)).scalars().first()
-                    if u is None:
-                        u = User(
-                            username=admin_user,
-                            email=admin_email,
-                            password_hash=hash_password(admin_pw),
-                            is_admin=True,
-                            locked=False,
-                            failed_login_count=0,
-                            failed_login_window_start=None,
-                            must_change_password=True,
-                        )
-                        s.add(u)
-                        s.commit()
-                    else:
-                        # ensure admin flag is set
-                        if not bool(u.is_admin):
-                            u.is_admin = True
-                            if admin_email and not u.email:
-                                u.email = admin_email
-                            u.must_change_password = True
-                            s.add(u)
-                            s.commit()
-
+            # one process migrates/bootstraps (advisory lock); the rest wait for its marker
+            startup.coordinate(engine, marker, schema_and_bootstrap)
+
+            with startup.phase("background"):
+                session_sweeper.start(engine)
+                todo_stats.start(engine)
+                if DB_MODE != "async":
+                    # the async twins in async_routes.py read from the primary only
+                    replica.start()
+            startup.finish()
             return
         except Exception as exc:  # noqa: BLE001
             last_exc = exc
-            time.sleep(1.0)
+            with startup.phase("db_retry"):
+                time.sleep(1.0)
     raise RuntimeError(f"DB init failed after retries: {last_exc}")
 
 
@@ -228,7 +169,74 @@ def health():
         redis_ok = True
     except Exception:
         redis_ok = False
-    return {"ok": True, "redis": redis_ok}
+    return {
+        "ok": True,
+        "redis": redis_ok,
+        "hashing": hashing.stats(),
+        "sessions": session_sweeper.stats(),
+        "todo_counts": todo_stats.stats(),
+        "replica": replica.stats(),
+        "startup": startup.stats(),
+    }
+
+
+@app.get("/metrics", include_in_schema=False)
+def prometheus_metrics():
+    from fastapi.responses import PlainTextResponse
+
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4")
+
+
+metrics.register_pool_gauges(
+    lambda: {
+        "sync": engine.pool if engine is not None else None,
+        "replica": replica.engine.pool if replica.engine is not None else None,
+    }
+)
+metrics.gauge(
+    "pbkdf2_pool_jobs",
+    "Hashing jobs in flight / queued",
+    lambda: [({"state": k}, hashing.stats()[k]) for k in ("in_flight", "queued")],
+)
+metrics.gauge(
+    "pbkdf2_pool_jobs_total",
+    "Hashing jobs by result since start",
+    lambda: [({"result": k}, hashing.stats()[k]) for k in ("submitted", "completed", "rejected")],
+)
+metrics.gauge(
+    "sessions_swept_total",
+    "Expired sessions deleted by this worker's sweeper",
+    lambda: [({}, session_sweeper.stats()["removed_total"])],
+)
+metrics.gauge(
+    "sessions_table_rows_estimate",
+    "Planner row estimate for the sessions table",
+    lambda: [({}, session_sweeper.stats()["table_rows_estimate"])],
+)
+metrics.gauge(
+    "sessions_table_bytes",
+    "Total size of the sessions table incl. indexes",
+    lambda: [({}, session_sweeper.stats()["table_bytes"])],
+)
+metrics.gauge(
+    "todo_counts_repaired_total",
+    "Drifted todo_counts buckets fixed by this worker's reconcile job",
+    lambda: [({}, todo_stats.stats()["repaired_total"])],
+)
+metrics.gauge(
+    "startup_phase_seconds",
+    "Wall time of each phase of this worker's startup",
+    lambda: [({"phase": k}, v) for k, v in startup.stats()["phases"].items()],
+)
+metrics.gauge("sse_connections", "Open todo event streams", lambda: [({}, todo_events.hub.connections)])
+
+
+@app.on_event("shutdown")
+def _shutdown():
+    session_sweeper.stop()
+    todo_stats.stop()
+    replica.stop()
+    hashing.shutdown()
 
 @app.get("/healthz")
 async def healthz():
@@ -236,8 +244,52 @@ async def healthz():
     return {"ok": True}
 
 
+# Request-scoped DB access: one Session (one pooled connection, one
+# transaction) per request, shared by the current-user lookup and the handler.
+# FastAPI caches a dependency per request, so current_user and the handler get
+# the same Session. expire_on_commit=False keeps loaded rows (the user) usable
+# after commit without another round trip.
+
+
+def db_session():
+    if engine is None:
+        raise HTTPException(status_code=503, detail="db not ready")
+    with Session(engine, expire_on_commit=False) as s:
+        yield s
+
+
+def read_db_session():
+    """db_session for read-only handlers: on the replica while it is healthy."""
+    if engine is None:
+        raise HTTPException(status_code=503, detail="db not ready")
+    with Session(replica.read_engine(engine), expire_on_commit=False) as s:
+        yield s
+
+
+def current_user(request: Request, s: Session = Depends(db_session)) -> User:
+    return get_user_from_session_cookie(engine, request.cookies.get(SESSION_COOKIE), r, session=s)
+
+
+def read_user(request: Request, s: Session = Depends(read_db_session)) -> User:
+    return get_user_from_session_cookie(engine, request.cookies.get(SESSION_COOKIE), r, session=s)
+
+
+def _check_admin(u: User) -> User:
+    if not bool(getattr(u, "is_admin", False)):
+        raise HTTPException(status_code=403, detail="admin required")
+    return u
+
+
+def current_admin(u: User = Depends(current_user)) -> User:
+    return _check_admin(u)
+
+
+def read_admin(u: User = Depends(read_user)) -> User:
+    return _check_admin(u)
+
+
 @app.post("/api/login", response_model=LoginOut)
-def login(body: AuthIn, response: Response):
+def login(body: AuthIn, request: Request, response: Response):
     """Login only. If user does not exist, they must submit a signup request."""
     if engine is None:
         raise HTTPException(status_code=503, detail="db not ready")
@@ -249,53 +301,72 @@ def login(body: AuthIn, response: Response):
     if len(password) < 6:
         raise HTTPException(status_code=400, detail="password must be at least 6 characters")
 
-    LOCK_WINDOW_SECONDS = 3600
-    LOCK_MAX_FAILS = 5
+    # failure counters live in Redis (login_throttle); only the lock hits the users row
+    ip = login_throttle.client_ip(request)
+    try:
+        login_throttle.check_ip(r, ip)
+    except HTTPException:
+        metrics.logins.inc(outcome="throttled")
+        raise
 
     with Session(engine) as s:
         u = s.execute(select(User).where(User.username == username)).scalars().first()
         if u is None:
+            login_throttle.record_failure(r, None, ip)
+            metrics.logins.inc(outcome="unknown_user")
             raise HTTPException(status_code=404, detail="user not found")
 
         if bool(getattr(u, "locked", False)):
+            metrics.logins.inc(outcome="locked")
             raise HTTPException(status_code=423, detail="account locked")
 
-        now = now_s()
-        win_start = int(getattr(u, "failed_login_window_start", 0) or 0)
-        fail_count = int(getattr(u, "failed_login_count", 0) or 0)
-
-        # reset window if expired
-        if win_start == 0 or (now - win_start) > LOCK_WINDOW_SECONDS:
-            win_start = now
-            fail_count = 0
-
         if not verify_password(password, u.password_hash):
-            fail_count += 1
-            u.failed_login_window_start = win_start
-            u.failed_login_count = fail_count
-            if fail_count >= LOCK_MAX_FAILS:
+            fail_count = login_throttle.record_failure(r, int(u.id), ip)
+            if fail_count is None:
+                # Redis unavailable: fall back to the counters on the users row
+                now = now_s()
+                win_start = int(getattr(u, "failed_login_window_start", 0) or 0)
+                fail_count = int(getattr(u, "failed_login_count", 0) or 0)
+                if win_start == 0 or (now - win_start) > login_throttle.LOCK_WINDOW_SECONDS:
+                    win_start = now
+                    fail_count = 0
+                fail_count += 1
+                u.failed_login_window_start = win_start
+                u.failed_login_count = fail_count
+            if fail_count >= login_throttle.LOCK_MAX_FAILS:
                 u.locked = True
-            s.add(u)
-            s.commit()
-            if bool(getattr(u, "locked", False)):
+                # before the commit: no replica read may re-cache the unlocked user
+                replica.mark_write(r, int(u.id))
+            if s.dirty:
+                s.commit()
+            if fail_count >= login_throttle.LOCK_MAX_FAILS:
+                session_cache.drop_user(r, int(u.id))
+                metrics.logins.inc(outcome="lock")
                 raise HTTPException(status_code=423, detail="account locked")
+            metrics.logins.inc(outcome="invalid_credentials")
             raise HTTPException(status_code=401, detail="invalid credentials")
 
-        # success: reset counters
-        u.failed_login_window_start = None
-        u.failed_login_count = 0
-        s.add(u)
+        # success: reset counters (the row only carries them from the fallback path)
+        login_throttle.reset(r, int(u.id))
+        if getattr(u, "failed_login_count", 0) or getattr(u, "failed_login_window_start", None):
+            u.failed_login_window_start = None
+            u.failed_login_count = 0
+            s.add(u)
 
         # create session row
         sid = new_sid()
         exp = now_s() + SESSION_TTL_SECONDS
         s.add(SessionRow(sid=sid, user_id=int(u.id), expires_at=exp))
+        # AUTH_MODE=token: the cookie carries a signed token for this session instead of the sid
+        cookie = token_auth.issue(u, sid, exp) if token_auth.enabled() else sid
         s.commit()
 
+    metrics.logins.inc(outcome="success")
+
     # httpOnly cookie, Lax for form posts
     response.set_cookie(
         key=SESSION_COOKIE,
-        value=sid,
+        value=cookie,
         httponly=True,
         samesite="lax",
         secure=False,
@@ -374,78 +445,69 @@ def signup(body: SignupIn):
 
 
 @app.post("/api/change_password")
-def change_password(request: Request, body: ChangePasswordIn):
-    if engine is None:
-        raise HTTPException(status_code=503, detail="db not ready")
-    from .session_deps import get_user_from_session_cookie
-
-    sid = request.cookies.get(SESSION_COOKIE)
-    u = get_user_from_session_cookie(engine, sid)
-
+def change_password(body: ChangePasswordIn, u: User = Depends(current_user), s: Session = Depends(db_session)):
     old_pw = body.old_password
     new_pw = body.new_password
 
     if not old_pw or not new_pw:
         raise HTTPException(status_code=400, detail="old_password/new_password required")
 
-    with Session(engine) as s:
-        dbu = s.get(User, int(u.id))
-        if dbu is None:
-            raise HTTPException(status_code=401, detail="user missing")
-        if not verify_password(old_pw, dbu.password_hash):
-            raise HTTPException(status_code=401, detail="invalid credentials")
+    dbu = s.get(User, int(u.id))
+    if dbu is None:
+        raise HTTPException(status_code=401, detail="user missing")
+    if not verify_password(old_pw, dbu.password_hash):
+        raise HTTPException(status_code=401, detail="invalid credentials")
 
-        _validate_strong_password(new_pw)
+    _validate_strong_password(new_pw)
 
-        dbu.password_hash = hash_password(new_pw)
-        dbu.must_change_password = False
-        dbu.failed_login_count = 0
-        dbu.failed_login_window_start = None
-        dbu.locked = False
-        s.add(dbu)
+    dbu.password_hash = hash_password(new_pw)
+    dbu.must_change_password = False
+    dbu.failed_login_count = 0
+    dbu.failed_login_window_start = None
+    dbu.locked = False
+    s.add(dbu)
 
-        # Force logout (A): delete all sessions for this user.
-        s.query(SessionRow).filter(SessionRow.user_id == int(dbu.id)).delete()
-        s.commit()
+    # Force logout (A): delete all sessions for this user.
+    s.query(SessionRow).filter(SessionRow.user_id == int(dbu.id)).delete()
+    replica.mark_write(r, int(dbu.id))
+    s.commit()
+    session_cache.drop_user(r, int(dbu.id))
+    login_throttle.reset(r, int(dbu.id))
 
     return {"ok": True}
 
 
 @app.post("/api/verify_email_code")
-def verify_email_code(request: Request, body: VerifyEmailCodeIn):
-    if engine is None:
-        raise HTTPException(status_code=503, detail="db not ready")
-    from .session_deps import get_user_from_session_cookie
-
-    sid = request.cookies.get(SESSION_COOKIE)
-    u = get_user_from_session_cookie(engine, sid)
-
+def verify_email_code(
+    body: VerifyEmailCodeIn, u: User = Depends(current_user), s: Session = Depends(db_session)
+):
     code = (body.code or "").strip()
     if not code:
         raise HTTPException(status_code=400, detail="code required")
 
     now = now_s()
-    with Session(engine) as s:
-        dbu = s.get(User, int(u.id))
-        if dbu is None:
-            raise HTTPException(status_code=401, detail="user missing")
+    dbu = s.get(User, int(u.id))
+    if dbu is None:
+        raise HTTPException(status_code=401, detail="user missing")
 
-        if bool(getattr(dbu, "email_verified", True)):
-            return {"ok": True}
+    if bool(getattr(dbu, "email_verified", True)):
+        return {"ok": True}
 
-        exp = int(getattr(dbu, "email_verification_expires_at", 0) or 0)
-        if exp and now > exp:
-            raise HTTPException(status_code=400, detail="code expired")
+    exp = int(getattr(dbu, "email_verification_expires_at", 0) or 0)
+    if exp and now > exp:
+        raise HTTPException(status_code=400, detail="code expired")
 
-        h = getattr(dbu, "email_verification_code_hash", None)
-        if not h or not verify_password(code, h):
-            raise HTTPException(status_code=400, detail="invalid code")
+    h = getattr(dbu, "email_verification_code_hash", None)
+    if not h or not verify_password(code, h):
+        raise HTTPException(status_code=400, detail="invalid code")
 
-        dbu.email_verified = True
-        dbu.email_verification_code_hash = None
-        dbu.email_verification_expires_at = None
-        s.add(dbu)
-        s.commit()
+    dbu.email_verified = True
+    dbu.email_verification_code_hash = None
+    dbu.email_verification_expires_at = None
+    s.add(dbu)
+    replica.mark_write(r, int(dbu.id))
+    s.commit()
+    session_cache.drop_user(r, int(dbu.id))
 
     return {"ok": True}
 
@@ -455,154 +517,165 @@ def logout(request: Request, response: Response):
     if engine is None:
         raise HTTPException(status_code=503, detail="db not ready")
     sid = request.cookies.get(SESSION_COOKIE)
+    if sid and token_auth.enabled():
+        claims = token_auth.decode(sid)
+        sid = str(claims["sid"]) if claims is not None else None
+        # tokens for this session stop validating now, not at their expiry
+        token_auth.revoke_session(r, sid)
     if sid:
+        from sqlalchemy import delete
+
         with Session(engine) as s:
-            s.query(SessionRow).filter(SessionRow.sid == sid).delete()
+            uid = s.execute(select(SessionRow.user_id).where(SessionRow.sid == sid)).scalar()
+            if uid is not None:
+                # the replica may still hold the row: keep this user's lookups on
+                # the primary before the row or its cache entry goes away
+                replica.mark_write(r, int(uid))
+            s.execute(delete(SessionRow).where(SessionRow.sid == sid))
             s.commit()
+        session_cache.drop_session(r, sid)
     response.delete_cookie(key=SESSION_COOKIE, path="/")
     return {"ok": True}
 
 
-def _require_admin(request: Request) -> User:
-    if engine is None:
-        raise HTTPException(status_code=503, detail="db not ready")
-    from .session_deps import get_user_from_session_cookie
-
-    sid = request.cookies.get(SESSION_COOKIE)
-    u = get_user_from_session_cookie(engine, sid)
-    if not bool(getattr(u, "is_admin", False)):
-        raise HTTPException(status_code=403, detail="admin required")
-    return u
-
-
 @app.get("/api/admin/signup_requests", response_model=list[SignupRequestOut])
-def admin_list_signup_requests(request: Request, status: str = "pending"):
-    _require_admin(request)
-    if engine is None:
-        raise HTTPException(status_code=503, detail="db not ready")
-
-    status = status.strip().lower()
-    if status not in {"pending", "approved", "rejected", "all"}:
-        raise HTTPException(status_code=400, detail="invalid status")
-
-    with Session(engine) as s:
-        q = select(SignupRequestRow)
-        if status != "all":
-            q = q.where(SignupRequestRow.status == status)
-        rows = s.execute(q.order_by(SignupRequestRow.id.desc())).scalars().all()
-        return [
-            SignupRequestOut(
-                id=r.id,
-                username=r.username,
-                email=r.email,
-                status=r.status,
-                created_at=int(r.created_at),
-            )
-            for r in rows
-        ]
+def admin_list_signup_requests(
+    status: str = "pending",
+    q: str | None = None,
+    match: str = "substring",
+    limit: int | None = Query(default=None, ge=1, le=admin_queries.ADMIN_PAGE_MAX),
+    cursor: int | None = None,
+    admin: User = Depends(read_admin),
+    s: Session = Depends(read_db_session),
+):
+    """Signup requests, newest first.
+
+    With `limit`, pages are keyset-paginated (`X-Next-Cursor`) and
+    `X-Total-Estimate` carries the planner's row estimate for the filter.
+    """
+    base = admin_queries.signup_requests_query(status, q, match)
+
+    def fetch(rs):
+        headers: dict[str, str] = {}
+        rows = rs.execute(admin_queries.signup_requests_page(base, cursor, limit)).all()
+        if limit is not None:
+            if len(rows) > limit:
+                rows = rows[:limit]
+                headers["X-Next-Cursor"] = str(int(rows[-1][0]))
+            sql, params = admin_queries.estimate_sql(base, rs.get_bind().dialect)
+            plan = rs.connection().exec_driver_sql(sql, params).scalar_one()
+            headers["X-Total-Estimate"] = str(admin_queries.plan_rows(plan))
+        return rows, headers
+
+    rows, headers = replica.read(engine, r, int(admin.id), fetch, s)
+    return fast_json.JSONBytesResponse(
+        fast_json.rows_to_json(admin_queries.SIGNUP_REQUEST_FIELDS, rows), headers=headers
+    )
 
 
 @app.post("/api/admin/signup_requests/{req_id}/approve")
-def admin_approve_signup_request(req_id: int, request: Request):
-    _require_admin(request)
-    if engine is None:
-        raise HTTPException(status_code=503, detail="db not ready")
+def admin_approve_signup_request(req_id: int, admin: User = Depends(current_admin), s: Session = Depends(db_session)):
+    req = s.get(SignupRequestRow, req_id)
+    if req is None:
+        raise HTTPException(status_code=404, detail="request not found")
+    if req.status != "pending":
+        return {"ok": True}
 
-    with Session(engine) as s:
-        r = s.get(SignupRequestRow, req_id)
-        if r is None:
-            raise HTTPException(status_code=404, detail="request not found")
-        if r.status != "pending":
-            return {"ok": True}
-
-        # create user (and require verification)
-        import secrets
-
-        code = f"{secrets.randbelow(1_000_000):06d}"
-        u = User(
-            username=r.username,
-            email=r.email,
-            password_hash=r.password_hash,
-            is_admin=False,
-            locked=False,
-            failed_login_count=0,
-            failed_login_window_start=None,
-            must_change_password=False,
-            email_verified=False,
-            email_verification_code_hash=hash_password(code),
-            email_verification_expires_at=now_s() + 15 * 60,
-        )
-        s.add(u)
-        r.status = "approved"
-        s.add(r)
-        s.commit()
+    # create user (and require verification)
+    import secrets
+
+    code = f"{secrets.randbelow(1_000_000):06d}"
+    u = User(
+        username=req.username,
+        email=req.email,
+        password_hash=req.password_hash,
+        is_admin=False,
+        locked=False,
+        failed_login_count=0,
+        failed_login_window_start=None,
+        must_change_password=False,
+        email_verified=False,
+        email_verification_code_hash=hash_password(code),
+        email_verification_expires_at=now_s() + 15 * 60,
+    )
+    s.add(u)
+    req.status = "approved"
+    s.add(req)
+    s.commit()
+    replica.mark_write(r, int(admin.id))
     return {"ok": True, "verification_code": code}
 
 
 @app.post("/api/admin/signup_requests/{req_id}/reject")
-def admin_reject_signup_request(req_id: int, request: Request):
-    _require_admin(request)
-    if engine is None:
-        raise HTTPException(status_code=503, detail="db not ready")
-
-    with Session(engine) as s:
-        r = s.get(SignupRequestRow, req_id)
-        if r is None:
-            raise HTTPException(status_code=404, detail="request not found")
-        if r.status == "pending":
-            r.status = "rejected"
-            s.add(r)
-            s.commit()
+def admin_reject_signup_request(req_id: int, admin: User = Depends(current_admin), s: Session = Depends(db_session)):
+    req = s.get(SignupRequestRow, req_id)
+    if req is None:
+        raise HTTPException(status_code=404, detail="request not found")
+    if req.status == "pending":
+        req.status = "rejected"
+        s.add(req)
+        s.commit()
+    replica.mark_write(r, int(admin.id))
     return {"ok": True}
 
 
 @app.get("/api/admin/users", response_model=list[AdminUserOut])
-def admin_list_users(request: Request):
-    _require_admin(request)
-    if engine is None:
-        raise HTTPException(status_code=503, detail="db not ready")
-
-    with Session(engine) as s:
-        rows = s.execute(select(User).order_by(User.id.asc())).scalars().all()
-        return [
-            AdminUserOut(
-                id=int(u.id),
-                username=u.username,
-                email=u.email,
-                is_admin=bool(u.is_admin),
-                locked=bool(getattr(u, "locked", False)),
-                failed_login_count=int(getattr(u, "failed_login_count", 0) or 0),
-            )
-            for u in rows
-        ]
+def admin_list_users(
+    q: str | None = None,
+    match: str = "substring",
+    locked: bool | None = None,
+    is_admin: bool | None = None,
+    limit: int | None = Query(default=None, ge=1, le=admin_queries.ADMIN_PAGE_MAX),
+    cursor: int | None = None,
+    admin: User = Depends(read_admin),
+    s: Session = Depends(read_db_session),
+):
+    """Users by id. Search `q` matches username or email (`match=prefix|substring`).
+
+    With `limit`, pages are keyset-paginated (`X-Next-Cursor`) and
+    `X-Total-Estimate` carries the planner's row estimate for the filter.
+    """
+    base = admin_queries.users_query(q, match, locked, is_admin)
+
+    def fetch(rs):
+        headers: dict[str, str] = {}
+        rows = rs.execute(admin_queries.users_page(base, cursor, limit)).all()
+        if limit is not None:
+            if len(rows) > limit:
+                rows = rows[:limit]
+                headers["X-Next-Cursor"] = str(int(rows[-1][0]))
+            sql, params = admin_queries.estimate_sql(base, rs.get_bind().dialect)
+            plan = rs.connection().exec_driver_sql(sql, params).scalar_one()
+            headers["X-Total-Estimate"] = str(admin_queries.plan_rows(plan))
+        return rows, headers
+
+    rows, headers = replica.read(engine, r, int(admin.id), fetch, s)
+    fails = login_throttle.failure_counts(r, [int(row[0]) for row in rows])
+    if fails:
+        # live counters from Redis replace the (fallback-only) column
+        rows = [(*row[:5], fails.get(int(row[0]), row[5])) for row in rows]
+    return fast_json.JSONBytesResponse(fast_json.rows_to_json(admin_queries.USER_FIELDS, rows), headers=headers)
 
 
 @app.post("/api/admin/users/{user_id}/unlock")
-def admin_unlock_user(user_id: int, request: Request):
-    _require_admin(request)
-    if engine is None:
-        raise HTTPException(status_code=503, detail="db not ready")
-
-    with Session(engine) as s:
-        u = s.get(User, user_id)
-        if u is None:
-            raise HTTPException(status_code=404, detail="user not found")
-        u.locked = False
-        u.failed_login_count = 0
-        u.failed_login_window_start = None
-        s.add(u)
-        s.commit()
+def admin_unlock_user(user_id: int, admin: User = Depends(current_admin), s: Session = Depends(db_session)):
+    u = s.get(User, user_id)
+    if u is None:
+        raise HTTPException(status_code=404, detail="user not found")
+    u.locked = False
+    u.failed_login_count = 0
+    u.failed_login_window_start = None
+    s.add(u)
+    replica.mark_write(r, user_id)
+    replica.mark_write(r, int(admin.id))
+    s.commit()
+    session_cache.drop_user(r, user_id)
+    login_throttle.reset(r, user_id)
     return {"ok": True}
 
 
 @app.get("/api/me")
-def me(request: Request):
-    if engine is None:
-        raise HTTPException(status_code=503, detail="db not ready")
-    from .session_deps import get_user_from_session_cookie
-
-    sid = request.cookies.get(SESSION_COOKIE)
-    u = get_user_from_session_cookie(engine, sid)
+def me(u: User = Depends(read_user)):
     return {
         "id": int(u.id),
         "username": u.username,
@@ -613,115 +686,409 @@ def me(request: Request):
 
 
 @app.get("/api/todos", response_model=list[TodoOut])
-def list_todos(request: Request):
-    if engine is None:
-        raise HTTPException(status_code=503, detail="db not ready")
-    from .session_deps import get_user_from_session_cookie
+def list_todos(
+    request: Request,
+    limit: int | None = Query(default=None, ge=1, le=500),
+    cursor: str | None = None,
+    done: bool | None = None,
+    priority: str | None = None,
+    sort: str = "newest",
+    u: User = Depends(read_user),
+    s: Session = Depends(read_db_session),
+):
+    """List the user's todos, newest first.
+
+    Without `limit` the full list is returned (legacy behaviour). With `limit`,
+    pages are keyset-paginated: pass the `X-Next-Cursor` response header back
+    as `cursor` to fetch the next page. `sort=oldest|priority` changes the
+    order; `done=false&sort=priority` is "open items, highest priority first".
+    """
+    # conditional GET: the per-user version answers "nothing changed" without the DB
+    headers: dict[str, str] = {}
+    etag = todo_version.etag(r, int(u.id), f"{limit}:{cursor}:{done}:{priority}:{sort}")
+    if etag is not None:
+        headers = {"ETag": etag, "Cache-Control": "private, no-cache"}
+        if todo_version.etag_matches(etag, request.headers.get("if-none-match")):
+            return Response(status_code=304, headers=headers)
+
+    q = todo_queries.list_query(int(u.id), limit, cursor, done, priority, sort)
+
+    # replica unless this user wrote in the last few seconds
+    rows = replica.read(engine, r, int(u.id), lambda rs: rs.execute(q).all(), s)
+    if limit is not None and len(rows) > limit:
+        rows = rows[:limit]
+        headers["X-Next-Cursor"] = todo_queries.list_cursor(rows[-1], sort)
+    # column tuples straight to JSON bytes (no ORM/Pydantic per row)
+    return fast_json.JSONBytesResponse(fast_json.rows_to_json(todo_queries.TODO_FIELDS, rows), headers=headers)
+
+
+@app.get("/api/todos/search", response_model=list[TodoOut])
+def search_todos(
+    request: Request,
+    q: str = Query(min_length=1, max_length=200),
+    limit: int = Query(default=20, ge=1, le=todo_queries.SEARCH_PAGE_MAX),
+    cursor: str | None = None,
+    done: bool | None = None,
+    u: User = Depends(read_user),
+    s: Session = Depends(read_db_session),
+):
+    """Full-text search over the user's todo titles, best match first.
+
+    `q` accepts web-search syntax ("milk -oat", "\"call mom\"", "a or b").
+    Pages are keyset-paginated on (rank, id) via `X-Next-Cursor`.
+    """
+    headers: dict[str, str] = {}
+    etag = todo_version.etag(r, int(u.id), f"search:{q}:{limit}:{cursor}:{done}")
+    if etag is not None:
+        headers = {"ETag": etag, "Cache-Control": "private, no-cache"}
+        if todo_version.etag_matches(etag, request.headers.get("if-none-match")):
+            return Response(status_code=304, headers=headers)
+
+    if not q.strip():
+        raise HTTPException(status_code=400, detail="q is required")
+    stmt = todo_queries.search_query(int(u.id), q.strip(), limit, cursor, done)
+
+    rows = replica.read(engine, r, int(u.id), lambda rs: rs.execute(stmt).all(), s)
+    if len(rows) > limit:
+        rows = rows[:limit]
+        headers["X-Next-Cursor"] = todo_queries.search_cursor(rows[-1][-1], rows[-1][0])
+    return fast_json.JSONBytesResponse(
+        fast_json.rows_to_json(todo_queries.TODO_FIELDS, (row[:-1] for row in rows)), headers=headers
+    )
 
-    sid = request.cookies.get(SESSION_COOKIE)
-    u = get_user_from_session_cookie(engine, sid)
 
-    with Session(engine) as s:
-        rows = (
-            s.execute(select(Todo).where(Todo.user_id == int(u.id)).order_by(Todo.id.desc()))
-            .scalars()
-            .all()
-        )
-        return [
-            TodoOut(
-                id=t.id,
-                title=t.title,
-                done=bool(t.done),
-                priority=str(t.priority or "Medium"),
-                created_at=int(t.created_at),
-            )
-            for t in rows
-        ]
+@app.get("/api/todos/stats", response_model=TodoStatsOut)
+def todo_stats_summary(request: Request, u: User = Depends(read_user), s: Session = Depends(read_db_session)):
+    """Open/done totals per priority, from the todo_counts counters (no COUNT over todos)."""
+    headers: dict[str, str] = {}
+    etag = todo_version.etag(r, int(u.id), "stats")
+    if etag is not None:
+        headers = {"ETag": etag, "Cache-Control": "private, no-cache"}
+        if todo_version.etag_matches(etag, request.headers.get("if-none-match")):
+            return Response(status_code=304, headers=headers)
 
+    totals = replica.read(engine, r, int(u.id), lambda rs: todo_stats.load(rs, int(u.id)), s)
+    return fast_json.JSONBytesResponse(totals, headers=headers)
+
+
+@app.get("/api/todos/export")
+def export_todos(format: str = "ndjson", done: bool | None = None, u: User = Depends(current_user)):
+    """Stream every todo of the user as NDJSON (default) or CSV, oldest first."""
+    from fastapi.responses import StreamingResponse
+
+    fmt = todo_transfer.pick_format(format)
+    # primary: a replica recovery conflict would cut the file short mid-stream
+    return StreamingResponse(
+        todo_transfer.export_chunks(engine, int(u.id), fmt, done),
+        media_type=todo_transfer.FORMATS[fmt],
+        headers={"Content-Disposition": f'attachment; filename="todos.{fmt}"'},
+    )
+
+
+@app.post("/api/todos/import")
+async def import_todos(request: Request, format: str | None = None):
+    """Bulk-load todos from an NDJSON or CSV body (`title`, optional `priority`,
+    `done`, `created_at`) with COPY. All rows are imported or none."""
+    import anyio
+    from starlette.concurrency import run_in_threadpool
 
-@app.post("/api/todos", response_model=TodoOut)
-def create_todo(request: Request, body: TodoCreate):
     if engine is None:
         raise HTTPException(status_code=503, detail="db not ready")
-    from .session_deps import get_user_from_session_cookie
-
     sid = request.cookies.get(SESSION_COOKIE)
-    u = get_user_from_session_cookie(engine, sid)
+    u = await run_in_threadpool(get_user_from_session_cookie, engine, sid, r)
+    uid = int(u.id)
+    fmt = todo_transfer.pick_format(format, request.headers.get("content-type"))
 
+    body = request.stream()
+
+    async def next_chunk() -> bytes | None:
+        try:
+            return await body.__anext__()
+        except StopAsyncIteration:
+            return None
+
+    def chunks():
+        # COPY runs in a worker thread and pulls the body from the event loop
+        # as it goes, so neither side holds the whole upload
+        while (chunk := anyio.from_thread.run(next_chunk)) is not None:
+            if chunk:
+                yield chunk
+
+    n = await run_in_threadpool(todo_transfer.copy_in, engine, uid, fmt, chunks())
+    if n:
+        replica.mark_write(r, uid)
+        todo_version.bump(r, uid)
+        todo_events.publish(r, uid, {"type": "resync"})
+    return {"ok": True, "imported": n}
+
+
+@app.post("/api/todos", response_model=TodoOut)
+def create_todo(body: TodoCreate, u: User = Depends(current_user), s: Session = Depends(db_session)):
     title = body.title.strip()
     if not title:
         raise HTTPException(status_code=400, detail="title is required")
 
-    pr = (body.priority or "Medium").strip().capitalize()
-    if pr not in {"High", "Medium", "Low"}:
-        raise HTTPException(status_code=400, detail="priority must be High|Medium|Low")
-
-    with Session(engine) as s:
-        from sqlalchemy import text
+    pr = todo_queries.normalize_priority(body.priority or "Medium")
 
-        created_at = int(s.execute(text("SELECT EXTRACT(EPOCH FROM NOW())::BIGINT")).scalar_one())
-        t = Todo(user_id=int(u.id), title=title, done=False, priority=pr, created_at=created_at)
-        s.add(t)
-        s.commit()
-        s.refresh(t)
-        return TodoOut(id=t.id, title=t.title, done=bool(t.done), priority=str(t.priority), created_at=int(t.created_at))
+    # one INSERT ... RETURNING; created_at comes from the column default
+    row = s.execute(todo_queries.insert_todo(int(u.id), title, todo_queries.PRIORITY_CODES[pr])).one()
+    s.commit()
+    replica.mark_write(r, int(u.id))
+    todo_version.bump(r, int(u.id))
+    out = TodoOut(id=int(row.id), title=title, done=False, priority=pr, created_at=int(row.created_at))
+    todo_events.publish(r, int(u.id), {"type": "created", "todo": out.model_dump()})
+    return out
 
 
 @app.post("/api/todos/{todo_id}/priority")
-def set_priority(todo_id: int, request: Request, body: TodoPriority):
-    if engine is None:
-        raise HTTPException(status_code=503, detail="db not ready")
-    from .session_deps import get_user_from_session_cookie
+def set_priority(
+    todo_id: int, body: TodoPriority, u: User = Depends(current_user), s: Session = Depends(db_session)
+):
+    pr = todo_queries.normalize_priority(body.priority)
+
+    found = s.execute(
+        todo_queries.update_todo(int(u.id), todo_id, priority_code=todo_queries.PRIORITY_CODES[pr])
+    ).first()
+    if found is None:
+        raise HTTPException(status_code=404, detail="todo not found")
+    s.commit()
+    replica.mark_write(r, int(u.id))
+    todo_version.bump(r, int(u.id))
+    todo_events.publish(r, int(u.id), {"type": "updated", "id": todo_id, "priority": pr})
+    return {"ok": True}
 
-    sid = request.cookies.get(SESSION_COOKIE)
-    u = get_user_from_session_cookie(engine, sid)
 
-    pr = (body.priority or "").strip().capitalize()
-    if pr not in {"High", "Medium", "Low"}:
-        raise HTTPException(status_code=400, detail="priority must be High|Medium|Low")
+@app.post("/api/todos/{todo_id}/toggle")
+def toggle_todo(todo_id: int, u: User = Depends(current_user), s: Session = Depends(db_session)):
+    new_done = s.execute(todo_queries.update_todo(int(u.id), todo_id, done=~Todo.done)).scalar()
+    if new_done is None:
+        raise HTTPException(status_code=404, detail="todo not found")
+    new_done = bool(new_done)
+    s.commit()
+    replica.mark_write(r, int(u.id))
+    todo_version.bump(r, int(u.id))
+    todo_events.publish(r, int(u.id), {"type": "updated", "id": todo_id, "done": new_done})
+    return {"ok": True}
 
-    with Session(engine) as s:
-        t = s.get(Todo, todo_id)
-        if not t or int(t.user_id) != int(u.id):
-            raise HTTPException(status_code=404, detail="todo not found")
-        t.priority = pr
-        s.add(t)
-        s.commit()
-        return {"ok": True}
 
+@app.post("/api/todos/{todo_id}/delete")
+def delete_todo(todo_id: int, u: User = Depends(current_user), s: Session = Depends(db_session)):
+    if s.execute(todo_queries.delete_todo(int(u.id), todo_id)).first() is None:
+        raise HTTPException(status_code=404, detail="todo not found")
+    s.commit()
+    replica.mark_write(r, int(u.id))
+    todo_version.bump(r, int(u.id))
+    todo_events.publish(r, int(u.id), {"type": "deleted", "id": todo_id})
+    return {"ok": True}
 
-@app.post("/api/todos/{todo_id}/toggle")
-def toggle_todo(todo_id: int, request: Request):
-    if engine is None:
-        raise HTTPException(status_code=503, detail="db not ready")
-    from .session_deps import get_user_from_session_cookie
 
-    sid = request.cookies.get(SESSION_COOKIE)
-    u = get_user_from_session_cookie(engine, sid)
+# longer titles would fail the whole statement (DataError), so they fail their op instead
+_TITLE_MAX = Todo.__table__.c.title.type.length
 
-    with Session(engine) as s:
-        t = s.get(Todo, todo_id)
-        if not t or int(t.user_id) != int(u.id):
-            raise HTTPException(status_code=404, detail="todo not found")
-        t.done = not bool(t.done)
-        s.add(t)
-        s.commit()
-        return {"ok": True}
 
+@app.post("/api/todos/batch", response_model=TodoBatchOut)
+def batch_todos(body: TodoBatchIn, u: User = Depends(current_user), s: Session = Depends(db_session)):
+    """Apply many todo operations in one transaction with set-based statements.
+
+    Each id may appear in at most one op per batch; later ops on an id already
+    used fail with "conflicting op". With that, the result is the same as
+    applying the ops one by one in submitted order. Each op gets its own
+    result; invalid or missing items do not abort the others.
+    """
+    from sqlalchemy import ARRAY, Integer, any_, bindparam, delete, insert, text, update
+
+    uid = int(u.id)
+
+    results = [TodoBatchResult(index=i, op=op.op, ok=False, id=op.id) for i, op in enumerate(body.ops)]
+
+    def ids_param(ids):
+        return any_(bindparam("ids", list(ids), type_=ARRAY(Integer)))
+
+    def priority_of(res: TodoBatchResult, priority: str | None) -> str | None:
+        try:
+            return todo_queries.normalize_priority(priority)
+        except HTTPException as exc:
+            res.error = exc.detail
+            return None
+
+    creates: list[tuple[int, str, str]] = []
+    updates: dict[int, tuple[str | None, bool | None]] = {}
+    update_idx: dict[int, list[int]] = {}
+    by_priority: dict[str, dict[int, list[int]]] = {}
+    toggles: dict[int, list[int]] = {}
+    deletes: dict[int, list[int]] = {}
+    claimed: set[int] = set()
+
+    for i, op in enumerate(body.ops):
+        res = results[i]
+        if op.op == "create":
+            title = (op.title or "").strip()
+            if not title:
+                res.error = "title is required"
+            elif len(title) > _TITLE_MAX:
+                res.error = f"title longer than {_TITLE_MAX}"
+            else:
+                pr = priority_of(res, op.priority or "Medium")
+                if pr is not None:
+                    creates.append((i, title, pr))
+            continue
+
+        if op.id is None:
+            res.error = "id is required"
+            continue
+        if op.id in claimed:
+            res.error = "conflicting op: id already used earlier in the batch"
+            continue
+        if op.op == "update":
+            title = op.title.strip() if op.title is not None else None
+            if title == "":
+                res.error = "title is required"
+                continue
+            if title is not None and len(title) > _TITLE_MAX:
+                res.error = f"title longer than {_TITLE_MAX}"
+                continue
+            updates[op.id] = (title, op.done)
+            update_idx[op.id] = [i]
+        elif op.op == "priority":
+            pr = priority_of(res, op.priority)
+            if pr is None:
+                continue
+            by_priority.setdefault(pr, {})[op.id] = [i]
+        elif op.op == "toggle":
+            toggles[op.id] = [i]
+        elif op.op == "delete":
+            deletes[op.id] = [i]
+        claimed.add(op.id)
+
+    def mark(found, index_map: dict[int, list[int]]) -> None:
+        found = set(found)
+        for todo_id, idxs in index_map.items():
+            for i in idxs:
+                if todo_id in found:
+                    results[i].ok = True
+                else:
+                    results[i].error = "todo not found"
+
+    if creates:
+        # created_at from the column default (one NOW() per transaction, so all equal)
+        rows = s.execute(
+            insert(Todo).returning(Todo.id, Todo.created_at, sort_by_parameter_order=True),
+            [
+                {"user_id": uid, "title": t, "done": False, "priority_code": todo_queries.PRIORITY_CODES[pr]}
+                for _, t, pr in creates
+            ],
+        ).all()
+        for (i, title, pr), row in zip(creates, rows):
+            results[i].ok = True
+            results[i].id = int(row.id)
+            results[i].todo = TodoOut(
+                id=int(row.id), title=title, done=False, priority=pr, created_at=int(row.created_at)
+            )
+
+    if updates:
+        found = s.execute(
+            text(
+                """
+                UPDATE todos AS t
+                SET title = COALESCE(v.title, t.title), done = COALESCE(v.done, t.done)
+                FROM unnest(CAST(:ids AS INTEGER[]), CAST(:titles AS VARCHAR[]), CAST(:dones AS BOOLEAN[]))
+                  AS v(id, title, done)
+                WHERE t.id = v.id AND t.user_id = :uid
+                RETURNING t.id
+                """
+            ),
+            {
+                "ids": list(updates),
+                "titles": [v[0] for v in updates.values()],
+                "dones": [v[1] for v in updates.values()],
+                "uid": uid,
+            },
+        ).scalars().all()
+        mark(found, update_idx)
+
+    for pr, idx_map in by_priority.items():
+        if not idx_map:
+            continue
+        found = s.execute(
+            update(Todo)
+            .where(Todo.user_id == uid, Todo.id == ids_param(idx_map))
+            .values(priority_code=todo_queries.PRIORITY_CODES[pr])
+            .returning(Todo.id)
+        ).scalars().all()
+        mark(found, idx_map)
+
+    if toggles:
+        found = s.execute(
+            update(Todo)
+            .where(Todo.user_id == uid, Todo.id == ids_param(toggles))
+            .values(done=~Todo.done)
+            .returning(Todo.id)
+        ).scalars().all()
+        mark(found, toggles)
+
+    if deletes:
+        found = s.execute(
+            delete(Todo).where(Todo.user_id == uid, Todo.id == ids_param(deletes)).returning(Todo.id)
+        ).scalars().all()
+        mark(found, deletes)
+
+    s.commit()
+
+    if any(res.ok for res in results):
+        replica.mark_write(r, uid)
+        todo_version.bump(r, uid)
+        todo_events.publish(r, uid, {"type": "resync"})
+    return TodoBatchOut(results=results)
+
+
+@app.get("/api/todos/events")
+async def todo_events_stream(request: Request):
+    """Server-Sent Events stream of the user's todo changes (see todo_events.py)."""
+    import asyncio
+
+    from fastapi.responses import StreamingResponse
+    from starlette.concurrency import run_in_threadpool
 
-@app.post("/api/todos/{todo_id}/delete")
-def delete_todo(todo_id: int, request: Request):
     if engine is None:
         raise HTTPException(status_code=503, detail="db not ready")
-    from .session_deps import get_user_from_session_cookie
+    if todo_events.hub.connections >= todo_events.SSE_MAX_CONNECTIONS:
+        raise HTTPException(status_code=503, detail="too many event streams", headers={"Retry-After": "5"})
 
     sid = request.cookies.get(SESSION_COOKIE)
-    u = get_user_from_session_cookie(engine, sid)
+    u = await run_in_threadpool(get_user_from_session_cookie, engine, sid, r)
+    uid = int(u.id)
 
-    with Session(engine) as s:
-        t = s.get(Todo, todo_id)
-        if not t or int(t.user_id) != int(u.id):
-            raise HTTPException(status_code=404, detail="todo not found")
-        s.delete(t)
-        s.commit()
-        return {"ok": True}
+    async def stream():
+        q = todo_events.hub.subscribe(uid)
+        try:
+            yield "retry: 3000\n\n"
+            while True:
+                try:
+                    data = await asyncio.wait_for(q.get(), timeout=todo_events.SSE_HEARTBEAT_SECONDS)
+                except asyncio.TimeoutError:
+                    if await request.is_disconnected():
+                        break
+                    yield ": ping\n\n"
+                    continue
+                yield f"event: todo\ndata: {data}\n\n"
+        finally:
+            todo_events.hub.unsubscribe(uid, q)
+
+    return StreamingResponse(
+        stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+if DB_MODE == "async":
+    # Swap the sync handlers above for their async def twins.
+    from .async_routes import router as async_router
+
+    _async_keys = {(rt.path, m) for rt in async_router.routes for m in rt.methods}
+    app.router.routes = [
+        rt
+        for rt in app.router.routes
+        if not (isinstance(rt, APIRoute) and any((rt.path, m) in _async_keys for m in rt.methods))
+    ]
+    app.include_router(async_router)
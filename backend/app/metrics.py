@@ -0,0 +1,281 @@
+from __future__ import annotations
+
+import threading
+import time
+from typing import Callable, Iterable
+
+import redis
+import redis.asyncio as aredis
+from sqlalchemy.pool import AsyncAdaptedQueuePool, QueuePool
+
+# Minimal Prometheus text-format metrics (no client library dependency).
+# Counters/histograms are process-local; scrape every worker, or run one
+# worker per container, as usual for multi-process Python servers.
+
+_lock = threading.Lock()
+_metrics: list = []
+_gauges: list[tuple[str, str, Callable[[], Iterable[tuple[dict, float]]]]] = []
+
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+def _fmt_labels(labels: dict) -> str:
+    if not labels:
+        return ""
+    parts = []
+    for k, v in labels.items():
+        v = str(v).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+        parts.append(f'{k}="{v}"')
+    return "{" + ",".join(parts) + "}"
+
+
+class Counter:
+    def __init__(self, name: str, help: str, labelnames: tuple[str, ...] = ()):
+        self.name, self.help, self.labelnames = name, help, labelnames
+        self._values: dict[tuple, float] = {}
+        _metrics.append(self)
+
+    def inc(self, value: float = 1.0, **labels) -> None:
+        key = tuple(str(labels.get(n, "")) for n in self.labelnames)
+        with _lock:
+            self._values[key] = self._values.get(key, 0.0) + value
+
+    def render(self) -> list[str]:
+        out = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        with _lock:
+            items = list(self._values.items())
+        for key, v in items:
+            out.append(f"{self.name}{_fmt_labels(dict(zip(self.labelnames, key)))} {v}")
+        return out
+
+
+class Histogram:
+    def __init__(self, name: str, help: str, labelnames: tuple[str, ...] = (), buckets=DEFAULT_BUCKETS):
+        self.name, self.help, self.labelnames = name, help, labelnames
+        self.buckets = tuple(buckets)
+        # key -> [bucket counts..., +Inf count, sum]
+        self._values: dict[tuple, list[float]] = {}
+        _metrics.append(self)
+
+    def observe(self, value: float, **labels) -> None:
+        key = tuple(str(labels.get(n, "")) for n in self.labelnames)
+        with _lock:
+            v = self._values.get(key)
+            if v is None:
+                v = self._values[key] = [0.0] * (len(self.buckets) + 2)
+            for i, b in enumerate(self.buckets):
+                if value <= b:
+                    v[i] += 1
+            v[-2] += 1
+            v[-1] += value
+
+    def time(self, **labels):
+        return _Timer(self, labels)
+
+    def render(self) -> list[str]:
+        out = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        with _lock:
+            items = [(k, list(v)) for k, v in self._values.items()]
+        for key, v in items:
+            labels = dict(zip(self.labelnames, key))
+            for i, b in enumerate(self.buckets):
+                out.append(f"{self.name}_bucket{_fmt_labels({**labels, 'le': b})} {v[i]}")
+            out.append(f"{self.name}_bucket{_fmt_labels({**labels, 'le': '+Inf'})} {v[-2]}")
+            out.append(f"{self.name}_count{_fmt_labels(labels)} {v[-2]}")
+            out.append(f"{self.name}_sum{_fmt_labels(labels)} {v[-1]}")
+        return out
+
+
+class _Timer:
+    def __init__(self, hist: Histogram, labels: dict):
+        self.hist, self.labels = hist, labels
+
+    def __enter__(self):
+        self.t0 = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.hist.observe(time.perf_counter() - self.t0, **self.labels)
+        return False
+
+
+def gauge(name: str, help: str, fn: Callable[[], Iterable[tuple[dict, float]]]) -> None:
+    """Register a gauge computed at scrape time; fn yields (labels, value) pairs."""
+    _gauges.append((name, help, fn))
+
+
+def render() -> str:
+    lines: list[str] = []
+    for m in _metrics:
+        lines += m.render()
+    for name, help, fn in _gauges:
+        lines += [f"# HELP {name} {help}", f"# TYPE {name} gauge"]
+        try:
+            samples = list(fn())
+        except Exception:
+            samples = []
+        for labels, value in samples:
+            if value is not None:
+                lines.append(f"{name}{_fmt_labels(labels)} {value}")
+    return "\n".join(lines) + "\n"
+
+
+# --- HTTP -------------------------------------------------------------------
+
+http_requests = Counter("http_requests_total", "HTTP requests by route and status", ("method", "route", "status"))
+http_latency = Histogram("http_request_duration_seconds", "HTTP request latency by route", ("method", "route"))
+
+
+class MetricsMiddleware:
+    """Pure ASGI middleware (streams such as SSE pass through untouched)."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        t0 = time.perf_counter()
+        status = {"code": 500}
+
+        async def _send(message):
+            if message["type"] == "http.response.start":
+                status["code"] = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, _send)
+        finally:
+            route = scope.get("route")
+            # templated path keeps label cardinality bounded
+            path = getattr(route, "path", None) or "unmatched"
+            method = scope.get("method", "")
+            http_requests.inc(method=method, route=path, status=status["code"])
+            http_latency.observe(time.perf_counter() - t0, method=method, route=path)
+
+
+# --- SQLAlchemy pool ----------------------------------------------------------
+
+db_pool_wait = Histogram("db_pool_checkout_wait_seconds", "Time spent waiting for a pooled DB connection", ("pool",))
+
+
+class TimedQueuePool(QueuePool):
+    pool_label = "sync"
+
+    def _do_get(self):
+        t0 = time.perf_counter()
+        try:
+            return super()._do_get()
+        finally:
+            db_pool_wait.observe(time.perf_counter() - t0, pool=self.pool_label)
+
+
+class TimedReplicaQueuePool(TimedQueuePool):
+    pool_label = "replica"
+
+
+class TimedAsyncQueuePool(AsyncAdaptedQueuePool):
+    def _do_get(self):
+        t0 = time.perf_counter()
+        try:
+            return super()._do_get()
+        finally:
+            db_pool_wait.observe(time.perf_counter() - t0, pool="async")
+
+
+_pool_providers: list[Callable[[], dict]] = []
+
+
+def _pools() -> dict:
+    pools: dict = {}
+    for get_pools in _pool_providers:
+        pools.update({name: pool for name, pool in get_pools().items() if pool is not None})
+    return pools
+
+
+def register_pool_gauges(get_pools: Callable[[], dict]) -> None:
+    """Scrape-time gauges for every pool returned by get_pools() ({label: Pool}).
+
+    May be called once per engine owner (main.py, async_routes.py): each
+    metric family is registered once and reports the pools of all providers.
+    """
+    first = not _pool_providers
+    _pool_providers.append(get_pools)
+    if not first:
+        return
+    for stat, help, attr in (
+        ("db_pool_size", "Configured pool size", "size"),
+        ("db_pool_checked_out", "Connections currently checked out", "checkedout"),
+        ("db_pool_overflow", "Connections open beyond pool_size", "overflow"),
+        ("db_pool_checked_in", "Idle connections in the pool", "checkedin"),
+    ):
+        gauge(stat, help, lambda attr=attr: [({"pool": name}, getattr(pool, attr)()) for name, pool in _pools().items()])
+
+
+# --- Redis ------------------------------------------------------------------
+
+redis_latency = Histogram("redis_command_duration_seconds", "Redis command latency", ("command",))
+
+
+class TimedRedis(redis.Redis):
+    """redis.Redis that times single commands (pipelines are timed as PIPELINE)."""
+
+    def execute_command(self, *args, **options):
+        t0 = time.perf_counter()
+        try:
+            return super().execute_command(*args, **options)
+        finally:
+            redis_latency.observe(time.perf_counter() - t0, command=str(args[0]).upper() if args else "")
+
+    def pipeline(self, transaction=True, shard_hint=None):
+        return _TimedPipeline(self.connection_pool, self.response_callbacks, transaction, shard_hint)
+
+
+class _TimedPipeline(redis.client.Pipeline):
+    def execute(self, raise_on_error=True):
+        t0 = time.perf_counter()
+        try:
+            return super().execute(raise_on_error)
+        finally:
+            redis_latency.observe(time.perf_counter() - t0, command="PIPELINE")
+
+
+class TimedAsyncRedis(aredis.Redis):
+    """redis.asyncio twin of TimedRedis (DB_MODE=async)."""
+
+    async def execute_command(self, *args, **options):
+        t0 = time.perf_counter()
+        try:
+            return await super().execute_command(*args, **options)
+        finally:
+            redis_latency.observe(time.perf_counter() - t0, command=str(args[0]).upper() if args else "")
+
+    def pipeline(self, transaction=True, shard_hint=None):
+        return _TimedAsyncPipeline(self.connection_pool, self.response_callbacks, transaction, shard_hint)
+
+
+class _TimedAsyncPipeline(aredis.client.Pipeline):
+    async def execute(self, raise_on_error=True):
+        t0 = time.perf_counter()
+        try:
+            return await super().execute(raise_on_error)
+        finally:
+            redis_latency.observe(time.perf_counter() - t0, command="PIPELINE")
+
+
+# --- auth ---------------------------------------------------------------------
+
+pbkdf2_seconds = Histogram(
+    "pbkdf2_duration_seconds",
+    "PBKDF2 compute time per call (worker process)",
+    ("op",),
+    buckets=(0.01, 0.025, 0.05, 0.1, 0.2, 0.3, 0.5, 1.0, 2.0),
+)
+pbkdf2_wait_seconds = Histogram(
+    "pbkdf2_queue_wait_seconds",
+    "Time a hashing job waited for a pool worker",
+    ("op",),
+    buckets=(0.001, 0.01, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0),
+)
+logins = Counter("login_attempts_total", "Login attempts by outcome", ("outcome",))
+token_checks = Counter("auth_token_checks_total", "AUTH_MODE=token cookie validations by outcome", ("outcome",))
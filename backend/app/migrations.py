@@ -0,0 +1,514 @@
+from __future__ import annotations
+
+import logging
+import os
+import re
+import time
+
+from sqlalchemy import text
+from sqlalchemy.exc import ProgrammingError
+
+from .models import Base
+from .signup_requests import BaseSignup
+
+log = logging.getLogger(__name__)
+
+# Versioned schema migrations.
+#
+# Applied versions are recorded in schema_migrations; a warm boot is a single
+# MAX(version) lookup. Add new steps at the end with the next version number.
+# Steps must be idempotent (IF NOT EXISTS ...): a fresh database gets the
+# current models from the baseline create_all and then replays every step.
+#
+# concurrent=True steps run outside a transaction (AUTOCOMMIT) so they can use
+# CREATE INDEX CONCURRENTLY without blocking writes.
+#
+# contract=True steps remove what the previous release still uses (columns it
+# reads or writes). During a rolling deploy old workers keep running against
+# the migrated schema, so these only run with MIGRATE_CONTRACT=1: set it on a
+# later deploy, once no worker from before the matching expand step is left.
+# Until then migrate() stops in front of them (later steps wait too).
+
+MIGRATE_CONTRACT = os.environ.get("MIGRATE_CONTRACT", "0") == "1"
+
+_STEPS: list[tuple[int, str, bool, bool, object]] = []
+
+
+def step(version: int, name: str, concurrent: bool = False, contract: bool = False):
+    def deco(fn):
+        _STEPS.append((version, name, concurrent, contract, fn))
+        return fn
+
+    return deco
+
+
+def _create_one_concurrently(conn, name: str, ddl: str) -> None:
+    invalid = conn.execute(
+        text(
+            """
+            SELECT 1 FROM pg_class c JOIN pg_index i ON i.indexrelid = c.oid
+            WHERE c.relname = :name AND NOT i.indisvalid
+            """
+        ),
+        {"name": name},
+    ).first()
+    if invalid is not None:
+        conn.execute(text(f"DROP INDEX CONCURRENTLY IF EXISTS {name}"))
+    conn.execute(text(ddl))
+
+
+_INDEX_DDL = re.compile(r"CREATE (UNIQUE )?INDEX CONCURRENTLY IF NOT EXISTS (\w+) ON (\w+) (.*)$", re.S)
+
+
+def create_index_concurrently(conn, name: str, ddl: str) -> None:
+    """Run `CREATE INDEX CONCURRENTLY IF NOT EXISTS <name> ON <table> ...`, retrying a previously failed build.
+
+    A failed concurrent build leaves an INVALID index behind that IF NOT EXISTS
+    would otherwise skip, so drop it first. Partitioned tables (see
+    todo_partitions.py) can't be indexed concurrently; each partition is, and
+    the parent index is then created ON ONLY and the pieces attached.
+    """
+    m = _INDEX_DDL.match(ddl.strip())
+    parts = []
+    if m is not None:
+        parts = list(
+            conn.execute(
+                text(
+                    """
+                    SELECT c.relname FROM pg_inherits h JOIN pg_class c ON c.oid = h.inhrelid
+                    WHERE h.inhparent = to_regclass(:t) ORDER BY c.relname
+                    """
+                ),
+                {"t": m.group(3)},
+            ).scalars()
+        )
+    if not parts:
+        _create_one_concurrently(conn, name, ddl)
+        return
+
+    unique, table, rest = m.group(1) or "", m.group(3), m.group(4)
+    for part in parts:
+        pname = f"{part}_{name}"[:63]
+        _create_one_concurrently(
+            conn, pname, f"CREATE {unique}INDEX CONCURRENTLY IF NOT EXISTS {pname} ON {part} {rest}"
+        )
+    conn.execute(text(f"CREATE {unique}INDEX IF NOT EXISTS {name} ON ONLY {table} {rest}"))
+    for part in parts:
+        pname = f"{part}_{name}"[:63]
+        attached = conn.execute(
+            text(
+                "SELECT 1 FROM pg_inherits WHERE inhrelid = to_regclass(:c) AND inhparent = to_regclass(:p)"
+            ),
+            {"c": pname, "p": name},
+        ).first()
+        if attached is None:
+            conn.execute(text(f"ALTER INDEX {name} ATTACH PARTITION {pname}"))
+
+
+@step(1, "baseline")
+def _baseline(conn) -> None:
+    # tables from the models, plus the columns added during template iterations
+    Base.metadata.create_all(bind=conn)
+    BaseSignup.metadata.create_all(bind=conn)
+    conn.execute(
+        text(
+            """
+            ALTER TABLE todos ADD COLUMN IF NOT EXISTS user_id INTEGER;
+            ALTER TABLE todos ADD COLUMN IF NOT EXISTS priority VARCHAR(8);
+            ALTER TABLE todos ADD COLUMN IF NOT EXISTS created_at BIGINT;
+
+            ALTER TABLE users ADD COLUMN IF NOT EXISTS email VARCHAR(255);
+            ALTER TABLE users ADD COLUMN IF NOT EXISTS is_admin BOOLEAN;
+            ALTER TABLE users ADD COLUMN IF NOT EXISTS locked BOOLEAN;
+            ALTER TABLE users ADD COLUMN IF NOT EXISTS failed_login_count INTEGER;
+            ALTER TABLE users ADD COLUMN IF NOT EXISTS failed_login_window_start BIGINT;
+            ALTER TABLE users ADD COLUMN IF NOT EXISTS must_change_password BOOLEAN;
+            ALTER TABLE users ADD COLUMN IF NOT EXISTS email_verified BOOLEAN;
+            ALTER TABLE users ADD COLUMN IF NOT EXISTS email_verification_code_hash VARCHAR(255);
+            ALTER TABLE users ADD COLUMN IF NOT EXISTS email_verification_expires_at BIGINT;
+            """
+        )
+    )
+
+    # backfill defaults (only rows from before the columns existed)
+    conn.execute(
+        text(
+            """
+            UPDATE todos
+            SET
+              user_id = COALESCE(user_id, 1),
+              priority = COALESCE(priority, 'Medium'),
+              created_at = COALESCE(created_at, EXTRACT(EPOCH FROM NOW())::BIGINT)
+            WHERE user_id IS NULL OR created_at IS NULL OR priority IS NULL;
+
+            UPDATE users
+            SET
+              is_admin = COALESCE(is_admin, false),
+              locked = COALESCE(locked, false),
+              failed_login_count = COALESCE(failed_login_count, 0),
+              must_change_password = COALESCE(must_change_password, false),
+              email_verified = COALESCE(email_verified, true)
+            WHERE is_admin IS NULL OR locked IS NULL OR failed_login_count IS NULL OR must_change_password IS NULL OR email_verified IS NULL;
+            """
+        )
+    )
+
+
+@step(2, "todos_user_id_id_index", concurrent=True)
+def _todos_user_id_id_index(conn) -> None:
+    create_index_concurrently(
+        conn,
+        "ix_todos_user_id_id",
+        "CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_todos_user_id_id ON todos (user_id, id)",
+    )
+
+
+@step(3, "sessions_expires_at_index", concurrent=True)
+def _sessions_expires_at_index(conn) -> None:
+    create_index_concurrently(
+        conn,
+        "ix_sessions_expires_at",
+        "CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_sessions_expires_at ON sessions (expires_at)",
+    )
+
+
+@step(4, "admin_search_indexes", concurrent=True)
+def _admin_search_indexes(conn) -> None:
+    # pg_trgm GIN indexes serve ILIKE '%q%' / 'q%' on username and email. They
+    # live only here (not in the models) so the baseline create_all does not
+    # depend on the extension.
+    try:
+        conn.execute(text("CREATE EXTENSION IF NOT EXISTS pg_trgm"))
+    except Exception as exc:  # noqa: BLE001
+        log.warning("pg_trgm unavailable, admin search will scan: %s", exc)
+    else:
+        for table, col in (("users", "username"), ("users", "email"), ("signup_requests", "username"), ("signup_requests", "email")):
+            name = f"ix_{table}_{col}_trgm"
+            create_index_concurrently(
+                conn,
+                name,
+                f"CREATE INDEX CONCURRENTLY IF NOT EXISTS {name} ON {table} USING gin ({col} gin_trgm_ops)",
+            )
+    create_index_concurrently(
+        conn,
+        "ix_signup_requests_status_id",
+        "CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_signup_requests_status_id ON signup_requests (status, id)",
+    )
+
+
+@step(5, "todos_title_search", concurrent=True)
+def _todos_title_search(conn) -> None:
+    # Nullable column + trigger rather than a STORED generated column: adding
+    # the column is instant and the backfill below runs in small batches
+    # instead of one table rewrite. The config must match todo_queries.SEARCH_CONFIG.
+    conn.execute(text("ALTER TABLE todos ADD COLUMN IF NOT EXISTS title_tsv tsvector"))
+    conn.execute(
+        text(
+            """
+            CREATE OR REPLACE FUNCTION todos_title_tsv() RETURNS trigger LANGUAGE plpgsql AS $$
+            BEGIN
+              NEW.title_tsv := to_tsvector('simple', COALESCE(NEW.title, ''));
+              RETURN NEW;
+            END
+            $$
+            """
+        )
+    )
+    conn.execute(text("DROP TRIGGER IF EXISTS todos_title_tsv ON todos"))
+    conn.execute(
+        text(
+            "CREATE TRIGGER todos_title_tsv BEFORE INSERT OR UPDATE OF title ON todos "
+            "FOR EACH ROW EXECUTE FUNCTION todos_title_tsv()"
+        )
+    )
+
+    # backfill existing rows, one short transaction per batch
+    last = 0
+    while True:
+        hi = conn.execute(
+            text("SELECT MAX(id) FROM (SELECT id FROM todos WHERE id > :last ORDER BY id LIMIT 5000) s"),
+            {"last": last},
+        ).scalar()
+        if hi is None:
+            break
+        conn.execute(
+            text(
+                """
+                UPDATE todos SET title_tsv = to_tsvector('simple', COALESCE(title, ''))
+                WHERE id > :last AND id <= :hi AND title_tsv IS NULL
+                """
+            ),
+            {"last": last, "hi": hi},
+        )
+        last = hi
+
+    # (user_id, title_tsv) in one GIN index needs btree_gin; without it the
+    # per-user filter is applied after the tsvector match
+    try:
+        conn.execute(text("CREATE EXTENSION IF NOT EXISTS btree_gin"))
+    except Exception as exc:  # noqa: BLE001
+        log.warning("btree_gin unavailable, indexing title_tsv alone: %s", exc)
+        create_index_concurrently(
+            conn,
+            "ix_todos_title_tsv",
+            "CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_todos_title_tsv ON todos USING gin (title_tsv)",
+        )
+    else:
+        create_index_concurrently(
+            conn,
+            "ix_todos_user_id_title_tsv",
+            "CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_todos_user_id_title_tsv ON todos USING gin (user_id, title_tsv)",
+        )
+
+
+@step(6, "todos_priority_code", concurrent=True)
+def _todos_priority_code(conn) -> None:
+    # VARCHAR 'High|Medium|Low' -> SMALLINT priority_code (see todo_queries).
+    # The NOT NULL DEFAULT column is added without a rewrite; only non-Medium
+    # rows need the batched backfill.
+    conn.execute(text("ALTER TABLE todos ADD COLUMN IF NOT EXISTS priority_code SMALLINT NOT NULL DEFAULT 2"))
+    has_old = conn.execute(
+        text(
+            """
+            SELECT 1 FROM information_schema.columns
+            WHERE table_schema = current_schema() AND table_name = 'todos' AND column_name = 'priority'
+            """
+        )
+    ).first()
+    if has_old is not None:
+        # Old workers keep reading and writing `priority` until the contract
+        # step (10) drops it, so the trigger syncs both ways: a write that sets
+        # priority (old code) derives priority_code, a write that changes only
+        # priority_code (new code) mirrors it back. Any other update leaves
+        # both alone - rows the backfill below hasn't reached yet still carry
+        # the default code, which must not overwrite their priority.
+        conn.execute(text("ALTER TABLE todos ALTER COLUMN priority DROP NOT NULL"))
+        conn.execute(
+            text(
+                """
+                CREATE OR REPLACE FUNCTION todos_priority_code() RETURNS trigger LANGUAGE plpgsql AS $$
+                BEGIN
+                  IF NEW.priority IS NOT NULL
+                     AND (TG_OP = 'INSERT' OR NEW.priority IS DISTINCT FROM OLD.priority) THEN
+                    NEW.priority_code := CASE initcap(NEW.priority) WHEN 'High' THEN 3 WHEN 'Low' THEN 1 ELSE 2 END;
+                  ELSIF TG_OP = 'INSERT' OR NEW.priority_code IS DISTINCT FROM OLD.priority_code THEN
+                    NEW.priority := CASE NEW.priority_code WHEN 3 THEN 'High' WHEN 1 THEN 'Low' ELSE 'Medium' END;
+                  END IF;
+                  RETURN NEW;
+                END
+                $$
+                """
+            )
+        )
+        conn.execute(text("DROP TRIGGER IF EXISTS todos_priority_code ON todos"))
+        conn.execute(
+            text(
+                "CREATE TRIGGER todos_priority_code BEFORE INSERT OR UPDATE ON todos "
+                "FOR EACH ROW EXECUTE FUNCTION todos_priority_code()"
+            )
+        )
+        last = 0
+        while True:
+            hi = conn.execute(
+                text("SELECT MAX(id) FROM (SELECT id FROM todos WHERE id > :last ORDER BY id LIMIT 5000) s"),
+                {"last": last},
+            ).scalar()
+            if hi is None:
+                break
+            conn.execute(
+                text(
+                    """
+                    UPDATE todos
+                    SET priority_code = CASE initcap(priority) WHEN 'High' THEN 3 WHEN 'Low' THEN 1 ELSE 2 END
+                    WHERE id > :last AND id <= :hi AND initcap(priority) IN ('High', 'Low')
+                    """
+                ),
+                {"last": last, "hi": hi},
+            )
+            last = hi
+
+    create_index_concurrently(
+        conn,
+        "ix_todos_user_done_priority_id",
+        "CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_todos_user_done_priority_id "
+        "ON todos (user_id, done, priority_code, id)",
+    )
+
+
+@step(7, "todo_counts", concurrent=True)
+def _todo_counts(conn) -> None:
+    # Per-user counters behind GET /api/todos/stats (see todo_stats.py).
+    # Statement-level triggers with transition tables: a batch or bulk insert
+    # adjusts each (user, done, priority) bucket once, in a fixed order so
+    # concurrent writers of the same user can't deadlock. No FK to users (a
+    # cascading user delete runs these triggers after the user row is gone).
+    # The TG_TABLE_NAME guard keeps copies of the triggers on a table being
+    # built by todo_partitions.py from counting mirrored rows twice.
+    #
+    # The DDL commits in one short transaction of its own; the counters are
+    # then filled by todo_stats.reconcile, a few hundred users per
+    # transaction, so todo writes are never held up by a full-table count.
+    from . import todo_stats
+
+    with conn.engine.begin() as ddl:
+        _todo_counts_ddl(ddl)
+    todo_stats.reconcile(conn.engine)
+
+
+def _todo_counts_ddl(conn) -> None:
+    conn.execute(
+        text(
+            """
+            CREATE TABLE IF NOT EXISTS todo_counts (
+              user_id INTEGER NOT NULL,
+              done BOOLEAN NOT NULL,
+              priority_code SMALLINT NOT NULL,
+              n INTEGER NOT NULL,
+              PRIMARY KEY (user_id, done, priority_code)
+            )
+            """
+        )
+    )
+    conn.execute(
+        text(
+            """
+            CREATE OR REPLACE FUNCTION todos_counts() RETURNS trigger LANGUAGE plpgsql AS $$
+            BEGIN
+              IF TG_TABLE_NAME <> 'todos' THEN
+                RETURN NULL;
+              END IF;
+              IF TG_OP = 'INSERT' THEN
+                INSERT INTO todo_counts AS c (user_id, done, priority_code, n)
+                SELECT user_id, done, priority_code, COUNT(*) FROM new_rows
+                GROUP BY 1, 2, 3 ORDER BY 1, 2, 3
+                ON CONFLICT (user_id, done, priority_code) DO UPDATE SET n = c.n + EXCLUDED.n;
+              ELSIF TG_OP = 'DELETE' THEN
+                UPDATE todo_counts c SET n = c.n - d.n
+                FROM (
+                  SELECT user_id, done, priority_code, COUNT(*) AS n FROM old_rows
+                  GROUP BY 1, 2, 3
+                ) d
+                WHERE (c.user_id, c.done, c.priority_code) = (d.user_id, d.done, d.priority_code);
+              ELSE
+                INSERT INTO todo_counts AS c (user_id, done, priority_code, n)
+                SELECT user_id, done, priority_code, SUM(k) FROM (
+                  SELECT user_id, done, priority_code, 1 AS k FROM new_rows
+                  UNION ALL
+                  SELECT user_id, done, priority_code, -1 FROM old_rows
+                ) x
+                GROUP BY 1, 2, 3 HAVING SUM(k) <> 0 ORDER BY 1, 2, 3
+                ON CONFLICT (user_id, done, priority_code) DO UPDATE SET n = c.n + EXCLUDED.n;
+              END IF;
+              RETURN NULL;
+            END
+            $$
+            """
+        )
+    )
+    # transition tables allow a single event per trigger
+    for op, ref in (
+        ("INSERT", "NEW TABLE AS new_rows"),
+        ("UPDATE", "NEW TABLE AS new_rows OLD TABLE AS old_rows"),
+        ("DELETE", "OLD TABLE AS old_rows"),
+    ):
+        name = f"todos_counts_{op.lower()}"
+        conn.execute(text(f"DROP TRIGGER IF EXISTS {name} ON todos"))
+        conn.execute(
+            text(f"CREATE TRIGGER {name} AFTER {op} ON todos REFERENCING {ref} FOR EACH STATEMENT EXECUTE FUNCTION todos_counts()")
+        )
+
+
+@step(8, "todos_created_at_default")
+def _todos_created_at_default(conn) -> None:
+    # created_at is filled in by the INSERT itself (see models.Todo), so a todo
+    # write no longer reads NOW() in a separate round trip first. Catalog-only
+    # change; partitions inherit it from the parent.
+    conn.execute(text("ALTER TABLE todos ALTER COLUMN created_at SET DEFAULT (EXTRACT(EPOCH FROM NOW())::BIGINT)"))
+
+
+@step(9, "todos_user_created_at_index", concurrent=True)
+def _todos_user_created_at_index(conn) -> None:
+    # newest/oldest listing keyset on (created_at, id), see todo_queries.list_query
+    create_index_concurrently(
+        conn,
+        "ix_todos_user_created_at_id",
+        "CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_todos_user_created_at_id ON todos (user_id, created_at, id)",
+    )
+
+
+@step(10, "todos_drop_priority", contract=True)
+def _todos_drop_priority(conn) -> None:
+    # contract half of step 6: only once no worker reads or writes `priority`
+    conn.execute(text("DROP TRIGGER IF EXISTS todos_priority_code ON todos"))
+    conn.execute(text("DROP FUNCTION IF EXISTS todos_priority_code()"))
+    conn.execute(text("ALTER TABLE todos DROP COLUMN IF EXISTS priority"))
+
+
+def current_version(engine) -> int:
+    try:
+        with engine.connect() as conn:
+            return int(conn.execute(text("SELECT COALESCE(MAX(version), 0) FROM schema_migrations")).scalar_one())
+    except ProgrammingError:
+        # first boot with the migration runner
+        with engine.begin() as conn:
+            conn.execute(
+                text(
+                    """
+                    CREATE TABLE IF NOT EXISTS schema_migrations (
+                      version INTEGER PRIMARY KEY,
+                      name VARCHAR(128) NOT NULL,
+                      applied_at BIGINT NOT NULL
+                    )
+                    """
+                )
+            )
+        return 0
+
+
+def _record(conn, version: int, name: str) -> None:
+    conn.execute(
+        text(
+            """
+            INSERT INTO schema_migrations (version, name, applied_at)
+            VALUES (:v, :n, :t)
+            ON CONFLICT (version) DO NOTHING
+            """
+        ),
+        {"v": version, "n": name, "t": int(time.time())},
+    )
+
+
+def target_version() -> int:
+    """Last version migrate() applies in this process (it stops before a gated contract step)."""
+    target = 0
+    for version, _, _, contract, _ in sorted(_STEPS, key=lambda st: st[0]):
+        if contract and not MIGRATE_CONTRACT:
+            break
+        target = version
+    return target
+
+
+def migrate(engine) -> list[int]:
+    """Apply pending steps in order; returns the versions applied by this call."""
+    applied: list[int] = []
+    have = current_version(engine)
+    for version, name, concurrent, contract, fn in sorted(_STEPS, key=lambda st: st[0]):
+        if version <= have:
+            continue
+        if contract and not MIGRATE_CONTRACT:
+            log.info(
+                "migrations: stopping before contract step %d (%s); set MIGRATE_CONTRACT=1 once old workers are gone",
+                version,
+                name,
+            )
+            break
+        if concurrent:
+            with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as conn:
+                fn(conn)
+                _record(conn, version, name)
+        else:
+            with engine.begin() as conn:
+                fn(conn)
+                _record(conn, version, name)
+        applied.append(version)
+    return applied
@@ -1,7 +1,8 @@
 from __future__ import annotations
 
-from sqlalchemy import BigInteger, Boolean, Column, ForeignKey, Integer, String
-from sqlalchemy.orm import declarative_base
+from sqlalchemy import BigInteger, Boolean, Column, ForeignKey, Index, Integer, SmallInteger, String, text
+from sqlalchemy.dialects.postgresql import TSVECTOR
+from sqlalchemy.orm import declarative_base, deferred
 
 Base = declarative_base()
 
@@ -37,5 +38,20 @@ class Todo(Base):
     user_id = Column(Integer, ForeignKey("users.id", ondelete="CASCADE"), nullable=False, index=True)
     title = Column(String(256), nullable=False)
     done = Column(Boolean, nullable=False, default=False)
-    priority = Column(String(8), nullable=False, default="Medium")  # High|Medium|Low
-    created_at = Column(BigInteger, nullable=False)  # unix seconds
+    priority_code = Column(SmallInteger, nullable=False, default=2, server_default=text("2"))  # 1 Low, 2 Medium, 3 High
+    # unix seconds; defaulted by the database so INSERT ... RETURNING needs no NOW() lookup first
+    created_at = Column(BigInteger, nullable=False, server_default=text("(EXTRACT(EPOCH FROM NOW())::BIGINT)"))
+    # full-text search vector, maintained by the todos_title_tsv trigger (migrations.py)
+    title_tsv = deferred(Column(TSVECTOR, nullable=True))
+
+    __table_args__ = (
+        # per-user scans in id order (export, ownership lookups)
+        Index("ix_todos_user_id_id", "user_id", "id"),
+        # newest/oldest listing: WHERE user_id = :uid AND (created_at, id) < :cursor
+        Index("ix_todos_user_created_at_id", "user_id", "created_at", "id"),
+        # filtered/sorted listing: WHERE user_id AND done ORDER BY priority_code DESC, id DESC
+        Index("ix_todos_user_done_priority_id", "user_id", "done", "priority_code", "id"),
+    )
+    # ORM identity is (user_id, id) so loads, UPDATEs and DELETEs always filter on
+    # the partition key when todos is hash-partitioned (app/todo_partitions.py)
+    __mapper_args__ = {"primary_key": [user_id, id]}
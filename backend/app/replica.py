@@ -0,0 +1,176 @@
+from __future__ import annotations
+
+import logging
+import os
+import threading
+import time
+
+from sqlalchemy import text
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.orm import Session
+
+from .db import get_replica_engine
+
+# Optional read replica (REPLICA_DATABASE_URL) for read-only handlers.
+# Reads go to the replica only while a background probe sees it reachable and
+# within REPLICA_MAX_LAG_SECONDS of the primary, and never for a user who wrote
+# in the last READ_YOUR_WRITES_SECONDS (Redis marker rw:<uid>, set by
+# mark_write). Anything else - no replica, lag, Redis errors, a failed query -
+# falls back to the primary.
+#   REPLICA_MAX_LAG_SECONDS          replay lag tolerated before failing over
+#   REPLICA_CHECK_INTERVAL_SECONDS   probe period
+#   READ_YOUR_WRITES_SECONDS         marker TTL; keep it above the tolerated lag
+
+log = logging.getLogger(__name__)
+
+REPLICA_MAX_LAG_SECONDS = float(os.environ.get("REPLICA_MAX_LAG_SECONDS", "5"))
+REPLICA_CHECK_INTERVAL_SECONDS = float(os.environ.get("REPLICA_CHECK_INTERVAL_SECONDS", "2"))
+READ_YOUR_WRITES_SECONDS = max(
+    int(os.environ.get("READ_YOUR_WRITES_SECONDS", "10")), int(REPLICA_MAX_LAG_SECONDS) + 1
+)
+
+WRITE_MARKER_KEY = "rw:{uid}"
+
+engine = None
+
+_stop = threading.Event()
+_thread: threading.Thread | None = None
+_lock = threading.Lock()
+_stats = {
+    "configured": False,
+    "healthy": False,
+    "lag_seconds": None,
+    "last_check_at": None,
+    "last_error": None,
+    "failovers": 0,
+}
+
+# replay lag; 0 when the standby has replayed everything it received (an idle
+# primary would otherwise look more and more "behind")
+_LAG_SQL = text(
+    """
+    SELECT CASE
+      WHEN NOT pg_is_in_recovery() THEN 0
+      WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0
+      ELSE COALESCE(EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()), 0)
+    END
+    """
+)
+
+
+def _set_health(healthy: bool, lag: float | None = None, error: str | None = None) -> None:
+    with _lock:
+        if _stats["healthy"] and not healthy:
+            _stats["failovers"] += 1
+            log.warning("read replica disabled: %s", error or f"lag {lag:.1f}s")
+        _stats["healthy"] = healthy
+        _stats["lag_seconds"] = None if lag is None else round(lag, 3)
+        _stats["last_check_at"] = int(time.time())
+        _stats["last_error"] = error
+
+
+def check() -> bool:
+    """Probe the replica once and update its health; returns whether reads may use it."""
+    if engine is None:
+        return False
+    try:
+        with engine.connect() as conn:
+            lag = float(conn.execute(_LAG_SQL).scalar_one())
+    except Exception as exc:  # noqa: BLE001
+        _set_health(False, error=str(exc).splitlines()[0])
+        return False
+    ok = lag <= REPLICA_MAX_LAG_SECONDS
+    _set_health(ok, lag, None if ok else f"lag {lag:.1f}s")
+    return ok
+
+
+def _loop() -> None:
+    while not _stop.wait(REPLICA_CHECK_INTERVAL_SECONDS):
+        check()
+
+
+def start() -> None:
+    global engine, _thread
+    if engine is None:
+        engine = get_replica_engine()
+    if engine is None or (_thread is not None and _thread.is_alive()):
+        return
+    with _lock:
+        _stats["configured"] = True
+    check()
+    _stop.clear()
+    _thread = threading.Thread(target=_loop, name="replica-health", daemon=True)
+    _thread.start()
+
+
+def stop() -> None:
+    _stop.set()
+    if engine is not None:
+        engine.dispose()
+
+
+def stats() -> dict:
+    with _lock:
+        return dict(_stats)
+
+
+def healthy() -> bool:
+    with _lock:
+        return engine is not None and _stats["healthy"]
+
+
+def mark_write(r, uid: int) -> None:
+    """Pin uid's reads to the primary for READ_YOUR_WRITES_SECONDS.
+
+    Call it before the write becomes visible elsewhere (the commit, a
+    session_cache drop, todo_version.bump), so no reader can get between the
+    two and serve or re-cache a stale replica row.
+    """
+    if r is None or engine is None:
+        return
+    try:
+        r.set(WRITE_MARKER_KEY.format(uid=int(uid)), "1", ex=READ_YOUR_WRITES_SECONDS)
+    except Exception:
+        pass
+
+
+def recently_wrote(r, uid: int) -> bool:
+    if r is None:
+        return True
+    try:
+        return bool(r.exists(WRITE_MARKER_KEY.format(uid=int(uid))))
+    except Exception:
+        # can't tell: be safe and read from the primary
+        return True
+
+
+def read_engine(primary, r=None, uid: int | None = None):
+    """Engine a read for `uid` (None: not user-specific) should use."""
+    if not healthy():
+        return primary
+    if uid is not None and recently_wrote(r, uid):
+        return primary
+    return engine
+
+
+def read(primary, r, uid: int | None, fn, session=None):
+    """Run fn(session) on the engine picked by read_engine(), reusing `session`
+    (the request's Session) when it is bound there; if the replica fails
+    mid-request (gone, or a recovery conflict) retry once on the primary."""
+    eng = read_engine(primary, r, uid)
+
+    def run(e):
+        if session is not None and session.get_bind() is e:
+            return fn(session)
+        with Session(e) as s:
+            return fn(s)
+
+    if eng is primary:
+        return run(primary)
+    try:
+        return run(eng)
+    except OperationalError as exc:
+        if session is not None and session.get_bind() is eng:
+            session.rollback()
+        _set_health(False, error=str(exc.orig or exc).splitlines()[0])
+        return run(primary)
@@ -1,6 +1,8 @@
 from __future__ import annotations
 
-from pydantic import BaseModel
+from typing import Literal
+
+from pydantic import BaseModel, Field
 
 
 class AuthIn(BaseModel):
@@ -52,3 +54,45 @@ class TodoOut(BaseModel):
     done: bool
     priority: str
     created_at: int
+
+
+class TodoPriorityCounts(BaseModel):
+    open: int
+    done: int
+    total: int
+
+
+class TodoStatsOut(BaseModel):
+    total: int
+    open: int
+    done: int
+    by_priority: dict[str, TodoPriorityCounts]  # High|Medium|Low
+
+
+class TodoBatchOp(BaseModel):
+    op: Literal["create", "update", "toggle", "priority", "delete"]
+    id: int | None = None  # required for everything but create
+    title: str | None = None
+    done: bool | None = None
+    priority: str | None = None  # High|Medium|Low
+
+
+BATCH_MAX_OPS = 1000
+
+
+class TodoBatchIn(BaseModel):
+    # validated while parsing, so an oversized body is rejected (422) early
+    ops: list[TodoBatchOp] = Field(max_length=BATCH_MAX_OPS)
+
+
+class TodoBatchResult(BaseModel):
+    index: int
+    op: str
+    ok: bool
+    id: int | None = None
+    error: str | None = None
+    todo: TodoOut | None = None  # set for create
+
+
+class TodoBatchOut(BaseModel):
+    results: list[TodoBatchResult]
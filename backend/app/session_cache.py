@@ -0,0 +1,220 @@
+from __future__ import annotations
+
+import json
+
+from . import token_auth
+from .auth_sessions import now_s
+from .models import User
+
+# Redis cache in front of the sessions/users lookup done on every request.
+#   sess:<sid>   -> JSON user snapshot, TTL tied to SessionRow.expires_at
+#   usess:<uid>  -> set of cached sids for that user (for bulk invalidation)
+#   sessgen      -> invalidation counter, bumped by every drop_*
+#   sdrop:<sid>, udrop:<uid> -> sessgen value of the last drop, kept briefly
+# A lookup reads sessgen before going to the DB and store() skips the write if
+# the session or user was dropped since (checked atomically in Lua), so a
+# lookup racing a logout/password change can't put the old row back.
+# Redis errors are swallowed: the DB stays the source of truth.
+# The a* variants take a redis.asyncio client (DB_MODE=async).
+
+SESSION_KEY = "sess:{sid}"
+USER_SESSIONS_KEY = "usess:{uid}"
+GEN_KEY = "sessgen"
+SESSION_DROP_KEY = "sdrop:{sid}"
+USER_DROP_KEY = "udrop:{uid}"
+
+# how long a drop marker is kept: longer than any single session lookup
+DROP_MARK_SECONDS = 60
+
+# INCR sessgen and remember the value on the dropped session/user
+_MARK_LUA = """
+local g = redis.call('INCR', KEYS[1])
+redis.call('SET', KEYS[2], g, 'EX', ARGV[1])
+return g
+"""
+
+# write the snapshot unless the session or user was dropped after `since`
+_STORE_LUA = """
+local since = tonumber(ARGV[1])
+for i = 3, 4 do
+  local g = redis.call('GET', KEYS[i])
+  if g and tonumber(g) > since then
+    return 0
+  end
+end
+redis.call('SET', KEYS[1], ARGV[2], 'EX', ARGV[3])
+redis.call('SADD', KEYS[2], ARGV[4])
+-- the index only needs to outlive the longest cached session
+redis.call('EXPIRE', KEYS[2], ARGV[3], 'GT')
+redis.call('EXPIRE', KEYS[2], ARGV[3], 'NX')
+return 1
+"""
+
+# fields safe to cache (never the password hash or verification secrets)
+_USER_FIELDS = ("id", "username", "email", "is_admin", "locked", "must_change_password", "email_verified")
+
+
+def _encode(u: User, expires_at: int) -> str:
+    return json.dumps(
+        {
+            "id": int(u.id),
+            "username": u.username,
+            "email": u.email,
+            "is_admin": bool(getattr(u, "is_admin", False)),
+            "locked": bool(getattr(u, "locked", False)),
+            "must_change_password": bool(getattr(u, "must_change_password", False)),
+            "email_verified": bool(getattr(u, "email_verified", True)),
+            "exp": int(expires_at),
+        }
+    )
+
+
+def _decode(raw: str | None) -> User | None:
+    if not raw:
+        return None
+    try:
+        data = json.loads(raw)
+    except ValueError:
+        return None
+    if int(data.get("exp", 0)) < now_s():
+        return None
+    # transient (detached) User carrying only the cached fields
+    return User(**{k: data[k] for k in _USER_FIELDS if k in data})
+
+
+def _store_call(sid: str, u: User, expires_at: int, ttl: int, since: int) -> dict:
+    uid = int(u.id)
+    return {
+        "keys": [
+            SESSION_KEY.format(sid=sid),
+            USER_SESSIONS_KEY.format(uid=uid),
+            SESSION_DROP_KEY.format(sid=sid),
+            USER_DROP_KEY.format(uid=uid),
+        ],
+        "args": [int(since), _encode(u, expires_at), ttl, sid],
+    }
+
+
+def _parse_gen(raw) -> int:
+    return int(raw or 0)
+
+
+def load(r, sid: str) -> User | None:
+    if r is None:
+        return None
+    try:
+        return _decode(r.get(SESSION_KEY.format(sid=sid)))
+    except Exception:
+        return None
+
+
+def generation(r) -> int | None:
+    """Invalidation counter to pass to store(); read it before the DB lookup."""
+    if r is None:
+        return None
+    try:
+        return _parse_gen(r.get(GEN_KEY))
+    except Exception:
+        return None
+
+
+def store(r, sid: str, u: User, expires_at: int, since: int | None) -> None:
+    ttl = int(expires_at) - now_s()
+    if r is None or since is None or ttl <= 0:
+        return
+    try:
+        r.register_script(_STORE_LUA)(**_store_call(sid, u, expires_at, ttl, since))
+    except Exception:
+        pass
+
+
+def _mark(r, marker_key: str) -> None:
+    r.register_script(_MARK_LUA)(keys=[GEN_KEY, marker_key], args=[DROP_MARK_SECONDS])
+
+
+def drop_session(r, sid: str) -> None:
+    if r is None or not sid:
+        return
+    try:
+        _mark(r, SESSION_DROP_KEY.format(sid=sid))
+        r.delete(SESSION_KEY.format(sid=sid))
+    except Exception:
+        pass
+
+
+def drop_user(r, user_id: int) -> None:
+    """Invalidate every cached session of a user (password change, flag changes)."""
+    if r is None:
+        return
+    # AUTH_MODE=token: tokens are client-held snapshots of the same data
+    token_auth.revoke_user(r, user_id)
+    ukey = USER_SESSIONS_KEY.format(uid=int(user_id))
+    try:
+        # mark first: a store racing with the deletes below sees the marker
+        _mark(r, USER_DROP_KEY.format(uid=int(user_id)))
+        sids = r.smembers(ukey)
+        p = r.pipeline(transaction=False)
+        for sid in sids:
+            p.delete(SESSION_KEY.format(sid=sid))
+        p.delete(ukey)
+        p.execute()
+    except Exception:
+        pass
+
+
+async def aload(ar, sid: str) -> User | None:
+    if ar is None:
+        return None
+    try:
+        return _decode(await ar.get(SESSION_KEY.format(sid=sid)))
+    except Exception:
+        return None
+
+
+async def ageneration(ar) -> int | None:
+    if ar is None:
+        return None
+    try:
+        return _parse_gen(await ar.get(GEN_KEY))
+    except Exception:
+        return None
+
+
+async def astore(ar, sid: str, u: User, expires_at: int, since: int | None) -> None:
+    ttl = int(expires_at) - now_s()
+    if ar is None or since is None or ttl <= 0:
+        return
+    try:
+        await ar.register_script(_STORE_LUA)(**_store_call(sid, u, expires_at, ttl, since))
+    except Exception:
+        pass
+
+
+async def _amark(ar, marker_key: str) -> None:
+    await ar.register_script(_MARK_LUA)(keys=[GEN_KEY, marker_key], args=[DROP_MARK_SECONDS])
+
+
+async def adrop_session(ar, sid: str) -> None:
+    if ar is None or not sid:
+        return
+    try:
+        await _amark(ar, SESSION_DROP_KEY.format(sid=sid))
+        await ar.delete(SESSION_KEY.format(sid=sid))
+    except Exception:
+        pass
+
+
+async def adrop_user(ar, user_id: int) -> None:
+    if ar is None:
+        return
+    ukey = USER_SESSIONS_KEY.format(uid=int(user_id))
+    try:
+        await _amark(ar, USER_DROP_KEY.format(uid=int(user_id)))
+        sids = await ar.smembers(ukey)
+        p = ar.pipeline(transaction=False)
+        for sid in sids:
+            p.delete(SESSION_KEY.format(sid=sid))
+        p.delete(ukey)
+        await p.execute()
+    except Exception:
+        pass
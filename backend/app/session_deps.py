@@ -2,20 +2,108 @@ from __future__ import annotations
 
 from fastapi import Cookie, HTTPException
 from sqlalchemy import select
+from sqlalchemy.exc import OperationalError
 from sqlalchemy.orm import Session
 
+from . import replica, session_cache, token_auth
 from .auth_sessions import SessionRow, now_s
 from .models import User
 
 
-def get_user_from_session_cookie(engine, sid: str | None) -> User:
+def _lookup(s: Session, sid: str) -> tuple[User, int]:
+    row = s.execute(select(SessionRow).where(SessionRow.sid == sid)).scalars().first()
+    if row is None or int(row.expires_at) < now_s():
+        raise HTTPException(status_code=401, detail="session expired")
+    u = s.get(User, int(row.user_id))
+    if u is None:
+        raise HTTPException(status_code=401, detail="user missing")
+    return u, int(row.expires_at)
+
+
+def _lookup_on(engine, sid: str, session: Session | None) -> tuple[User, int]:
+    if session is not None:
+        return _lookup(session, sid)
+    with Session(engine) as s:
+        return _lookup(s, sid)
+
+
+def get_user_from_session_cookie(
+    engine, sid: str | None, cache=None, read_engine=None, session: Session | None = None
+) -> User:
+    """Resolve the session cookie to a User.
+
+    `cache` is an optional Redis client; on a hit no DB round trip is made.
+    `read_engine` (a read replica) is tried before `engine` on a cache miss.
+    `session` is the request's Session (main.db_session / read_db_session):
+    the lookup runs on it instead of checking out another connection, and if
+    it is bound to the replica it takes the place of `read_engine`.
+    With AUTH_MODE=token the cookie is a signed token instead (token_auth).
+    """
     if not sid:
         raise HTTPException(status_code=401, detail="not logged in")
-    with Session(engine) as s:
-        row = s.execute(select(SessionRow).where(SessionRow.sid == sid)).scalars().first()
+    if token_auth.enabled():
+        return _user_from_token(engine, sid, cache, session)
+    u = session_cache.load(cache, sid)
+    if u is not None:
+        return u
+    # before the DB read: a logout committing meanwhile must win over our store
+    since = session_cache.generation(cache)
+    primary_s = session if session is not None and session.get_bind() is engine else None
+    replica_s = session if session is not None and primary_s is None else None
+    if replica_s is not None:
+        read_engine = replica_s.get_bind()
+    found = None
+    if read_engine is not None and read_engine is not engine:
+        try:
+            found = _lookup_on(read_engine, sid, replica_s)
+        except (HTTPException, OperationalError):
+            # a fresh login may not have replicated yet: the primary decides
+            if replica_s is not None:
+                replica_s.rollback()
+            found = None
+        if found is not None and replica.recently_wrote(cache, int(found[0].id)):
+            # logout/password change/lock just happened: don't trust (or cache) the replica
+            found = None
+    if found is None:
+        found = _lookup_on(engine, sid, primary_s)
+    u, expires_at = found
+    session_cache.store(cache, sid, u, expires_at, since)
+    return u
+
+
+def _user_from_token(engine, cookie: str, cache, session: Session | None) -> User:
+    # AUTH_MODE=token: the cookie is a signed token; the DB is only read to renew it
+    claims = token_auth.decode(cookie)
+    if claims is None:
+        raise HTTPException(status_code=401, detail="session expired")
+    state = token_auth.check(cache, claims)
+    if state == "denied":
+        raise HTTPException(status_code=401, detail="session expired")
+    if state == "ok":
+        return token_auth.user_from_claims(claims)
+    # renew on the primary: a revocation may not have replicated yet
+    sid = str(claims["sid"])
+    u, expires_at = _lookup_on(engine, sid, session if session is not None and session.get_bind() is engine else None)
+    token_auth.set_refreshed(token_auth.issue(u, sid, expires_at), expires_at - now_s())
+    return u
+
+
+async def aget_user_from_session_cookie(aengine, sid: str | None, cache=None) -> User:
+    """Async twin of get_user_from_session_cookie (AsyncEngine + redis.asyncio)."""
+    from sqlalchemy.ext.asyncio import AsyncSession
+
+    if not sid:
+        raise HTTPException(status_code=401, detail="not logged in")
+    u = await session_cache.aload(cache, sid)
+    if u is not None:
+        return u
+    since = await session_cache.ageneration(cache)
+    async with AsyncSession(aengine) as s:
+        row = (await s.execute(select(SessionRow).where(SessionRow.sid == sid))).scalars().first()
         if row is None or int(row.expires_at) < now_s():
             raise HTTPException(status_code=401, detail="session expired")
-        u = s.get(User, int(row.user_id))
+        u = await s.get(User, int(row.user_id))
         if u is None:
             raise HTTPException(status_code=401, detail="user missing")
+        await session_cache.astore(cache, sid, u, int(row.expires_at), since)
         return u
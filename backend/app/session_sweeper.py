@@ -0,0 +1,111 @@
+from __future__ import annotations
+
+import logging
+import os
+import threading
+import time
+
+from sqlalchemy import text
+
+from .auth_sessions import now_s
+
+# Background deletion of expired SessionRow rows. Each batch is its own short
+# transaction and uses SKIP LOCKED, so several workers can sweep at once
+# without waiting on each other or holding long locks.
+#   SESSION_SWEEP_INTERVAL_SECONDS  pause between sweeps (0 disables the sweeper)
+#   SESSION_SWEEP_BATCH             rows deleted per transaction
+
+log = logging.getLogger(__name__)
+
+SESSION_SWEEP_INTERVAL_SECONDS = float(os.environ.get("SESSION_SWEEP_INTERVAL_SECONDS", "300"))
+SESSION_SWEEP_BATCH = int(os.environ.get("SESSION_SWEEP_BATCH", "1000"))
+# breather between batches of one sweep
+_BATCH_PAUSE_SECONDS = 0.05
+
+_stop = threading.Event()
+_thread: threading.Thread | None = None
+_lock = threading.Lock()
+_stats = {
+    "removed_total": 0,
+    "sweeps": 0,
+    "last_sweep_at": None,
+    "last_sweep_removed": 0,
+    "last_sweep_seconds": None,
+    "table_rows_estimate": None,
+    "table_bytes": None,
+}
+
+
+def sweep(engine) -> int:
+    """Delete expired sessions in bounded batches; returns rows removed."""
+    t0 = time.perf_counter()
+    removed = 0
+    while not _stop.is_set():
+        with engine.begin() as conn:
+            n = conn.execute(
+                text(
+                    """
+                    DELETE FROM sessions
+                    WHERE sid IN (
+                      SELECT sid FROM sessions
+                      WHERE expires_at < :now
+                      LIMIT :batch
+                      FOR UPDATE SKIP LOCKED
+                    )
+                    """
+                ),
+                {"now": now_s(), "batch": SESSION_SWEEP_BATCH},
+            ).rowcount
+        removed += int(n or 0)
+        if not n or n < SESSION_SWEEP_BATCH:
+            break
+        time.sleep(_BATCH_PAUSE_SECONDS)
+
+    with engine.connect() as conn:
+        size = conn.execute(
+            text(
+                """
+                SELECT c.reltuples::BIGINT, pg_total_relation_size(c.oid)
+                FROM pg_class c WHERE c.oid = to_regclass('sessions')
+                """
+            )
+        ).first()
+
+    with _lock:
+        _stats["removed_total"] += removed
+        _stats["sweeps"] += 1
+        _stats["last_sweep_at"] = now_s()
+        _stats["last_sweep_removed"] = removed
+        _stats["last_sweep_seconds"] = round(time.perf_counter() - t0, 3)
+        if size is not None:
+            _stats["table_rows_estimate"] = max(int(size[0]), 0)
+            _stats["table_bytes"] = int(size[1])
+    return removed
+
+
+def _loop(engine) -> None:
+    while not _stop.wait(SESSION_SWEEP_INTERVAL_SECONDS):
+        try:
+            n = sweep(engine)
+            if n:
+                log.info("session sweeper removed %d expired sessions", n)
+        except Exception as exc:  # noqa: BLE001
+            log.warning("session sweep failed: %s", exc)
+
+
+def start(engine) -> None:
+    global _thread
+    if SESSION_SWEEP_INTERVAL_SECONDS <= 0 or (_thread is not None and _thread.is_alive()):
+        return
+    _stop.clear()
+    _thread = threading.Thread(target=_loop, args=(engine,), name="session-sweeper", daemon=True)
+    _thread.start()
+
+
+def stop() -> None:
+    _stop.set()
+
+
+def stats() -> dict:
+    with _lock:
+        return dict(_stats)
@@ -1,6 +1,6 @@
 from __future__ import annotations
 
-from sqlalchemy import BigInteger, Column, Integer, String
+from sqlalchemy import BigInteger, Column, Index, Integer, String
 from sqlalchemy.orm import declarative_base
 
 # use separate base so we can create table explicitly without touching other metadata
@@ -16,3 +16,8 @@ class SignupRequestRow(BaseSignup):
     password_hash = Column(String(255), nullable=False)
     status = Column(String(16), nullable=False, default="pending")  # pending|approved|rejected
     created_at = Column(BigInteger, nullable=False)  # unix seconds
+
+    __table_args__ = (
+        # admin listing: WHERE status = :s ORDER BY id DESC
+        Index("ix_signup_requests_status_id", "status", "id"),
+    )
@@ -0,0 +1,182 @@
+from __future__ import annotations
+
+import cProfile
+import inspect
+import logging
+import os
+import re
+import time
+from contextvars import ContextVar
+
+from fastapi.routing import APIRoute
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+# Per-request SQL accounting. Engine-level cursor events count statements and
+# DB time for whatever request is running (sync threadpool handlers and the
+# async engine's greenlets both inherit the request's contextvars).
+#   SQL_PROFILE_HEADERS    add X-DB-Queries / X-DB-Time-Ms to responses (default on in dev)
+#   SLOW_REQUEST_MS        log requests slower than this, with their SQL (0 = off)
+#   SLOW_REQUEST_QUERIES   log requests running at least this many statements (0 = off)
+#   CPROFILE_ENABLED       honour "X-Profile: 1" and write a cProfile dump (default on in dev)
+#   PROFILE_DIR            where dumps go
+
+_DEV = os.environ.get("APP_ENV", "dev") == "dev"
+SQL_PROFILE_HEADERS = os.environ.get("SQL_PROFILE_HEADERS", "1" if _DEV else "0") == "1"
+SLOW_REQUEST_MS = float(os.environ.get("SLOW_REQUEST_MS", "500"))
+SLOW_REQUEST_QUERIES = int(os.environ.get("SLOW_REQUEST_QUERIES", "25"))
+CPROFILE_ENABLED = os.environ.get("CPROFILE_ENABLED", "1" if _DEV else "0") == "1"
+PROFILE_DIR = os.environ.get("PROFILE_DIR", "/tmp/profiles")
+
+# bound what a single request keeps around for the slow log
+_MAX_STATEMENTS = 100
+_MAX_SQL_CHARS = 500
+
+log = logging.getLogger(__name__)
+
+
+class _RequestStats:
+    __slots__ = ("queries", "db_seconds", "statements", "profiler")
+
+    def __init__(self):
+        self.queries = 0
+        self.db_seconds = 0.0
+        self.statements: list[tuple[float, str]] = []
+        self.profiler: cProfile.Profile | None = None
+
+
+_current: ContextVar[_RequestStats | None] = ContextVar("sql_profile", default=None)
+
+
+@event.listens_for(Engine, "before_cursor_execute")
+def _before(conn, cursor, statement, parameters, context, executemany):
+    # on the per-statement context, not conn.info: a failed statement never
+    # reaches _after, and its start time must not outlive it on a pooled connection
+    if context is not None and _current.get() is not None:
+        context._sql_profile_t0 = time.perf_counter()
+
+
+@event.listens_for(Engine, "after_cursor_execute")
+def _after(conn, cursor, statement, parameters, context, executemany):
+    st = _current.get()
+    t0 = getattr(context, "_sql_profile_t0", None)
+    if st is None or t0 is None:
+        return
+    dt = time.perf_counter() - t0
+    st.queries += 1
+    st.db_seconds += dt
+    if len(st.statements) < _MAX_STATEMENTS:
+        st.statements.append((dt, " ".join(statement.split())[:_MAX_SQL_CHARS]))
+
+
+class ProfiledRoute(APIRoute):
+    """APIRoute whose endpoint runs under the request's profiler when one was asked for.
+
+    Sync endpoints execute on a threadpool thread, so the profiler has to be
+    enabled there rather than in the middleware. Async endpoints share the
+    event loop thread, so their dumps may include other requests' coroutines.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        # swap the call after construction so FastAPI still inspects the
+        # original function's signature and annotations
+        call = self.dependant.call
+        if inspect.iscoroutinefunction(call):
+
+            async def profiled(**values):
+                prof = _profiler()
+                if prof is None:
+                    return await call(**values)
+                prof.enable()
+                try:
+                    return await call(**values)
+                finally:
+                    prof.disable()
+
+        else:
+
+            def profiled(**values):
+                prof = _profiler()
+                if prof is None:
+                    return call(**values)
+                prof.enable()
+                try:
+                    return call(**values)
+                finally:
+                    prof.disable()
+
+        self.dependant.call = profiled
+
+
+def _profiler() -> cProfile.Profile | None:
+    st = _current.get()
+    return st.profiler if st is not None else None
+
+
+def _dump_name(method: str, path: str) -> str:
+    slug = re.sub(r"[^A-Za-z0-9]+", "_", path).strip("_") or "root"
+    return f"{int(time.time() * 1000)}-{method}-{slug}.prof"
+
+
+class SQLProfileMiddleware:
+    """Pure ASGI middleware opening the per-request stats scope."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+
+        st = _RequestStats()
+        token = _current.set(st)
+        t0 = time.perf_counter()
+        method = scope.get("method", "")
+        path = scope.get("path", "")
+
+        dump_path = None
+        if CPROFILE_ENABLED and (b"x-profile", b"1") in scope.get("headers", ()):
+            st.profiler = cProfile.Profile()
+            dump_path = os.path.join(PROFILE_DIR, _dump_name(method, path))
+
+        async def _send(message):
+            if message["type"] == "http.response.start":
+                extra = []
+                if SQL_PROFILE_HEADERS:
+                    extra += [
+                        (b"x-db-queries", str(st.queries).encode()),
+                        (b"x-db-time-ms", f"{st.db_seconds * 1000:.1f}".encode()),
+                    ]
+                if dump_path is not None:
+                    extra.append((b"x-profile-file", os.path.basename(dump_path).encode()))
+                if extra:
+                    message = {**message, "headers": [*message.get("headers", []), *extra]}
+            await send(message)
+
+        try:
+            await self.app(scope, receive, _send)
+        finally:
+            _current.reset(token)
+            elapsed_ms = (time.perf_counter() - t0) * 1000
+            if dump_path is not None:
+                try:
+                    os.makedirs(PROFILE_DIR, exist_ok=True)
+                    st.profiler.dump_stats(dump_path)
+                except Exception:
+                    log.exception("could not write profile %s", dump_path)
+            slow = SLOW_REQUEST_MS > 0 and elapsed_ms >= SLOW_REQUEST_MS
+            chatty = SLOW_REQUEST_QUERIES > 0 and st.queries >= SLOW_REQUEST_QUERIES
+            if slow or chatty:
+                lines = [f"  {dt * 1000:8.1f} ms  {sql}" for dt, sql in st.statements]
+                if st.queries > len(st.statements):
+                    lines.append(f"  ... {st.queries - len(st.statements)} more")
+                log.warning(
+                    "slow request %s %s: %.1f ms, %d queries, %.1f ms in DB\n%s",
+                    method,
+                    path,
+                    elapsed_ms,
+                    st.queries,
+                    st.db_seconds * 1000,
+                    "\n".join(lines),
+                )
@@ -0,0 +1,172 @@
+from __future__ import annotations
+
+import logging
+import os
+import threading
+import time
+from contextlib import contextmanager
+from typing import Callable
+
+from sqlalchemy import text
+from sqlalchemy.exc import ProgrammingError
+
+# Startup coordination between API processes sharing one database.
+#
+# Schema migrations and the admin bootstrap run in exactly one process, under a
+# session-level Postgres advisory lock. When done it writes a ready marker
+# (startup_state: the schema version + bootstrap settings it ran with). Other
+# processes see the marker and skip that work; while another process holds the
+# lock they poll for the marker instead of repeating it. A holder that dies
+# drops the lock with its connection, and the next waiter takes over.
+# A warm boot is one SELECT of the marker.
+#
+# Per-phase wall times of this process's startup are kept for /health and
+# /metrics (startup_phase_seconds).
+#   STARTUP_POLL_SECONDS   how often a waiting process re-checks the marker
+
+log = logging.getLogger(__name__)
+
+STARTUP_POLL_SECONDS = float(os.environ.get("STARTUP_POLL_SECONDS", "0.5"))
+
+# pg_advisory_lock key ("todo" in ASCII); shared by every process of this app
+STARTUP_LOCK_KEY = 0x746F646F
+
+# log who we are waiting on every so often
+_WAIT_LOG_SECONDS = 30.0
+
+_lock = threading.Lock()
+_t0 = time.perf_counter()
+_stats = {
+    "role": None,  # "ready" (marker already there) | "leader" | "follower"
+    "attempts": 0,
+    "phases": {},
+    "total_seconds": None,
+    "finished_at": None,
+}
+
+
+@contextmanager
+def phase(name: str):
+    """Add the wall time of the block to this process's `name` phase."""
+    t0 = time.perf_counter()
+    try:
+        yield
+    finally:
+        dt = time.perf_counter() - t0
+        with _lock:
+            _stats["phases"][name] = round(_stats["phases"].get(name, 0.0) + dt, 4)
+
+
+def _marker(engine) -> str | None:
+    try:
+        with engine.connect() as conn:
+            return conn.execute(text("SELECT marker FROM startup_state WHERE id = 1")).scalar()
+    except ProgrammingError:
+        # first boot: the table comes with the first leader
+        return None
+
+
+def _mark_ready(conn, marker: str) -> None:
+    conn.execute(
+        text(
+            """
+            CREATE TABLE IF NOT EXISTS startup_state (
+              id INTEGER PRIMARY KEY,
+              marker VARCHAR(512) NOT NULL,
+              ready_at BIGINT NOT NULL
+            )
+            """
+        )
+    )
+    conn.execute(
+        text(
+            """
+            INSERT INTO startup_state (id, marker, ready_at) VALUES (1, :m, :t)
+            ON CONFLICT (id) DO UPDATE SET marker = EXCLUDED.marker, ready_at = EXCLUDED.ready_at
+            """
+        ),
+        {"m": marker, "t": int(time.time())},
+    )
+
+
+def _holder_pid(conn) -> int | None:
+    return conn.execute(
+        text(
+            """
+            SELECT pid FROM pg_locks
+            WHERE locktype = 'advisory' AND granted
+              AND classid = CAST(:hi AS oid) AND objid = CAST(:lo AS oid) AND objsubid = 1
+            """
+        ),
+        # a bigint key shows up in pg_locks split into two 32-bit halves
+        {"hi": STARTUP_LOCK_KEY >> 32, "lo": STARTUP_LOCK_KEY & 0xFFFFFFFF},
+    ).scalar()
+
+
+def coordinate(engine, marker: str, work: Callable[[], None]) -> str:
+    """Run `work` (migrations/bootstrap) unless the ready marker already matches `marker`.
+
+    Returns this process's role: "ready", "leader" or "follower".
+    """
+    with _lock:
+        _stats["attempts"] += 1
+    with phase("ready_check"):
+        ready = _marker(engine) == marker
+    if ready:
+        return _set_role("ready")
+
+    # AUTOCOMMIT: an idle open transaction here would block the migrations'
+    # CREATE INDEX CONCURRENTLY; the advisory lock belongs to the session anyway
+    with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as conn:
+        with phase("lock_wait"):
+            waited_since = time.monotonic()
+            next_log = waited_since + _WAIT_LOG_SECONDS
+            while not conn.execute(text("SELECT pg_try_advisory_lock(:k)"), {"k": STARTUP_LOCK_KEY}).scalar():
+                if _marker(engine) == marker:
+                    return _set_role("follower")
+                if time.monotonic() >= next_log:
+                    next_log += _WAIT_LOG_SECONDS
+                    log.info(
+                        "startup: waiting %.0fs for startup lock held by pid %s",
+                        time.monotonic() - waited_since,
+                        _holder_pid(conn),
+                    )
+                time.sleep(STARTUP_POLL_SECONDS)
+        try:
+            # the previous holder may have finished between our checks
+            if _marker(engine) == marker:
+                return _set_role("follower")
+            work()
+            _mark_ready(conn, marker)
+            return _set_role("leader")
+        finally:
+            try:
+                conn.execute(text("SELECT pg_advisory_unlock(:k)"), {"k": STARTUP_LOCK_KEY})
+            except Exception:  # noqa: BLE001
+                # connection gone: the server released the lock with it
+                pass
+
+
+def _set_role(role: str) -> str:
+    with _lock:
+        _stats["role"] = role
+    return role
+
+
+def finish() -> None:
+    """Record the total startup time (from module import) and log the breakdown."""
+    with _lock:
+        _stats["total_seconds"] = round(time.perf_counter() - _t0, 4)
+        _stats["finished_at"] = int(time.time())
+        snap = dict(_stats)
+    log.info(
+        "startup: %s in %.3fs (%s)",
+        snap["role"],
+        snap["total_seconds"],
+        ", ".join(f"{k} {v:.3f}s" for k, v in snap["phases"].items()),
+    )
+
+
+def stats() -> dict:
+    with _lock:
+        return {**_stats, "phases": dict(_stats["phases"])}
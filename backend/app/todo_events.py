@@ -0,0 +1,164 @@
+from __future__ import annotations
+
+import asyncio
+import json
+import logging
+import os
+
+import redis.asyncio as aredis
+
+# Todo change events, fanned out through Redis pub/sub so every API worker/node
+# sees every mutation. Writers publish on todoev:<uid>; each worker holds one
+# pub/sub connection (_Hub), SUBSCRIBEd to the channels of the users it has
+# streams for (UNSUBSCRIBE when their last stream closes), and dispatches to
+# per-connection bounded queues. Thousands of idle SSE clients cost one Redis
+# connection per worker, and a worker only receives its own users' events.
+#
+# Event payloads (JSON):
+#   {"type": "created", "todo": {...TodoOut}}
+#   {"type": "updated", "id": 1, "done": true} / {"type": "updated", "id": 1, "priority": "High"}
+#   {"type": "deleted", "id": 1}
+#   {"type": "resync"}  -> state unknown (batch write, dropped events); refetch /api/todos
+
+log = logging.getLogger(__name__)
+
+CHANNEL = "todoev:{uid}"
+SSE_QUEUE_SIZE = int(os.environ.get("SSE_QUEUE_SIZE", "100"))
+SSE_HEARTBEAT_SECONDS = float(os.environ.get("SSE_HEARTBEAT_SECONDS", "15"))
+SSE_MAX_CONNECTIONS = int(os.environ.get("SSE_MAX_CONNECTIONS", "5000"))
+
+RESYNC = json.dumps({"type": "resync"})
+
+
+def publish(r, uid: int, event: dict) -> None:
+    if r is None:
+        return
+    try:
+        r.publish(CHANNEL.format(uid=int(uid)), json.dumps(event))
+    except Exception:
+        pass
+
+
+async def apublish(ar, uid: int, event: dict) -> None:
+    if ar is None:
+        return
+    try:
+        await ar.publish(CHANNEL.format(uid=int(uid)), json.dumps(event))
+    except Exception:
+        pass
+
+
+class _Hub:
+    def __init__(self) -> None:
+        self.subscribers: dict[int, set[asyncio.Queue]] = {}
+        self.connections = 0
+        self._task: asyncio.Task | None = None
+        # the live pub/sub and the uids SUBSCRIBEd on it; changed under _lock
+        self._ps = None
+        self._channels: set[int] = set()
+        self._lock = asyncio.Lock()
+        self._pending: set[asyncio.Task] = set()
+
+    def subscribe(self, uid: int) -> asyncio.Queue:
+        uid = int(uid)
+        q: asyncio.Queue = asyncio.Queue(maxsize=SSE_QUEUE_SIZE)
+        first = uid not in self.subscribers
+        self.subscribers.setdefault(uid, set()).add(q)
+        self.connections += 1
+        if self._task is None or self._task.done():
+            # (re)connecting subscribes every uid in self.subscribers
+            self._task = asyncio.get_running_loop().create_task(self._run())
+        elif first:
+            self._sync(uid)
+        return q
+
+    def unsubscribe(self, uid: int, q: asyncio.Queue) -> None:
+        uid = int(uid)
+        qs = self.subscribers.get(uid)
+        if qs is not None and q in qs:
+            qs.discard(q)
+            self.connections -= 1
+            if not qs:
+                del self.subscribers[uid]
+                self._sync(uid)
+
+    def _sync(self, uid: int) -> None:
+        task = asyncio.get_running_loop().create_task(self._apply(uid))
+        self._pending.add(task)
+        task.add_done_callback(self._pending.discard)
+
+    async def _apply(self, uid: int) -> None:
+        # bring uid's SUBSCRIBE state in line with self.subscribers; idempotent,
+        # so it doesn't matter in which order a quick attach/detach lands
+        async with self._lock:
+            ps = self._ps
+            want = uid in self.subscribers
+            if ps is None or want == (uid in self._channels):
+                return
+            channel = CHANNEL.format(uid=uid)
+            try:
+                if want:
+                    await ps.subscribe(channel)
+                    self._channels.add(uid)
+                else:
+                    await ps.unsubscribe(channel)
+                    self._channels.discard(uid)
+            except Exception as exc:  # noqa: BLE001
+                # the listener sees the broken connection and resubscribes
+                log.warning("todo event (un)subscribe failed: %s", exc)
+
+    @staticmethod
+    def _offer(q: asyncio.Queue, data: str) -> None:
+        try:
+            q.put_nowait(data)
+        except asyncio.QueueFull:
+            # slow consumer: drop its backlog and tell it to refetch
+            while not q.empty():
+                q.get_nowait()
+            q.put_nowait(RESYNC)
+
+    def _dispatch(self, uid: int, data: str) -> None:
+        for q in list(self.subscribers.get(uid, ())):
+            self._offer(q, data)
+
+    async def _run(self) -> None:
+        url = os.environ.get("REDIS_URL", "redis://localhost:6379/0")
+        while self.subscribers:
+            client = aredis.Redis.from_url(url, decode_responses=True)
+            ps = client.pubsub(ignore_subscribe_messages=True)
+            try:
+                async with self._lock:
+                    self._channels = set(self.subscribers)
+                    if self._channels:
+                        await ps.subscribe(*(CHANNEL.format(uid=uid) for uid in self._channels))
+                    self._ps = ps
+                # listen() ends once the last channel is unsubscribed
+                async for msg in ps.listen():
+                    if msg.get("type") != "message":
+                        continue
+                    try:
+                        uid = int(str(msg["channel"]).rsplit(":", 1)[1])
+                    except (IndexError, ValueError):
+                        continue
+                    self._dispatch(uid, msg["data"])
+                    if not self.subscribers:
+                        break
+            except asyncio.CancelledError:
+                raise
+            except Exception as exc:  # noqa: BLE001
+                log.warning("todo event subscription failed: %s", exc)
+                # events may have been missed while disconnected
+                for qs in list(self.subscribers.values()):
+                    for q in list(qs):
+                        self._offer(q, RESYNC)
+                await asyncio.sleep(1.0)
+            finally:
+                self._ps = None
+                try:
+                    await ps.aclose()
+                    await client.aclose()
+                except Exception:
+                    pass
+
+
+hub = _Hub()
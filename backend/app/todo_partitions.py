@@ -0,0 +1,235 @@
+from __future__ import annotations
+
+import logging
+import re
+import time
+
+from sqlalchemy import text
+
+# Online conversion of `todos` into a table hash-partitioned on user_id, so a
+# user's rows live in one partition: list/search/mutations (which all filter on
+# user_id) prune to it, and vacuum/reindex work per partition.
+#
+#   1. create todos_partitioned (same columns, PRIMARY KEY (user_id, id),
+#      copies of the secondary indexes and row triggers, MODULUS n partitions
+#      todos_p0..n-1)
+#   2. install a trigger mirroring every insert/update/delete on todos
+#   3. backfill existing rows in id-ordered batches (resumable, see
+#      todos_repartition_progress)
+#   4. swap names under a short ACCESS EXCLUSIVE lock; the old heap stays
+#      around as todos_unpartitioned until dropped with drop_unpartitioned()
+#
+# The id sequence is shared, so ids stay unique across partitions even though
+# the primary key now includes user_id. Driven by scripts/partition_todos.py.
+
+log = logging.getLogger(__name__)
+
+NEW = "todos_partitioned"
+OLD = "todos_unpartitioned"
+_TRIGGER = "todos_repartition_mirror"
+
+
+def is_partitioned(conn) -> bool:
+    return bool(
+        conn.execute(
+            text("SELECT EXISTS (SELECT 1 FROM pg_partitioned_table WHERE partrelid = to_regclass('todos'))")
+        ).scalar_one()
+    )
+
+
+def _columns(conn) -> list[str]:
+    # generated columns are recomputed by the new table, never copied
+    return list(
+        conn.execute(
+            text(
+                """
+                SELECT column_name FROM information_schema.columns
+                WHERE table_schema = current_schema() AND table_name = 'todos' AND is_generated = 'NEVER'
+                ORDER BY ordinal_position
+                """
+            )
+        ).scalars()
+    )
+
+
+def _secondary_indexes(conn) -> list[tuple[str, str]]:
+    return [
+        (name, ddl)
+        for name, ddl in conn.execute(
+            text(
+                """
+                SELECT c.relname, pg_get_indexdef(i.indexrelid)
+                FROM pg_index i JOIN pg_class c ON c.oid = i.indexrelid
+                WHERE i.indrelid = to_regclass('todos') AND NOT i.indisprimary
+                """
+            )
+        )
+    ]
+
+
+def _new_index_name(name: str) -> str:
+    return f"{name[:59]}_new"
+
+
+def prepare(engine, partitions: int) -> None:
+    """Steps 1-2: create the partitioned table and the mirroring trigger (idempotent)."""
+    with engine.begin() as conn:
+        if is_partitioned(conn):
+            return
+        exists = conn.execute(text(f"SELECT to_regclass('{NEW}') IS NOT NULL")).scalar_one()
+        if not exists:
+            conn.execute(
+                text(
+                    f"""
+                    CREATE TABLE {NEW} (
+                      LIKE todos INCLUDING DEFAULTS INCLUDING GENERATED,
+                      CONSTRAINT todos_partitioned_pkey PRIMARY KEY (user_id, id),
+                      CONSTRAINT todos_partitioned_user_id_fkey FOREIGN KEY (user_id)
+                        REFERENCES users (id) ON DELETE CASCADE
+                    ) PARTITION BY HASH (user_id)
+                    """
+                )
+            )
+            for i in range(partitions):
+                conn.execute(
+                    text(
+                        f"CREATE TABLE todos_p{i} PARTITION OF {NEW} "
+                        f"FOR VALUES WITH (MODULUS {partitions}, REMAINDER {i})"
+                    )
+                )
+            # the PK leads with user_id, so plain (user_id) / (user_id, id) indexes are redundant
+            for name, ddl in _secondary_indexes(conn):
+                if name in ("ix_todos_user_id", "ix_todos_user_id_id"):
+                    continue
+                head, _, rest = ddl.partition(" ON ")
+                _, _, using = rest.partition(" USING ")
+                head = head.replace(f"INDEX {name}", f"INDEX {_new_index_name(name)}")
+                conn.execute(text(f"{head} ON {NEW} USING {using}"))
+            # row triggers (e.g. todos_title_tsv) carry over too
+            for ddl in conn.execute(
+                text(
+                    """
+                    SELECT pg_get_triggerdef(oid) FROM pg_trigger
+                    WHERE tgrelid = to_regclass('todos') AND NOT tgisinternal AND tgname <> :mirror
+                    """
+                ),
+                {"mirror": _TRIGGER},
+            ).scalars():
+                conn.execute(text(re.sub(r" ON (\S+\.)?todos ", f" ON {NEW} ", ddl, count=1)))
+            conn.execute(text("CREATE TABLE IF NOT EXISTS todos_repartition_progress (last_id BIGINT NOT NULL)"))
+            conn.execute(text("INSERT INTO todos_repartition_progress (last_id) VALUES (0)"))
+
+        cols = _columns(conn)
+        col_list = ", ".join(cols)
+        new_vals = ", ".join(f"NEW.{c}" for c in cols)
+        sets = ", ".join(f"{c} = EXCLUDED.{c}" for c in cols if c not in ("user_id", "id"))
+        conn.execute(
+            text(
+                f"""
+                CREATE OR REPLACE FUNCTION {_TRIGGER}() RETURNS trigger LANGUAGE plpgsql AS $$
+                BEGIN
+                  IF TG_OP = 'DELETE' OR (TG_OP = 'UPDATE' AND (NEW.user_id, NEW.id) IS DISTINCT FROM (OLD.user_id, OLD.id)) THEN
+                    DELETE FROM {NEW} WHERE user_id = OLD.user_id AND id = OLD.id;
+                  END IF;
+                  IF TG_OP = 'DELETE' THEN
+                    RETURN OLD;
+                  END IF;
+                  INSERT INTO {NEW} ({col_list}) VALUES ({new_vals})
+                  ON CONFLICT (user_id, id) DO UPDATE SET {sets};
+                  RETURN NEW;
+                END
+                $$
+                """
+            )
+        )
+        conn.execute(text(f"DROP TRIGGER IF EXISTS {_TRIGGER} ON todos"))
+        conn.execute(
+            text(f"CREATE TRIGGER {_TRIGGER} AFTER INSERT OR UPDATE OR DELETE ON todos FOR EACH ROW EXECUTE FUNCTION {_TRIGGER}()")
+        )
+
+
+def backfill(engine, batch: int = 5000, pause: float = 0.0) -> int:
+    """Step 3: copy rows that existed before the trigger; returns rows copied by this call."""
+    with engine.connect() as conn:
+        if is_partitioned(conn):
+            return 0
+        cols = ", ".join(_columns(conn))
+        # every later row is mirrored by the trigger (CREATE TRIGGER waited for in-flight writers)
+        upto = conn.execute(text("SELECT COALESCE(MAX(id), 0) FROM todos")).scalar_one()
+
+    copied = 0
+    while True:
+        with engine.begin() as conn:
+            last = conn.execute(text("SELECT last_id FROM todos_repartition_progress FOR UPDATE")).scalar_one()
+            hi = conn.execute(
+                text("SELECT MAX(id) FROM (SELECT id FROM todos WHERE id > :last AND id <= :upto ORDER BY id LIMIT :n) s"),
+                {"last": last, "upto": upto, "n": batch},
+            ).scalar()
+            if hi is None:
+                break
+            # FOR KEY SHARE: a concurrent DELETE waits for this batch, then its
+            # trigger removes the copied row (no resurrected rows)
+            n = conn.execute(
+                text(
+                    f"""
+                    INSERT INTO {NEW} ({cols})
+                    SELECT {cols} FROM todos WHERE id > :last AND id <= :hi FOR KEY SHARE
+                    ON CONFLICT (user_id, id) DO NOTHING
+                    """
+                ),
+                {"last": last, "hi": hi},
+            ).rowcount
+            conn.execute(text("UPDATE todos_repartition_progress SET last_id = :hi"), {"hi": hi})
+        copied += int(n or 0)
+        log.info("todos backfill: copied through id %s (%s rows this run)", hi, copied)
+        if pause:
+            time.sleep(pause)
+    return copied
+
+
+def swap(engine, lock_timeout: str = "5s") -> None:
+    """Step 4: make todos_partitioned the live `todos` table."""
+    with engine.begin() as conn:
+        if is_partitioned(conn):
+            return
+        conn.execute(text(f"SET LOCAL lock_timeout = '{lock_timeout}'"))
+        conn.execute(text("LOCK TABLE todos IN ACCESS EXCLUSIVE MODE"))
+        indexes = [name for name, _ in _secondary_indexes(conn)]
+        seq = conn.execute(text("SELECT pg_get_serial_sequence('todos', 'id')")).scalar_one()
+
+        conn.execute(text(f"DROP TRIGGER IF EXISTS {_TRIGGER} ON todos"))
+        conn.execute(text(f"DROP FUNCTION IF EXISTS {_TRIGGER}()"))
+        conn.execute(text(f"ALTER TABLE todos RENAME TO {OLD}"))
+        conn.execute(text(f"ALTER TABLE {OLD} RENAME CONSTRAINT todos_pkey TO {OLD}_pkey"))
+        for name in indexes:
+            conn.execute(text(f"ALTER INDEX {name} RENAME TO {name[:59]}_old"))
+        conn.execute(text(f"ALTER TABLE {NEW} RENAME TO todos"))
+        conn.execute(text("ALTER TABLE todos RENAME CONSTRAINT todos_partitioned_pkey TO todos_pkey"))
+        conn.execute(text("ALTER TABLE todos RENAME CONSTRAINT todos_partitioned_user_id_fkey TO todos_user_id_fkey"))
+        for name in indexes:
+            if conn.execute(text(f"SELECT to_regclass('{_new_index_name(name)}') IS NOT NULL")).scalar_one():
+                conn.execute(text(f"ALTER INDEX {_new_index_name(name)} RENAME TO {name}"))
+        if seq:
+            # keep the sequence alive when the old heap is dropped
+            conn.execute(text(f"ALTER SEQUENCE {seq} OWNED BY todos.id"))
+        conn.execute(text("DROP TABLE IF EXISTS todos_repartition_progress"))
+
+
+def drop_unpartitioned(engine) -> None:
+    with engine.begin() as conn:
+        conn.execute(text(f"DROP TABLE IF EXISTS {OLD}"))
+
+
+def partition_todos(engine, partitions: int = 16, batch: int = 5000, pause: float = 0.0) -> None:
+    """Run every step; safe to re-run after an interruption."""
+    prepare(engine, partitions)
+    backfill(engine, batch, pause)
+    with engine.connect() as conn:
+        if is_partitioned(conn):
+            return
+        lag = conn.execute(
+            text(f"SELECT (SELECT COUNT(*) FROM todos) - (SELECT COUNT(*) FROM {NEW})")
+        ).scalar_one()
+    if lag:
+        raise RuntimeError(f"{NEW} differs from todos by {lag} rows; not swapping")
+    swap(engine)
@@ -0,0 +1,174 @@
+from __future__ import annotations
+
+from fastapi import HTTPException
+from sqlalchemy import and_, case, delete, func, insert, literal_column, or_, select, tuple_, update
+
+from .models import Todo
+
+# Query builders shared by the sync (main.py) and async (async_routes.py) todo
+# handlers. Listing rows come back as plain tuples in TODO_FIELDS order, ready
+# for fast_json.rows_to_json.
+
+# priority is stored as a SMALLINT (Todo.priority_code); the API keeps the
+# names. Higher code = more urgent, so "highest first" is a backward scan of
+# ix_todos_user_done_priority_id.
+PRIORITY_CODES = {"Low": 1, "Medium": 2, "High": 3}
+PRIORITY_NAMES = {code: name for name, code in PRIORITY_CODES.items()}
+
+TODO_FIELDS = ("id", "title", "done", "priority", "created_at")
+TODO_COLUMNS = (
+    Todo.id,
+    Todo.title,
+    Todo.done,
+    case(PRIORITY_NAMES, value=Todo.priority_code, else_="Medium"),
+    Todo.created_at,
+)
+
+SORTS = ("newest", "oldest", "priority")
+
+
+def normalize_priority(priority: str | None) -> str:
+    pr = (priority or "").strip().capitalize()
+    if pr not in PRIORITY_CODES:
+        raise HTTPException(status_code=400, detail="priority must be High|Medium|Low")
+    return pr
+
+
+def priority_code(priority: str | None) -> int:
+    return PRIORITY_CODES[normalize_priority(priority)]
+
+
+def parse_list_cursor(cursor: str | None, sort: str) -> tuple[int, int] | None:
+    # "<sort>:<sort key>:<id>": priority_code for sort=priority, created_at
+    # otherwise. A cursor only continues the sort it was issued for.
+    if cursor is None or cursor == "":
+        return None
+    issued_for, _, rest = cursor.partition(":")
+    if issued_for not in SORTS:
+        raise HTTPException(status_code=400, detail="invalid cursor")
+    if issued_for != sort:
+        raise HTTPException(status_code=400, detail=f"cursor is for sort={issued_for}")
+    try:
+        key, _, todo_id = rest.partition(":")
+        return int(key), int(todo_id)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="invalid cursor")
+
+
+def list_cursor(row, sort: str) -> str:
+    """X-Next-Cursor for the last row of a page (row in TODO_FIELDS order)."""
+    if sort == "priority":
+        return f"{sort}:{PRIORITY_CODES.get(row[3], 2)}:{int(row[0])}"
+    return f"{sort}:{int(row[4])}:{int(row[0])}"
+
+
+def list_query(
+    user_id: int,
+    limit: int | None = None,
+    cursor: str | int | None = None,
+    done: bool | None = None,
+    priority: str | None = None,
+    sort: str = "newest",
+):
+    """One page of a user's todos, keyset-paginated.
+
+    newest/oldest walk (created_at, id) on ix_todos_user_created_at_id, so
+    imported rows with an explicit created_at land where they belong; priority
+    orders by (priority_code, id) descending, which
+    ix_todos_user_done_priority_id serves directly when `done` is given
+    ("open items, highest priority first").
+    """
+    if sort not in SORTS:
+        raise HTTPException(status_code=400, detail="sort must be newest|oldest|priority")
+    after = parse_list_cursor(None if cursor is None else str(cursor), sort)
+    q = select(*TODO_COLUMNS).where(Todo.user_id == int(user_id))
+    if done is not None:
+        q = q.where(Todo.done == done)
+    if priority is not None:
+        q = q.where(Todo.priority_code == priority_code(priority))
+    if sort == "priority":
+        if after is not None:
+            q = q.where(tuple_(Todo.priority_code, Todo.id) < tuple_(*after))
+        q = q.order_by(Todo.priority_code.desc(), Todo.id.desc())
+    elif sort == "oldest":
+        if after is not None:
+            q = q.where(tuple_(Todo.created_at, Todo.id) > tuple_(*after))
+        q = q.order_by(Todo.created_at.asc(), Todo.id.asc())
+    else:
+        if after is not None:
+            q = q.where(tuple_(Todo.created_at, Todo.id) < tuple_(*after))
+        q = q.order_by(Todo.created_at.desc(), Todo.id.desc())
+    if limit is not None:
+        # fetch one extra row to know whether another page exists
+        q = q.limit(limit + 1)
+    return q
+
+
+# must match the todos_title_tsv trigger (migrations.py)
+SEARCH_CONFIG = "simple"
+SEARCH_PAGE_MAX = 100
+
+
+def parse_search_cursor(cursor: str | None) -> tuple[float, int] | None:
+    if not cursor:
+        return None
+    try:
+        rank, _, todo_id = cursor.partition(":")
+        return float(rank), int(todo_id)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="invalid cursor")
+
+
+def search_cursor(rank: float, todo_id: int) -> str:
+    # repr() round-trips the float exactly, so the keyset comparison is stable
+    return f"{rank!r}:{int(todo_id)}"
+
+
+def search_query(user_id: int, q: str, limit: int, cursor: str | None = None, done: bool | None = None):
+    """Best-ranked first search over the user's titles (GIN on title_tsv).
+
+    Rows are TODO_FIELDS plus the rank; keyset on (rank, id).
+    """
+    tsq = func.websearch_to_tsquery(literal_column(f"'{SEARCH_CONFIG}'::regconfig"), q)
+    rank = func.ts_rank_cd(Todo.title_tsv, tsq)
+    stmt = select(*TODO_COLUMNS, rank.label("rank")).where(Todo.user_id == int(user_id), Todo.title_tsv.op("@@")(tsq))
+    if done is not None:
+        stmt = stmt.where(Todo.done == done)
+    after = parse_search_cursor(cursor)
+    if after is not None:
+        stmt = stmt.where(or_(rank < after[0], and_(rank == after[0], Todo.id < after[1])))
+    return stmt.order_by(rank.desc(), Todo.id.desc()).limit(limit + 1)
+
+
+# Single-statement writes: each mutation is one round trip, scoped by
+# (user_id, id) so another user's id matches nothing (-> 404) and a partitioned
+# todos is pruned to one partition. No rows are loaded into the Session.
+
+
+def insert_todo(user_id: int, title: str, code: int):
+    """INSERT ... RETURNING id, created_at (created_at is the column default)."""
+    return (
+        insert(Todo)
+        .values(user_id=int(user_id), title=title, done=False, priority_code=int(code))
+        .returning(Todo.id, Todo.created_at)
+    )
+
+
+def update_todo(user_id: int, todo_id: int, **values):
+    """UPDATE ... RETURNING done; no row back means the user has no such todo."""
+    return (
+        update(Todo)
+        .where(Todo.user_id == int(user_id), Todo.id == int(todo_id))
+        .values(**values)
+        .returning(Todo.done)
+        .execution_options(synchronize_session=False)
+    )
+
+
+def delete_todo(user_id: int, todo_id: int):
+    return (
+        delete(Todo)
+        .where(Todo.user_id == int(user_id), Todo.id == int(todo_id))
+        .returning(Todo.id)
+        .execution_options(synchronize_session=False)
+    )
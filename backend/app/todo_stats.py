@@ -0,0 +1,162 @@
+from __future__ import annotations
+
+import logging
+import os
+import threading
+import time
+
+from sqlalchemy import text
+
+from .todo_queries import PRIORITY_NAMES
+
+# Per-user todo totals for GET /api/todos/stats, kept in todo_counts
+# (user_id, done, priority_code) -> n by the statement-level todos_counts
+# triggers (migrations.py), so every write path - single handlers, batch,
+# bulk statements, cascading user deletes - adjusts them in the same
+# transaction and the endpoint never COUNTs todos.
+#
+# reconcile() recomputes the counters from todos and repairs any drift (manual
+# SQL, a trigger disabled during maintenance, ...). It runs in the background
+# every TODO_COUNTS_RECONCILE_INTERVAL_SECONDS (0 disables) and from
+# scripts/reconcile_todo_counts.py.
+#   TODO_COUNTS_RECONCILE_INTERVAL_SECONDS  pause between runs
+#   TODO_COUNTS_RECONCILE_BATCH             users checked per transaction
+
+log = logging.getLogger(__name__)
+
+TODO_COUNTS_RECONCILE_INTERVAL_SECONDS = float(os.environ.get("TODO_COUNTS_RECONCILE_INTERVAL_SECONDS", "3600"))
+TODO_COUNTS_RECONCILE_BATCH = int(os.environ.get("TODO_COUNTS_RECONCILE_BATCH", "500"))
+
+_stop = threading.Event()
+_thread: threading.Thread | None = None
+_lock = threading.Lock()
+_stats = {
+    "runs": 0,
+    "repaired_total": 0,
+    "last_run_at": None,
+    "last_run_repaired": 0,
+    "last_run_seconds": None,
+}
+
+_COUNTS_SQL = text("SELECT done, priority_code, n FROM todo_counts WHERE user_id = :uid")
+
+# one batch of users [lo, hi]: create all six buckets, lock them (writers'
+# triggers queue behind the lock, so the recount below can't race them), then
+# overwrite the ones that differ from the real counts
+_SEED_SQL = text(
+    """
+    INSERT INTO todo_counts (user_id, done, priority_code, n)
+    SELECT u.id, b.done, b.priority_code, 0
+    FROM users u
+    CROSS JOIN (
+      VALUES (false, 1::SMALLINT), (false, 2::SMALLINT), (false, 3::SMALLINT),
+             (true, 1::SMALLINT), (true, 2::SMALLINT), (true, 3::SMALLINT)
+    ) AS b(done, priority_code)
+    WHERE u.id BETWEEN :lo AND :hi
+    ORDER BY 1, 2, 3
+    ON CONFLICT (user_id, done, priority_code) DO NOTHING
+    """
+)
+_LOCK_SQL = text(
+    """
+    SELECT 1 FROM todo_counts WHERE user_id BETWEEN :lo AND :hi
+    ORDER BY user_id, done, priority_code FOR UPDATE
+    """
+)
+_REPAIR_SQL = text(
+    """
+    UPDATE todo_counts c SET n = x.n
+    FROM (
+      SELECT k.user_id, k.done, k.priority_code, COALESCE(a.n, 0) AS n
+      FROM todo_counts k
+      LEFT JOIN (
+        SELECT user_id, done, priority_code, COUNT(*) AS n FROM todos
+        WHERE user_id BETWEEN :lo AND :hi
+        GROUP BY user_id, done, priority_code
+      ) a USING (user_id, done, priority_code)
+      WHERE k.user_id BETWEEN :lo AND :hi
+    ) x
+    WHERE (c.user_id, c.done, c.priority_code) = (x.user_id, x.done, x.priority_code) AND c.n <> x.n
+    """
+)
+
+
+def shape(rows) -> dict:
+    """(done, priority_code, n) rows -> the /api/todos/stats payload."""
+    by_priority = {name: {"open": 0, "done": 0, "total": 0} for name in ("High", "Medium", "Low")}
+    for done, code, n in rows:
+        n = max(int(n), 0)
+        bucket = by_priority[PRIORITY_NAMES.get(int(code), "Medium")]
+        bucket["done" if done else "open"] += n
+        bucket["total"] += n
+    return {
+        "total": sum(b["total"] for b in by_priority.values()),
+        "open": sum(b["open"] for b in by_priority.values()),
+        "done": sum(b["done"] for b in by_priority.values()),
+        "by_priority": by_priority,
+    }
+
+
+def load(conn, uid: int) -> dict:
+    return shape(conn.execute(_COUNTS_SQL, {"uid": int(uid)}).all())
+
+
+def reconcile(engine, batch: int | None = None) -> int:
+    """Repair todo_counts for every user; returns the number of buckets fixed."""
+    batch = batch or TODO_COUNTS_RECONCILE_BATCH
+    t0 = time.perf_counter()
+    repaired = 0
+    with engine.begin() as conn:
+        # counters of deleted users (no FK: the cascade from users fires the
+        # todos triggers after the user row is already gone)
+        conn.execute(text("DELETE FROM todo_counts c WHERE NOT EXISTS (SELECT 1 FROM users u WHERE u.id = c.user_id)"))
+    last = 0
+    while not _stop.is_set():
+        with engine.begin() as conn:
+            hi = conn.execute(
+                text("SELECT MAX(id) FROM (SELECT id FROM users WHERE id > :last ORDER BY id LIMIT :n) s"),
+                {"last": last, "n": batch},
+            ).scalar()
+            if hi is None:
+                break
+            params = {"lo": last + 1, "hi": hi}
+            conn.execute(_SEED_SQL, params)
+            conn.execute(_LOCK_SQL, params)
+            repaired += int(conn.execute(_REPAIR_SQL, params).rowcount or 0)
+        last = hi
+
+    with _lock:
+        _stats["runs"] += 1
+        _stats["repaired_total"] += repaired
+        _stats["last_run_at"] = int(time.time())
+        _stats["last_run_repaired"] = repaired
+        _stats["last_run_seconds"] = round(time.perf_counter() - t0, 3)
+    return repaired
+
+
+def _loop(engine) -> None:
+    while not _stop.wait(TODO_COUNTS_RECONCILE_INTERVAL_SECONDS):
+        try:
+            n = reconcile(engine)
+            if n:
+                log.warning("todo_counts reconcile repaired %d drifted buckets", n)
+        except Exception as exc:  # noqa: BLE001
+            log.warning("todo_counts reconcile failed: %s", exc)
+
+
+def start(engine) -> None:
+    global _thread
+    if TODO_COUNTS_RECONCILE_INTERVAL_SECONDS <= 0 or (_thread is not None and _thread.is_alive()):
+        return
+    _stop.clear()
+    _thread = threading.Thread(target=_loop, args=(engine,), name="todo-counts-reconcile", daemon=True)
+    _thread.start()
+
+
+def stop() -> None:
+    _stop.set()
+
+
+def stats() -> dict:
+    with _lock:
+        return dict(_stats)
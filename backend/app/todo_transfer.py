@@ -0,0 +1,160 @@
+from __future__ import annotations
+
+import codecs
+import csv
+import io
+import json
+import os
+import time
+from typing import Iterable, Iterator
+
+from fastapi import HTTPException
+from sqlalchemy import select
+
+from . import fast_json
+from .models import Todo
+from .todo_queries import PRIORITY_CODES, TODO_COLUMNS, TODO_FIELDS
+
+# Whole-list export/import (GET /api/todos/export, POST /api/todos/import).
+#
+# Export reads through a server-side cursor (stream_results) and yields encoded
+# chunks, so memory stays flat however long the list is. Import parses the
+# request body as it arrives and feeds each validated row to COPY ... FROM
+# STDIN: one statement, one transaction; any invalid line aborts it all.
+#   EXPORT_FETCH_ROWS   rows per server-side cursor fetch / response chunk
+#   IMPORT_MAX_ROWS     upper bound on rows per import request
+
+EXPORT_FETCH_ROWS = int(os.environ.get("EXPORT_FETCH_ROWS", "1000"))
+IMPORT_MAX_ROWS = int(os.environ.get("IMPORT_MAX_ROWS", "200000"))
+
+FORMATS = {"ndjson": "application/x-ndjson", "csv": "text/csv; charset=utf-8"}
+
+_TITLE_MAX = Todo.__table__.c.title.type.length
+# far more than any valid record needs; a body without newlines is not buffered whole
+_LINE_MAX = 64 * 1024
+# created_at range: the epoch up to the end of year 9999
+_CREATED_AT_MAX = 253402300799
+_TRUE = {"1", "true", "t", "yes", "y"}
+_FALSE = {"", "0", "false", "f", "no", "n"}
+
+
+def pick_format(fmt: str | None, content_type: str | None = None) -> str:
+    """`format` query param, else the request Content-Type, else ndjson."""
+    if fmt:
+        fmt = fmt.strip().lower()
+    elif content_type and "csv" in content_type.lower():
+        fmt = "csv"
+    else:
+        fmt = "ndjson"
+    if fmt not in FORMATS:
+        raise HTTPException(status_code=400, detail="format must be ndjson|csv")
+    return fmt
+
+
+def export_chunks(engine, uid: int, fmt: str, done: bool | None = None) -> Iterator[bytes]:
+    q = select(*TODO_COLUMNS).where(Todo.user_id == int(uid))
+    if done is not None:
+        q = q.where(Todo.done == done)
+    q = q.order_by(Todo.id)
+
+    buf = io.StringIO()
+    writer = csv.writer(buf, lineterminator="\n")
+    if fmt == "csv":
+        writer.writerow(TODO_FIELDS)
+        yield buf.getvalue().encode("utf-8")
+    with engine.connect() as conn:
+        result = conn.execution_options(stream_results=True, max_row_buffer=EXPORT_FETCH_ROWS).execute(q)
+        for rows in result.partitions(EXPORT_FETCH_ROWS):
+            if fmt == "csv":
+                buf.seek(0)
+                buf.truncate()
+                writer.writerows(rows)
+                yield buf.getvalue().encode("utf-8")
+            else:
+                yield b"".join(fast_json.dumps(dict(zip(TODO_FIELDS, row))) + b"\n" for row in rows)
+
+
+def _lines(chunks: Iterable[bytes]) -> Iterator[str]:
+    # body chunks -> text lines (newline kept, as csv.reader expects)
+    decoder = codecs.getincrementaldecoder("utf-8")()
+    tail = ""
+    n = 0
+    for chunk in chunks:
+        try:
+            tail += decoder.decode(chunk)
+        except UnicodeDecodeError:
+            raise HTTPException(status_code=400, detail="body must be UTF-8")
+        *lines, tail = tail.split("\n")
+        for line in lines:
+            n += 1
+            if len(line) > _LINE_MAX:
+                raise HTTPException(status_code=400, detail=f"line {n}: longer than {_LINE_MAX} characters")
+            yield line + "\n"
+        if len(tail) > _LINE_MAX:
+            raise HTTPException(status_code=400, detail=f"line {n + 1}: longer than {_LINE_MAX} characters")
+    tail += decoder.decode(b"", final=True)
+    if tail:
+        yield tail
+
+
+def _records(fmt: str, chunks: Iterable[bytes]) -> Iterator[tuple[int, dict]]:
+    if fmt == "csv":
+        reader = csv.DictReader(_lines(chunks))
+        if reader.fieldnames is None or "title" not in reader.fieldnames:
+            raise HTTPException(status_code=400, detail="csv header must include title")
+        for rec in reader:
+            yield reader.line_num, rec
+        return
+    for n, line in enumerate(_lines(chunks), start=1):
+        if not line.strip():
+            continue
+        try:
+            rec = json.loads(line)
+        except ValueError:
+            raise HTTPException(status_code=400, detail=f"line {n}: invalid JSON")
+        if not isinstance(rec, dict):
+            raise HTTPException(status_code=400, detail=f"line {n}: expected an object")
+        yield n, rec
+
+
+def _row(n: int, rec: dict, uid: int, now: int) -> tuple:
+    title = str(rec.get("title") or "").strip()
+    if not title:
+        raise HTTPException(status_code=400, detail=f"line {n}: title is required")
+    if len(title) > _TITLE_MAX:
+        raise HTTPException(status_code=400, detail=f"line {n}: title longer than {_TITLE_MAX}")
+    if "\x00" in title:
+        # Postgres text can't hold NUL; COPY would fail the request with a 500
+        raise HTTPException(status_code=400, detail=f"line {n}: title must not contain NUL")
+    code = PRIORITY_CODES.get(str(rec.get("priority") or "Medium").strip().capitalize())
+    if code is None:
+        raise HTTPException(status_code=400, detail=f"line {n}: priority must be High|Medium|Low")
+    done = rec.get("done")
+    if not isinstance(done, bool):
+        flag = str(done if done is not None else "").strip().lower()
+        if flag not in _TRUE and flag not in _FALSE:
+            raise HTTPException(status_code=400, detail=f"line {n}: done must be true|false")
+        done = flag in _TRUE
+    created_at = rec.get("created_at")
+    try:
+        created_at = now if created_at in (None, "") else int(created_at)
+    except (TypeError, ValueError):
+        raise HTTPException(status_code=400, detail=f"line {n}: created_at must be unix seconds")
+    if not 0 <= created_at <= _CREATED_AT_MAX:
+        raise HTTPException(status_code=400, detail=f"line {n}: created_at out of range")
+    return int(uid), title, done, code, created_at
+
+
+def copy_in(engine, uid: int, fmt: str, chunks: Iterable[bytes]) -> int:
+    """Validate and COPY rows from `chunks` into todos for uid; returns rows imported."""
+    now = int(time.time())
+    count = 0
+    with engine.begin() as conn:
+        cur = conn.connection.cursor()
+        with cur.copy("COPY todos (user_id, title, done, priority_code, created_at) FROM STDIN") as copy:
+            for n, rec in _records(fmt, chunks):
+                count += 1
+                if count > IMPORT_MAX_ROWS:
+                    raise HTTPException(status_code=413, detail=f"at most {IMPORT_MAX_ROWS} rows per import")
+                copy.write_row(_row(n, rec, uid, now))
+    return count
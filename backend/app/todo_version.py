@@ -0,0 +1,91 @@
+from __future__ import annotations
+
+import hashlib
+import time
+
+# Per-user todo list version in Redis (todover:<uid>), bumped after every
+# committed todo mutation. list_todos derives its ETag from it so a matching
+# If-None-Match can be answered with 304 without touching the todos table.
+# With Redis unavailable, get() returns None and callers skip the ETag.
+# Call replica.mark_write before bump(): a list request seeing the new version
+# must also be routed to the primary, or stale replica rows get the new tag.
+
+VERSION_KEY = "todover:{uid}"
+
+
+def _etag(uid: int, version: str, variant: str) -> str:
+    # variant = the query shape (filters/page), so each view gets its own tag
+    h = hashlib.blake2s(f"{uid}:{version}:{variant}".encode("utf-8"), digest_size=12).hexdigest()
+    return f'W/"{h}"'
+
+
+def _opaque(tag: str) -> str:
+    tag = tag.strip()
+    return tag[2:] if tag.startswith("W/") else tag
+
+
+def etag_matches(etag: str, if_none_match: str | None) -> bool:
+    # If-None-Match uses the weak comparison (RFC 9110 13.1.2): W/ is ignored
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    return _opaque(etag) in {_opaque(t) for t in if_none_match.split(",")}
+
+
+def get(r, uid: int) -> str | None:
+    if r is None:
+        return None
+    key = VERSION_KEY.format(uid=int(uid))
+    try:
+        v = r.get(key)
+        if v is None:
+            # unknown (first use / Redis flushed): start from a fresh value so
+            # tags handed out before the flush can never match again
+            r.set(key, time.time_ns(), nx=True)
+            v = r.get(key)
+        return v
+    except Exception:
+        return None
+
+
+def bump(r, uid: int) -> None:
+    if r is None:
+        return
+    try:
+        r.incr(VERSION_KEY.format(uid=int(uid)))
+    except Exception:
+        pass
+
+
+def etag(r, uid: int, variant: str) -> str | None:
+    v = get(r, uid)
+    return None if v is None else _etag(uid, v, variant)
+
+
+async def aget(ar, uid: int) -> str | None:
+    if ar is None:
+        return None
+    key = VERSION_KEY.format(uid=int(uid))
+    try:
+        v = await ar.get(key)
+        if v is None:
+            await ar.set(key, time.time_ns(), nx=True)
+            v = await ar.get(key)
+        return v
+    except Exception:
+        return None
+
+
+async def abump(ar, uid: int) -> None:
+    if ar is None:
+        return
+    try:
+        await ar.incr(VERSION_KEY.format(uid=int(uid)))
+    except Exception:
+        pass
+
+
+async def aetag(ar, uid: int, variant: str) -> str | None:
+    v = await aget(ar, uid)
+    return None if v is None else _etag(uid, v, variant)
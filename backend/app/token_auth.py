@@ -0,0 +1,162 @@
+from __future__ import annotations
+
+import os
+from contextvars import ContextVar
+from http.cookies import SimpleCookie
+from typing import Any
+
+import jwt
+
+from . import auth
+from .auth_sessions import now_s
+from .db import DB_MODE
+from .models import User
+
+# Stateless auth mode: the session cookie carries a short-lived HS256 token
+# (auth.make_token) with the user id, role flags and the session id, so
+# validating a request needs no database access - one Redis MGET against the
+# deny-list below. An expired (or revoked-by-user) token is renewed from the
+# sessions table and sent back as a fresh cookie; that is the only DB read.
+#   tokdeny:<sid>  -> set on logout, lives as long as a token can
+#   tokrev:<uid>   -> unix time; tokens issued up to then must refresh
+#                     (password change, lock, admin/verified flag changes)
+#   AUTH_MODE                  "session" (default: DB/cache-backed sid) | "token"
+#   ACCESS_TOKEN_TTL_SECONDS   how long a token is trusted before refresh
+# Sync handlers only: with DB_MODE=async the cookie stays a plain sid.
+
+AUTH_MODE = os.environ.get("AUTH_MODE", "session").strip().lower()
+ACCESS_TOKEN_TTL_SECONDS = int(os.environ.get("ACCESS_TOKEN_TTL_SECONDS", "900"))
+
+DENY_KEY = "tokdeny:{sid}"
+REVOKED_KEY = "tokrev:{uid}"
+
+_DEFAULT_SECRET = "dev-secret-change-me"
+
+# refreshed cookie for the current request, set by session_deps, sent by the middleware
+_pending: ContextVar[list | None] = ContextVar("token_refresh", default=None)
+
+
+def enabled() -> bool:
+    return AUTH_MODE == "token" and DB_MODE != "async"
+
+
+def check_config() -> None:
+    if enabled() and auth.JWT_SECRET == _DEFAULT_SECRET and os.environ.get("APP_ENV", "dev") != "dev":
+        raise RuntimeError("AUTH_MODE=token needs JWT_SECRET outside APP_ENV=dev")
+
+
+def issue(u: User, sid: str, expires_at: int) -> str:
+    """Token for session `sid`; never outlives the session itself."""
+    ttl = max(1, min(ACCESS_TOKEN_TTL_SECONDS, int(expires_at) - now_s()))
+    return auth.make_token(
+        int(u.id),
+        u.username,
+        ttl=ttl,
+        sid=sid,
+        adm=bool(getattr(u, "is_admin", False)),
+        mcp=bool(getattr(u, "must_change_password", False)),
+        ev=bool(getattr(u, "email_verified", True)),
+    )
+
+
+def decode(token: str | None) -> dict[str, Any] | None:
+    """Claims of a correctly signed token, expired or not; None otherwise."""
+    if not token:
+        return None
+    try:
+        claims = auth.decode_token(token, verify_exp=False)
+        int(claims["sub"]), str(claims["sid"])
+    except (jwt.PyJWTError, KeyError, TypeError, ValueError):
+        return None
+    return claims
+
+
+def check(r, claims: dict[str, Any]) -> str:
+    """"ok" (use the claims), "refresh" (renew from the sessions table) or "denied"."""
+    outcome = "refresh"
+    try:
+        denied, revoked = r.mget(DENY_KEY.format(sid=claims["sid"]), REVOKED_KEY.format(uid=int(claims["sub"])))
+    except Exception:
+        # deny-list unreadable: the sessions table decides
+        denied = revoked = None
+    else:
+        if denied:
+            outcome = "denied"
+        elif int(claims.get("exp", 0)) > now_s() and (not revoked or int(claims.get("iat", 0)) > int(revoked)):
+            outcome = "ok"
+    from .metrics import token_checks
+
+    token_checks.inc(outcome=outcome)
+    return outcome
+
+
+def user_from_claims(claims: dict[str, Any]) -> User:
+    # transient (detached) User, like session_cache's snapshots
+    return User(
+        id=int(claims["sub"]),
+        username=claims.get("username"),
+        is_admin=bool(claims.get("adm")),
+        locked=False,
+        must_change_password=bool(claims.get("mcp")),
+        email_verified=bool(claims.get("ev", True)),
+    )
+
+
+def revoke_session(r, sid: str | None) -> None:
+    if r is None or not sid:
+        return
+    try:
+        r.set(DENY_KEY.format(sid=sid), 1, ex=ACCESS_TOKEN_TTL_SECONDS + 1)
+    except Exception:
+        pass
+
+
+def revoke_user(r, user_id: int) -> None:
+    """Make every token issued to the user so far go back to the sessions table."""
+    if r is None or not enabled():
+        return
+    try:
+        r.set(REVOKED_KEY.format(uid=int(user_id)), now_s(), ex=ACCESS_TOKEN_TTL_SECONDS + 1)
+    except Exception:
+        pass
+
+
+def set_refreshed(token: str, max_age: int) -> None:
+    pending = _pending.get()
+    if pending is not None:
+        pending.append((token, int(max_age)))
+
+
+class TokenCookieMiddleware:
+    """Pure ASGI middleware adding the Set-Cookie for a token renewed during the request."""
+
+    def __init__(self, app, cookie: str):
+        self.app = app
+        self.cookie = cookie
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+
+        pending: list = []
+        token = _pending.set(pending)
+
+        async def _send(message):
+            if message["type"] == "http.response.start" and pending:
+                message = {**message, "headers": [*message.get("headers", []), self._header(*pending[-1])]}
+            await send(message)
+
+        try:
+            await self.app(scope, receive, _send)
+        finally:
+            _pending.reset(token)
+
+    def _header(self, value: str, max_age: int) -> tuple[bytes, bytes]:
+        # same attributes as the login cookie
+        c: SimpleCookie = SimpleCookie()
+        c[self.cookie] = value
+        c[self.cookie]["max-age"] = max_age
+        c[self.cookie]["path"] = "/"
+        c[self.cookie]["httponly"] = True
+        c[self.cookie]["samesite"] = "lax"
+        return b"set-cookie", c.output(header="").strip().encode("latin-1")
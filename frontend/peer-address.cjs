@@ -0,0 +1,18 @@
+// Preloaded by the Docker image (node -r ./peer-address.cjs server.js).
+// Appends the TCP peer address to X-Forwarded-For before Next.js handles the
+// request. Route handlers have no access to the socket, and Next only fills
+// the header in when the client did not send one, so otherwise a browser could
+// pick the "client IP" the API rate-limits logins by (TRUSTED_PROXY_HOPS=1).
+const http = require("http");
+
+const createServer = http.createServer;
+http.createServer = function (...args) {
+  const server = createServer.apply(this, args);
+  server.prependListener("request", (req) => {
+    const peer = req.socket && req.socket.remoteAddress;
+    if (!peer) return;
+    const prior = req.headers["x-forwarded-for"];
+    req.headers["x-forwarded-for"] = prior ? `${prior}, ${peer}` : peer;
+  });
+  return server;
+};
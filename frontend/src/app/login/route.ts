@@ -6,9 +6,13 @@ export async function POST(req: Request) {
   const username = String(form.get("username") || "");
   const password = String(form.get("password") || "");
 
+  // Forward the client address so the API can rate-limit failed logins per IP.
+  // The last hop is the browser's address, appended by peer-address.cjs; any
+  // earlier entries come from the client and are not trusted by the API.
+  const xff = req.headers.get("x-forwarded-for") || "";
   const r = await fetch(`${base}/api/login`, {
     method: "POST",
-    headers: { "Content-Type": "application/json" },
+    headers: { "Content-Type": "application/json", ...(xff ? { "x-forwarded-for": xff } : {}) },
     body: JSON.stringify({ username, password }),
   });
 
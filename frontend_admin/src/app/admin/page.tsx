@@ -16,10 +16,12 @@ async function apiFetch(path: string, init?: RequestInit) {
   return r;
 }
 
+const PAGE_SIZE = 50;
+
 export default async function AdminPage({
   searchParams,
 }: {
-  searchParams: Promise<{ sent_code?: string }>;
+  searchParams: Promise<{ sent_code?: string; q?: string; cursor?: string }>;
 }) {
   const meR = await apiFetch("/api/me");
   if (meR.status !== 200) {
@@ -47,11 +49,22 @@ export default async function AdminPage({
   const sp = await searchParams;
   const sentCode = (sp.sent_code || "").trim();
 
-  const reqR = await apiFetch("/api/admin/signup_requests?status=pending");
+  const q = (sp.q || "").trim();
+  const cursor = (sp.cursor || "").trim();
+
+  const reqR = await apiFetch(`/api/admin/signup_requests?status=pending&limit=${PAGE_SIZE}`);
   const requests = (await reqR.json()) as Array<{ id: number; username: string; email: string; status: string; created_at: number }>;
+  const moreRequests = Boolean(reqR.headers.get("x-next-cursor"));
 
-  const usersR = await apiFetch("/api/admin/users");
+  const usersQs = new URLSearchParams({ limit: String(PAGE_SIZE) });
+  if (q) usersQs.set("q", q);
+  if (cursor) usersQs.set("cursor", cursor);
+  const usersR = await apiFetch(`/api/admin/users?${usersQs}`);
   const users = (await usersR.json()) as Array<{ id: number; username: string; email?: string | null; locked: boolean; is_admin: boolean; failed_login_count: number }>;
+  const nextCursor = usersR.headers.get("x-next-cursor") || "";
+  const totalEstimate = usersR.headers.get("x-total-estimate");
+  const nextQs = new URLSearchParams({ cursor: nextCursor });
+  if (q) nextQs.set("q", q);
 
   return (
     <div className="wrap">
@@ -97,8 +110,16 @@ export default async function AdminPage({
         ) : (
           <div className="meta">No pending requests.</div>
         )}
+        {moreRequests ? <div className="meta">Showing the newest {PAGE_SIZE} pending requests.</div> : null}
 
-        <h2 style={{ margin: "18px 0 8px", fontSize: 16 }}>Users</h2>
+        <h2 style={{ margin: "18px 0 8px", fontSize: 16 }}>
+          Users{totalEstimate ? <span className="meta"> · ~{totalEstimate}</span> : null}
+        </h2>
+        <form method="get" action="/admin" style={{ display: "flex", gap: 8, marginBottom: 8 }}>
+          <input name="q" defaultValue={q} placeholder="Search username or email" />
+          <button className="btn-small btn-ghost" type="submit">Search</button>
+          {q || cursor ? <a href="/admin">Reset</a> : null}
+        </form>
         <ul>
           {users.map((u) => (
             <li key={u.id}>
@@ -119,6 +140,11 @@ export default async function AdminPage({
             </li>
           ))}
         </ul>
+        {nextCursor ? (
+          <div style={{ marginTop: 8 }}>
+            <a href={`/admin?${nextQs}`}>Next page</a>
+          </div>
+        ) : null}
       </div>
     </div>
   );
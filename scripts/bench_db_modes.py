@@ -0,0 +1,126 @@
+#!/usr/bin/env python3
+"""Compare API throughput between DB_MODE=sync and DB_MODE=async.
+
+Start two API instances against the same Postgres/Redis, e.g.
+
+    DB_MODE=sync  uvicorn app.main:app --port 8001
+    DB_MODE=async uvicorn app.main:app --port 8002
+
+then run
+
+    python scripts/bench_db_modes.py --sync http://127.0.0.1:8001 --async http://127.0.0.1:8002
+
+Each target is hit with CONCURRENCY in-flight GET /api/todos requests (logged in
+as USERNAME) for DURATION seconds; requests/s and latency percentiles are printed
+side by side. Stdlib only so it runs anywhere the smoke scripts do.
+"""
+from __future__ import annotations
+
+import argparse
+import http.client
+import json
+import threading
+import time
+import urllib.parse
+
+
+def _login(base: str, username: str, password: str) -> str:
+    u = urllib.parse.urlsplit(base)
+    c = http.client.HTTPConnection(u.hostname, u.port or 80, timeout=30)
+    c.request(
+        "POST",
+        "/api/login",
+        body=json.dumps({"username": username, "password": password}),
+        headers={"Content-Type": "application/json"},
+    )
+    resp = c.getresponse()
+    resp.read()
+    if resp.status != 200:
+        raise SystemExit(f"login against {base} failed: http {resp.status}")
+    cookie = resp.getheader("set-cookie") or ""
+    return cookie.split(";", 1)[0]
+
+
+def _pct(xs: list[float], p: float) -> float:
+    if not xs:
+        return 0.0
+    return xs[min(len(xs) - 1, int(len(xs) * p))]
+
+
+def run(base: str, path: str, cookie: str, concurrency: int, duration: float) -> dict:
+    u = urllib.parse.urlsplit(base)
+    lat: list[float] = []
+    errors = [0]
+    lock = threading.Lock()
+    deadline = time.perf_counter() + duration
+
+    def worker():
+        c = http.client.HTTPConnection(u.hostname, u.port or 80, timeout=30)
+        mine: list[float] = []
+        errs = 0
+        while time.perf_counter() < deadline:
+            t0 = time.perf_counter()
+            try:
+                c.request("GET", path, headers={"Cookie": cookie})
+                resp = c.getresponse()
+                resp.read()
+                if resp.status != 200:
+                    errs += 1
+            except Exception:
+                errs += 1
+                c.close()
+                c = http.client.HTTPConnection(u.hostname, u.port or 80, timeout=30)
+                continue
+            mine.append(time.perf_counter() - t0)
+        with lock:
+            lat.extend(mine)
+            errors[0] += errs
+
+    threads = [threading.Thread(target=worker) for _ in range(concurrency)]
+    t0 = time.perf_counter()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    elapsed = time.perf_counter() - t0
+
+    lat.sort()
+    return {
+        "requests": len(lat),
+        "errors": errors[0],
+        "rps": round(len(lat) / elapsed, 1),
+        "p50_ms": round(_pct(lat, 0.50) * 1000, 2),
+        "p95_ms": round(_pct(lat, 0.95) * 1000, 2),
+        "p99_ms": round(_pct(lat, 0.99) * 1000, 2),
+    }
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--sync", dest="sync_base", default="http://127.0.0.1:8001")
+    ap.add_argument("--async", dest="async_base", default="http://127.0.0.1:8002")
+    ap.add_argument("--path", default="/api/todos")
+    ap.add_argument("--username", default="admin")
+    ap.add_argument("--password", default="Admin1234")
+    ap.add_argument("--concurrency", type=int, nargs="+", default=[16, 64, 256])
+    ap.add_argument("--duration", type=float, default=10.0)
+    args = ap.parse_args()
+
+    cookies = {
+        "sync": _login(args.sync_base, args.username, args.password),
+        "async": _login(args.async_base, args.username, args.password),
+    }
+    bases = {"sync": args.sync_base, "async": args.async_base}
+
+    print(f"{'mode':<6} {'conc':>5} {'rps':>9} {'p50ms':>8} {'p95ms':>8} {'p99ms':>8} {'errors':>7}")
+    for conc in args.concurrency:
+        for mode in ("sync", "async"):
+            res = run(bases[mode], args.path, cookies[mode], conc, args.duration)
+            print(
+                f"{mode:<6} {conc:>5} {res['rps']:>9} {res['p50_ms']:>8} {res['p95_ms']:>8} "
+                f"{res['p99_ms']:>8} {res['errors']:>7}"
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,69 @@
+#!/usr/bin/env python3
+"""Per-row cost of the list-endpoint serialization paths (no DB needed).
+
+    cd backend && python ../scripts/bench_serialization.py --rows 10000
+
+"model" is the old path: one TodoOut per row, FastAPI's response_model
+re-validation and JSON-mode dump, then the stdlib encoder (as JSONResponse).
+"fast" is fast_json.rows_to_json over column tuples. ORM row materialization,
+which the old path also paid for, is not included.
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "backend"))
+
+from pydantic import TypeAdapter  # noqa: E402
+
+from app import fast_json  # noqa: E402
+from app.schemas import TodoOut  # noqa: E402
+from app.todo_queries import TODO_FIELDS  # noqa: E402
+
+
+def _rows(n: int) -> list[tuple]:
+    prios = ("High", "Medium", "Low")
+    return [(i, f"todo item number {i}", i % 3 == 0, prios[i % 3], 1_700_000_000 + i) for i in range(n, 0, -1)]
+
+
+def model_path(rows: list[tuple]) -> bytes:
+    out = [TodoOut(id=r[0], title=r[1], done=bool(r[2]), priority=str(r[3]), created_at=int(r[4])) for r in rows]
+    adapter = TypeAdapter(list[TodoOut])
+    content = adapter.dump_python(adapter.validate_python(out), mode="json")
+    return json.dumps(content, ensure_ascii=False, allow_nan=False, indent=None, separators=(",", ":")).encode("utf-8")
+
+
+def fast_path(rows: list[tuple]) -> bytes:
+    return fast_json.rows_to_json(TODO_FIELDS, rows)
+
+
+def _time(fn, rows, repeat: int) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        fn(rows)
+        best = min(best, time.perf_counter() - t0)
+    return best
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--rows", type=int, default=10000)
+    ap.add_argument("--repeat", type=int, default=5)
+    args = ap.parse_args()
+
+    rows = _rows(args.rows)
+    assert json.loads(model_path(rows)) == json.loads(fast_path(rows))
+    encoder = "orjson" if fast_json.orjson is not None else "stdlib json"
+    for name, fn in (("model", model_path), ("fast", fast_path)):
+        t = _time(fn, rows, args.repeat)
+        print(f"{name:<6} {t * 1000:8.2f} ms total  {t / args.rows * 1e6:6.2f} us/row")
+    print(f"(fast path encoder: {encoder})")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,52 @@
+#!/usr/bin/env python3
+"""Convert `todos` to a table hash-partitioned on user_id, online.
+
+    cd backend
+    DATABASE_URL=... python ../scripts/partition_todos.py --partitions 16
+
+The API can keep serving while this runs: changes are mirrored into the new
+table by a trigger while existing rows are copied in batches, then the tables
+are swapped under a short lock (see app/todo_partitions.py). Re-running after
+an interruption resumes the copy. The old heap is kept as todos_unpartitioned;
+drop it with --drop-old once satisfied.
+"""
+from __future__ import annotations
+
+import argparse
+import logging
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "backend"))
+
+from sqlalchemy import create_engine  # noqa: E402
+
+from app import migrations, todo_partitions  # noqa: E402
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--partitions", type=int, default=16, help="hash partitions (fixed once created)")
+    ap.add_argument("--batch", type=int, default=5000, help="rows copied per transaction")
+    ap.add_argument("--pause", type=float, default=0.0, help="seconds to sleep between batches")
+    ap.add_argument("--drop-old", action="store_true", help="drop todos_unpartitioned and exit")
+    args = ap.parse_args()
+
+    url = os.environ.get("DATABASE_URL")
+    if not url:
+        raise SystemExit("DATABASE_URL is required")
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(message)s")
+    engine = create_engine(url)
+
+    if args.drop_old:
+        todo_partitions.drop_unpartitioned(engine)
+        print("dropped todos_unpartitioned")
+        return
+
+    migrations.migrate(engine)
+    todo_partitions.partition_todos(engine, args.partitions, args.batch, args.pause)
+    print("todos is hash-partitioned on user_id")
+
+
+if __name__ == "__main__":
+    main()
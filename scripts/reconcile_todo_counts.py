@@ -0,0 +1,39 @@
+#!/usr/bin/env python3
+"""Recompute the per-user todo_counts counters and repair any drift.
+
+    cd backend
+    DATABASE_URL=... python ../scripts/reconcile_todo_counts.py
+
+The API runs the same job in the background every
+TODO_COUNTS_RECONCILE_INTERVAL_SECONDS (see app/todo_stats.py); use this after
+bulk maintenance done with the counter triggers disabled.
+"""
+from __future__ import annotations
+
+import argparse
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "backend"))
+
+from sqlalchemy import create_engine  # noqa: E402
+
+from app import migrations, todo_stats  # noqa: E402
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--batch", type=int, default=todo_stats.TODO_COUNTS_RECONCILE_BATCH, help="users per transaction")
+    args = ap.parse_args()
+
+    url = os.environ.get("DATABASE_URL")
+    if not url:
+        raise SystemExit("DATABASE_URL is required")
+    engine = create_engine(url)
+    migrations.migrate(engine)
+    n = todo_stats.reconcile(engine, args.batch)
+    print(f"repaired {n} drifted buckets" if n else "todo_counts is consistent")
+
+
+if __name__ == "__main__":
+    main()